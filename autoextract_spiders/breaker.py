@@ -0,0 +1,314 @@
+import time
+import random
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from scrapy import signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from scrapy.utils.response import response_status_message
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_REQUESTS = 10
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_SLOW = 30.0
+DEFAULT_OPEN_TIME = 60.0
+DEFAULT_MAX_OPEN_TIME = 1800.0
+DEFAULT_RETRY_DELAY = 5.0
+DEFAULT_MAX_RETRY_DELAY = 300.0
+DEFAULT_API_RETRY_DELAY = 10.0
+DEFAULT_API_RETRY_TIMES = 5
+# A probe without a result after this time (eg: the AutoExtract timeout is 660s) is replaced
+DEFAULT_PROBE_TIMEOUT = 900.0
+# The requests of a host waiting for the result of its probe
+PROBE_WAIT = 5.0
+
+# Errors of the AutoExtract API itself, not of the extracted website
+API_ERROR_CODES = {429, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+class DelayQueue:
+    """
+    The requests waiting to be crawled again later; they don't take a download slot meanwhile.
+    """
+
+    def __init__(self, crawler, clock=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.crawler = crawler
+        self.clock = clock
+        self._calls = set()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def schedule(self, request, delay: float):
+        request.dont_filter = True
+        call = self.clock.callLater(delay, self._release, request)
+        self._calls.add(call)
+        request.meta['_delay_call'] = call
+
+    def _release(self, request):
+        self._calls.discard(request.meta.pop('_delay_call', None))
+        engine = self.crawler.engine
+        if engine and engine.spider:
+            engine.crawl(request, engine.spider)
+
+    def cancel(self):
+        for call in self._calls:
+            if call.active():
+                call.cancel()
+        self._calls.clear()
+
+
+class HostHealth:
+    """
+    The recent outcomes of the requests of a host, and the state of its circuit breaker:
+    closed (open_until is 0), open (until open_until), or half-open (after open_until, one probe at a time).
+    """
+    __slots__ = ('outcomes', 'latency', 'open_until', 'open_time', 'probing', 'probe_sent')
+
+    def __init__(self, window: int, open_time: float):
+        self.outcomes = deque(maxlen=window)
+        self.latency = 0.0
+        self.open_until = 0.0
+        self.open_time = open_time
+        self.probing = False
+        self.probe_sent = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class CircuitBreakerMiddleware(RetryMiddleware):
+    """
+    Replaces the Scrapy RetryMiddleware, to keep the failing, or very slow hosts
+    from taking the download slots, and to wait before retrying.
+
+    The health of each website host is tracked over its last HOST_BREAKER_WINDOW requests:
+    the errors (5xx, 429, connection errors, timeouts, and the AutoExtract results with a download error)
+    and the responses slower than HOST_BREAKER_SLOW seconds count as failures.
+    When the share of failures reaches HOST_BREAKER_ERROR_RATE, the breaker of the host opens:
+    its pending requests are put aside for HOST_BREAKER_OPEN_TIME seconds, then one probe request is sent;
+    if it succeeds the host is crawled again, otherwise the pause doubles, up to HOST_BREAKER_MAX_OPEN_TIME.
+    A probe without an outcome for the website (eg: an AutoExtract API error, or a dropped request)
+    is replaced by the next request, and so is a probe without any result after HOST_BREAKER_PROBE_TIMEOUT seconds.
+
+    The retries are delayed, in a timer queue that doesn't hold any download slot: RETRY_DELAY seconds
+    for the website errors, doubled after each retry. The errors of the AutoExtract API itself
+    (429 and 5xx) don't count for the health of the website; they are retried AUTOEXTRACT_RETRY_TIMES times,
+    after AUTOEXTRACT_RETRY_DELAY seconds, doubled after each retry.
+
+    The decisions are in the "breaker/" and "retry/" stats.
+    Without HOST_BREAKER_ENABLED, it's the usual RetryMiddleware.
+    """
+
+    def __init__(self, crawler, clock=None):
+        settings = crawler.settings
+        super().__init__(settings)
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.enabled = settings.getbool('HOST_BREAKER_ENABLED')
+        self.window = settings.getint('HOST_BREAKER_WINDOW', DEFAULT_WINDOW)
+        self.min_requests = settings.getint('HOST_BREAKER_MIN_REQUESTS', DEFAULT_MIN_REQUESTS)
+        self.error_rate = settings.getfloat('HOST_BREAKER_ERROR_RATE', DEFAULT_ERROR_RATE)
+        self.slow = settings.getfloat('HOST_BREAKER_SLOW', DEFAULT_SLOW)
+        self.open_time = settings.getfloat('HOST_BREAKER_OPEN_TIME', DEFAULT_OPEN_TIME)
+        self.max_open_time = settings.getfloat('HOST_BREAKER_MAX_OPEN_TIME', DEFAULT_MAX_OPEN_TIME)
+        self.probe_timeout = settings.getfloat('HOST_BREAKER_PROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)
+        self.retry_delay = settings.getfloat('RETRY_DELAY', DEFAULT_RETRY_DELAY)
+        self.api_retry_delay = settings.getfloat('AUTOEXTRACT_RETRY_DELAY', DEFAULT_API_RETRY_DELAY)
+        self.api_retry_times = settings.getint('AUTOEXTRACT_RETRY_TIMES', DEFAULT_API_RETRY_TIMES)
+        self.hosts = {}
+        self.delayed = DelayQueue(crawler, clock)
+        self._time = clock.seconds if clock else time.time
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_idle(self, spider):
+        # The delayed requests are not in the scheduler
+        if len(self.delayed):
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        if len(self.delayed):
+            self.stats.set_value('retry/delayed_cancelled', len(self.delayed))
+        self.delayed.cancel()
+
+    def process_request(self, request, spider):
+        if not self.enabled:
+            return None
+        host = self._host(request)
+        # A retry of the probe is not the probe anymore
+        request.meta.pop('breaker_probe', None)
+        wait = self._wait(host, request)
+        if wait > 0:
+            self.stats.inc_value('breaker/paused_requests')
+            self.delayed.schedule(request, wait + random.uniform(0, 1))
+            # It never reaches a download slot, so the downloader doesn't send this signal
+            # (eg: the seed feeder counts the requests of the active hosts until they leave the downloader)
+            self.crawler.signals.send_catch_log(signal=signals.request_left_downloader,
+                                                request=request, spider=spider)
+            raise IgnoreRequest(f'Host {host} paused by the circuit breaker')
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self.enabled:
+            return super().process_response(request, response, spider)
+        if request.meta.get(AUTOEXTRACT_META_KEY):
+            if response.status in API_ERROR_CODES:
+                self.stats.inc_value(f'retry/autoextract/{response.status}')
+                self._release_probe(request)
+                self._retry_later(request, response_status_message(response.status), spider, api=True)
+                return response
+            if response.status == 200:
+                self._record(request, not self._has_download_error(response))
+            else:
+                self._release_probe(request)
+            return response
+        failed = response.status >= 500 or response.status in self.retry_http_codes
+        self._record(request, not failed)
+        if failed and not request.meta.get('dont_retry', False):
+            self._retry_later(request, response_status_message(response.status), spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not self.enabled:
+            return super().process_exception(request, exception, spider)
+        if not isinstance(exception, self.EXCEPTIONS_TO_RETRY):
+            # eg: dropped by the next middlewares
+            self._release_probe(request)
+            return None
+        api = bool(request.meta.get(AUTOEXTRACT_META_KEY))
+        if api:
+            self._release_probe(request)
+        else:
+            self._record(request, False)
+        if not request.meta.get('dont_retry', False):
+            self._retry_later(request, exception, spider, api=api)
+        return None
+
+    def _retry_later(self, request, reason, spider, api=False):
+        """
+        Put the retry request in the delay queue, and drop the failed one.
+        """
+        if api:
+            retry_request = get_retry_request(request, spider=spider, reason=reason,
+                                              max_retry_times=self.api_retry_times,
+                                              stats_base_key='retry/autoextract')
+            delay = self.api_retry_delay
+        else:
+            retry_request = get_retry_request(request, spider=spider, reason=reason)
+            delay = self.retry_delay
+        if retry_request is None:
+            return
+        delay = min(delay * 2 ** (retry_request.meta['retry_times'] - 1), DEFAULT_MAX_RETRY_DELAY)
+        self.delayed.schedule(retry_request, delay * random.uniform(0.8, 1.2))
+        self.stats.inc_value('retry/delayed')
+        raise IgnoreRequest(f'Retry delayed by {delay:.0f}s: {reason}')
+
+    @staticmethod
+    def _host(request) -> str:
+        autoextract = request.meta.get(AUTOEXTRACT_META_KEY)
+        url = autoextract['original_url'] if autoextract else request.url
+        return urlsplit(url).netloc.lower()
+
+    @staticmethod
+    def _has_download_error(response) -> bool:
+        """
+        AutoExtract couldn't download the page from the website.
+        """
+        if b'"error"' not in response.body:
+            return False
+        try:
+            result = json.loads(response.body)[0]
+        except (ValueError, IndexError, KeyError, TypeError):
+            return False
+        return bool(isinstance(result, dict) and result.get('error'))
+
+    def _wait(self, host: str, request) -> float:
+        """
+        How long the requests of the host must wait; 0 if the request can be sent.
+        """
+        health = self.hosts.get(host)
+        if health is None or not health.open_until:
+            return 0.0
+        now = self._time()
+        if now < health.open_until:
+            return health.open_until - now
+        if health.probing:
+            if now - health.probe_sent < self.probe_timeout:
+                return PROBE_WAIT
+            self.stats.inc_value('breaker/probes_timed_out')
+        # Half-open: one request checks if the host is back
+        health.probing = True
+        health.probe_sent = now
+        request.meta['breaker_probe'] = now
+        self.stats.inc_value('breaker/probes')
+        return 0.0
+
+    def _release_probe(self, request):
+        """
+        The probe finished without an outcome for the website: the next request of the host is the probe.
+        """
+        sent = request.meta.pop('breaker_probe', None)
+        if sent is None:
+            return
+        health = self.hosts.get(self._host(request))
+        # Unless the probe was already replaced
+        if health is not None and health.probing and health.probe_sent == sent:
+            health.probing = False
+            self.stats.inc_value('breaker/probes_released')
+
+    def _record(self, request, ok: bool):
+        host = self._host(request)
+        health = self.hosts.get(host)
+        if health is None:
+            health = self.hosts[host] = HostHealth(self.window, self.open_time)
+        latency = request.meta.get('download_latency') or 0.0
+        health.latency = 0.8 * health.latency + 0.2 * latency if health.latency else latency
+        if ok and latency > self.slow:
+            ok = False
+            self.stats.inc_value('breaker/slow_responses')
+        if health.probing:
+            self._probed(host, health, ok)
+            return
+        health.outcomes.append(ok)
+        if not ok and not health.open_until and len(health.outcomes) >= self.min_requests \
+                and health.error_rate >= self.error_rate:
+            self._open(host, health)
+
+    def _probed(self, host: str, health: HostHealth, ok: bool):
+        health.probing = False
+        if ok:
+            logger.info('Host %s is back, after %.0fs', host, health.open_time)
+            health.open_until = 0.0
+            health.open_time = self.open_time
+            health.outcomes.clear()
+            self.stats.inc_value('breaker/closed')
+            self.stats.inc_value('breaker/open_hosts', -1)
+        else:
+            health.open_time = min(health.open_time * 2, self.max_open_time)
+            health.open_until = self._time() + health.open_time
+            self.stats.inc_value('breaker/reopened')
+
+    def _open(self, host: str, health: HostHealth):
+        logger.info('Pausing host %s for %.0fs: %.0f%% errors, latency %.1fs',
+                    host, health.open_time, 100 * health.error_rate, health.latency)
+        health.open_until = self._time() + health.open_time
+        self.stats.inc_value('breaker/opened')
+        self.stats.inc_value('breaker/open_hosts')
@@ -0,0 +1,276 @@
+import os
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy_count_filter.middleware import GlobalCountFilterMiddleware, HostsCountFilterMiddleware
+from twisted.internet import task
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60.0
+# The journal is compacted when it's larger than the state, and at least this size
+DEFAULT_COMPACT_SIZE = 1048576
+
+STATE_FILE = 'state.json'
+JOURNAL_FILE = 'journal.jl'
+
+
+class TrackedDict(dict):
+    """
+    Dict that remembers the keys changed since the last checkpoint, so only the changes are saved.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+
+    def __setitem__(self, key, value):
+        self.changed.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.changed.add(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.changed.add(key)
+        return super().pop(key, *default)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def changes(self) -> dict:
+        """
+        The values changed since the last call; None for the removed keys.
+        """
+        changes = {key: self.get(key) for key in self.changed}
+        self.changed.clear()
+        return changes
+
+
+class TrackedCounter(TrackedDict):
+    """
+    TrackedDict with 0 for the missing keys, like a defaultdict(int).
+    """
+
+    def __missing__(self, key):
+        return 0
+
+
+def merge_changes(state: dict, changes: dict) -> dict:
+    """
+    Apply the changes of a journal entry to the state: the dicts are merged, None removes a key.
+    """
+    for key, value in changes.items():
+        if value is None:
+            state.pop(key, None)
+        elif isinstance(value, dict) and isinstance(state.get(key), dict):
+            merge_changes(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+
+class Checkpoint:
+    """
+    Extension that saves the crawl state periodically in a local directory,
+    so a job that died can be resumed without re-crawling and re-extracting the same pages.
+
+    The saved state contains:
+    * the page and item counters behind the "count-limits" option, global and per host
+    * the spider state: the seeds not finished yet, the feed URLs discovered for each seed
+    * the deduplication fingerprints, only with JOBDIR, where the DupeFilter writes them
+        together with the queued requests (without the queue, the queued requests would be
+        seen as duplicates after a resume, and dropped)
+
+    The full state is written once, then each checkpoint appends only what changed since the
+    previous one (eg: the counters of the hosts crawled meanwhile) to a journal. The journal is
+    compacted into the full state when it's larger than the state, and when the spider is closed.
+    Start the new job with the same CHECKPOINT_DIR to resume.
+
+    Settings:
+    * CHECKPOINT_DIR: the directory; the extension is disabled if it's not set
+    * CHECKPOINT_INTERVAL: how often (in seconds) to save the state; default: 60
+    * CHECKPOINT_COMPACT_SIZE: the minimum journal size (in bytes) to compact it; default: 1 MB
+    """
+
+    def __init__(self, crawler, path, interval, compact_size=DEFAULT_COMPACT_SIZE):
+        self.crawler = crawler
+        self.path = path
+        self.interval = interval
+        self.compact_size = compact_size
+        # Each compaction starts a new generation; the journal entries of the older ones are ignored
+        self.generation = 0
+        self.state_size = 0
+        self.journal_size = 0
+        self._global_counts = {}
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('CHECKPOINT_DIR')
+        if not path:
+            raise NotConfigured
+        os.makedirs(path, exist_ok=True)
+        o = cls(crawler, path, crawler.settings.getfloat('CHECKPOINT_INTERVAL', DEFAULT_INTERVAL),
+                crawler.settings.getint('CHECKPOINT_COMPACT_SIZE', DEFAULT_COMPACT_SIZE))
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        self.restore(spider)
+        self._loop = task.LoopingCall(self.save, spider)
+        self._loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self._loop and self._loop.running:
+            self._loop.stop()
+        self.compact(spider)
+
+    def restore(self, spider):
+        state = self._load()
+        if state:
+            counters = state.get('counters', {})
+            for mw in self._count_middlewares():
+                if isinstance(mw, GlobalCountFilterMiddleware):
+                    mw.counter.update(counters.get('global', {}))
+                else:
+                    for name, counter in (('page_host', mw.page_host_counter), ('item_host', mw.item_host_counter)):
+                        self._restore_counter(counter, counters.get(name), counters.get(f'{name}_sketch'))
+            if state.get('spider') and hasattr(spider, 'restore_checkpoint_state'):
+                spider.restore_checkpoint_state(state['spider'])
+            logger.info('Resumed the crawl state from %s', self.path, extra={'spider': spider})
+            self.crawler.stats.inc_value('checkpoint/restored')
+        # The restored state is the base of the new journal
+        self.compact(spider)
+
+    def save(self, spider):
+        """
+        Append the changes since the last checkpoint to the journal.
+        """
+        changes = self._changes(spider)
+        if changes:
+            changes['generation'] = self.generation
+            line = json.dumps(changes) + '\n'
+            with open(os.path.join(self.path, JOURNAL_FILE), 'a') as fd:
+                fd.write(line)
+            self.journal_size += len(line)
+        # The fingerprints are appended to the file, but only flushed when the buffer is full
+        dupefilter = getattr(getattr(self.crawler.engine, 'slot', None), 'scheduler', None)
+        dupefilter = getattr(dupefilter, 'df', None)
+        if getattr(dupefilter, 'file', None) and not dupefilter.file.closed:
+            dupefilter.file.flush()
+        self.crawler.stats.inc_value('checkpoint/saved')
+        if self.journal_size > max(self.state_size, self.compact_size):
+            self.compact(spider)
+
+    def compact(self, spider):
+        """
+        Write the full state, and start a new journal.
+        """
+        # The changes are already in the full state
+        self._changes(spider)
+        self.generation += 1
+        state = {'generation': self.generation, 'counters': self._counters()}
+        if hasattr(spider, 'get_checkpoint_state'):
+            state['spider'] = spider.get_checkpoint_state()
+        text = json.dumps(state)
+        fname = os.path.join(self.path, STATE_FILE)
+        with open(fname + '.tmp', 'w') as fd:
+            fd.write(text)
+        os.replace(fname + '.tmp', fname)
+        # The journal entries of the previous generation would be ignored anyway
+        open(os.path.join(self.path, JOURNAL_FILE), 'w').close()
+        self.state_size = len(text)
+        self.journal_size = 0
+        self.crawler.stats.inc_value('checkpoint/compacted')
+
+    def _counters(self) -> dict:
+        counters = {}
+        for mw in self._count_middlewares():
+            if isinstance(mw, GlobalCountFilterMiddleware):
+                counters['global'] = dict(mw.counter)
+            else:
+                for name, counter in (('page_host', mw.page_host_counter), ('item_host', mw.item_host_counter)):
+                    if hasattr(counter, 'get_state'):
+                        # The approximate counters: the sketch has the counts of all the hosts
+                        counters[f'{name}_sketch'] = counter.get_state()
+                    else:
+                        counters[name] = dict(counter)
+        return counters
+
+    @staticmethod
+    def _restore_counter(counter, counts: dict, sketch: dict):
+        if sketch:
+            if hasattr(counter, 'set_state'):
+                counter.set_state(sketch)
+            else:
+                # Saved with COUNT_FILTER_MAX_HOSTS, resumed without
+                counter.update(dict(sketch.get('top') or {}, **(sketch.get('changed') or {})))
+        if counts:
+            counter.update(counts)
+
+    def _changes(self, spider) -> dict:
+        counters = {}
+        for mw in self._count_middlewares():
+            if isinstance(mw, GlobalCountFilterMiddleware):
+                # Only a few global counters
+                changed = {k: v for k, v in mw.counter.items() if self._global_counts.get(k) != v}
+                if changed:
+                    counters['global'] = changed
+                    self._global_counts.update(changed)
+                continue
+            for name, counter in (('page_host', mw.page_host_counter), ('item_host', mw.item_host_counter)):
+                # All the counters, if they don't track their changes
+                changed = counter.changes() if hasattr(counter, 'changes') else dict(counter)
+                if changed:
+                    counters[f'{name}_sketch' if hasattr(counter, 'get_state') else name] = changed
+        changes = {'counters': counters} if counters else {}
+        if hasattr(spider, 'get_checkpoint_changes'):
+            spider_changes = spider.get_checkpoint_changes()
+            if spider_changes:
+                changes['spider'] = spider_changes
+        return changes
+
+    def _count_middlewares(self):
+        engine = self.crawler.engine
+        if not engine:
+            return []
+        return [mw for mw in engine.downloader.middleware.middlewares
+                if isinstance(mw, (GlobalCountFilterMiddleware, HostsCountFilterMiddleware))]
+
+    def _load(self):
+        """
+        The full state, with the changes of the journal.
+        """
+        fname = os.path.join(self.path, STATE_FILE)
+        if not os.path.isfile(fname):
+            return None
+        with open(fname) as fd:
+            try:
+                state = json.load(fd)
+            except ValueError as err:
+                logger.warning('Invalid checkpoint file %s: %s', fname, err)
+                return None
+        self.generation = state.pop('generation', 0)
+        fname = os.path.join(self.path, JOURNAL_FILE)
+        if os.path.isfile(fname):
+            with open(fname) as fd:
+                for line in fd:
+                    try:
+                        changes = json.loads(line)
+                    except ValueError:
+                        # The last line can be incomplete, if the job was killed while writing it
+                        logger.warning('Invalid checkpoint journal entry in %s', fname)
+                        break
+                    if changes.pop('generation', None) == self.generation:
+                        merge_changes(state, changes)
+        return state
@@ -0,0 +1,236 @@
+import zlib
+import heapq
+import math
+import base64
+import hashlib
+import logging
+from array import array
+from typing import Dict, Iterator, List, Mapping, Tuple
+
+from scrapy_count_filter.middleware import HostsCountFilterMiddleware as _HostsCountFilterMiddleware
+
+from .checkpoint import TrackedCounter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ERROR = 0.00001
+DEFAULT_CONFIDENCE = 0.99
+
+
+class CountMinSketch:
+    """
+    Approximate counters for any number of keys, in a fixed amount of memory.
+
+    The counts are never under-estimated; with the probability "confidence",
+    a count is over-estimated by at most "error" x the total of all the counts.
+    The memory is: 4 bytes x e / error x ln(1 / (1 - confidence)).
+    """
+
+    def __init__(self, error: float = DEFAULT_ERROR, confidence: float = DEFAULT_CONFIDENCE):
+        if not 0 < error < 1 or not 0 < confidence < 1:
+            raise ValueError(f'Invalid count-min sketch error {error}, or confidence {confidence}')
+        self.error = error
+        self.confidence = confidence
+        self.width = int(math.ceil(math.e / error))
+        self.depth = int(math.ceil(math.log(1 / (1 - confidence))))
+        # The rows, one after the other
+        self.table = array('I', bytes(4 * self.width * self.depth))
+        self._rows = [(row, row * self.width) for row in range(self.depth)]
+        self.total = 0
+
+    @property
+    def memory(self) -> int:
+        return 4 * self.width * self.depth
+
+    def _cells(self, key: str) -> List[int]:
+        # Double hashing: one cell in each row, from one hash;
+        # not hash(), it changes in each process and the sketch is saved by the checkpoints
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        width = self.width
+        return [offset + (h1 + row * h2) % width for row, offset in self._rows]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """
+        Add the count to the key and return its new estimate.
+        Only the smallest counters are increased (conservative update), to reduce the error.
+        """
+        self.total += count
+        table = self.table
+        cells = self._cells(key)
+        values = [table[cell] for cell in cells]
+        estimate = min(values) + count
+        for cell, value in zip(cells, values):
+            if value < estimate:
+                table[cell] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        table = self.table
+        return min([table[cell] for cell in self._cells(key)])
+
+    def get_state(self) -> dict:
+        return {'error': self.error, 'confidence': self.confidence, 'total': self.total,
+                'table': base64.b64encode(zlib.compress(self.table.tobytes())).decode('ascii')}
+
+    def set_state(self, state: dict) -> bool:
+        """
+        Restore the counts, if the sketch has the same size; returns False otherwise.
+        """
+        if (state.get('error'), state.get('confidence')) != (self.error, self.confidence):
+            return False
+        table = array('I')
+        table.frombytes(zlib.decompress(base64.b64decode(state['table'])))
+        if len(table) != len(self.table):
+            return False
+        self.table = table
+        self.total = state['total']
+        return True
+
+
+class HostCounter:
+    """
+    Page, or item counters for each host, in a fixed amount of memory:
+    the counts are kept exactly for the top "max_hosts" hosts and estimated in a count-min sketch
+    for all the others. A host enters the top when its estimate is larger than the smallest top count,
+    and its count starts from its estimate.
+
+    It's a drop-in replacement for the counter dicts of the count filter middleware.
+    """
+
+    def __init__(self, max_hosts: int, error: float = DEFAULT_ERROR, confidence: float = DEFAULT_CONFIDENCE):
+        self.max_hosts = max_hosts
+        self.top: Dict[str, int] = {}
+        self.sketch = CountMinSketch(error, confidence)
+        # (count, host) of the top hosts; the counts can be lower than the real ones
+        # and the evicted hosts are removed when they reach the head
+        self._heap: List[Tuple[int, str]] = []
+        # The hosts counted since the last checkpoint; not tracked without checkpoints
+        self.changed = None
+
+    def __getitem__(self, host: str) -> int:
+        count = self.top.get(host)
+        if count is not None:
+            return count
+        return self.sketch.estimate(host)
+
+    def __setitem__(self, host: str, count: int):
+        self.add(host, count - self[host])
+
+    def __len__(self):
+        return len(self.top)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.top)
+
+    def keys(self):
+        return self.top.keys()
+
+    def add(self, host: str, count: int = 1):
+        estimate = self.sketch.add(host, count)
+        if self.changed is not None:
+            self.changed.add(host)
+        top = self.top
+        if host in top:
+            top[host] += count
+            return
+        heap = self._heap
+        if len(top) >= self.max_hosts:
+            # The head of the heap is a lower bound of the smallest top count
+            if estimate <= heap[0][0] or not self._evict_smallest(estimate):
+                return
+        top[host] = estimate
+        heapq.heappush(heap, (estimate, host))
+        if len(heap) > 2 * self.max_hosts:
+            self._heap = [(c, h) for h, c in top.items()]
+            heapq.heapify(self._heap)
+
+    def _evict_smallest(self, estimate: int) -> bool:
+        """
+        Remove the top host with the smallest count, if it's smaller than the estimate.
+        The evicted host is still counted in the sketch.
+        """
+        heap, top = self._heap, self.top
+        while heap:
+            count, host = heap[0]
+            current = top.get(host)
+            if current is None:
+                heapq.heappop(heap)
+            elif current != count:
+                heapq.heapreplace(heap, (current, host))
+            elif count >= estimate:
+                return False
+            else:
+                heapq.heappop(heap)
+                del top[host]
+                return True
+        return True
+
+    def update(self, counts: Mapping[str, int]):
+        for host, count in counts.items():
+            self.add(host, count)
+
+    def changes(self) -> dict:
+        """
+        The counts of the hosts counted since the last call; the changes are tracked from the first call.
+        """
+        if self.changed is None:
+            self.changed = set()
+            return {}
+        changes = {'changed': {host: self[host] for host in self.changed}} if self.changed else {}
+        self.changed.clear()
+        return changes
+
+    def get_state(self) -> dict:
+        """
+        The top counts and the sketch, for the checkpoints.
+        """
+        return {'top': dict(self.top), 'sketch': self.sketch.get_state()}
+
+    def set_state(self, state: dict):
+        """
+        Restore a state saved by get_state, with the counts changed after it.
+        """
+        if self.sketch.set_state(state.get('sketch') or {}):
+            # The sketch already has the counts of the top hosts
+            top = state.get('top') or {}
+            self.top = dict(sorted(top.items(), key=lambda item: item[1])[-self.max_hosts:])
+            self._heap = [(c, h) for h, c in self.top.items()]
+            heapq.heapify(self._heap)
+        else:
+            self.update(state.get('top') or {})
+        # The counts only grow
+        for host, count in (state.get('changed') or {}).items():
+            missing = count - self[host]
+            if missing > 0:
+                self.add(host, missing)
+
+
+class HostsCountFilterMiddleware(_HostsCountFilterMiddleware):
+    """
+    The per host count limits ("page_host_count" and "item_host_count" in "count-limits"),
+    with approximate counters when COUNT_FILTER_MAX_HOSTS is set, so the memory doesn't grow
+    with the number of hosts in broad crawls. The limits have the same meaning,
+    but the hosts outside the top can reach their limits a bit early.
+
+    Settings:
+    * COUNT_FILTER_MAX_HOSTS: the number of hosts with exact counts; default: 0, all the counts are exact
+    * COUNT_FILTER_ERROR: the error of the other counts, relative to the total count; default: 0.00001
+    * COUNT_FILTER_CONFIDENCE: the probability that the error is not larger; default: 0.99
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        settings = crawler.settings
+        max_hosts = settings.getint('COUNT_FILTER_MAX_HOSTS', 0)
+        if max_hosts > 0:
+            error = settings.getfloat('COUNT_FILTER_ERROR', DEFAULT_ERROR)
+            confidence = settings.getfloat('COUNT_FILTER_CONFIDENCE', DEFAULT_CONFIDENCE)
+            self.page_host_counter = HostCounter(max_hosts, error, confidence)
+            self.item_host_counter = HostCounter(max_hosts, error, confidence)
+            logger.info('Approximate host counters: %d exact hosts, %d KB',
+                        max_hosts, 2 * self.page_host_counter.sketch.memory // 1024)
+        else:
+            # The changes are saved by the Checkpoint extension
+            self.page_host_counter = TrackedCounter()
+            self.item_host_counter = TrackedCounter()
@@ -0,0 +1,122 @@
+import time
+import logging
+from typing import Dict, FrozenSet, Optional
+try:
+    from orjson import loads
+except ImportError:
+    try:
+        from ujson import loads
+    except ImportError:
+        from json import loads
+
+from scrapy.http import HtmlResponse
+from scrapy_autoextract.middlewares import (AUTOEXTRACT_META_KEY, MAX_ERROR_BODY, AutoExtractError,
+                                            AutoExtractMiddleware)
+
+logger = logging.getLogger(__name__)
+
+# Always kept, the spiders need them
+REQUIRED_FIELDS = ('url', 'probability')
+EMPTY_HTML = b'<body></body>'
+
+
+class LeanAutoExtractMiddleware(AutoExtractMiddleware):
+    """
+    AutoExtract middleware with a leaner decoding of the responses, when AUTOEXTRACT_LEAN_DECODING is set.
+
+    The response body is decoded directly from the bytes, with orjson when it's installed
+    (then ujson), instead of a str copy and the standard JSON module. Only the record
+    of the requested page type is kept, with only its AUTOEXTRACT_FIELDS (eg: {"article":
+    ["headline", "articleBody", "datePublished"]}, all the fields by default) and without
+    the empty values, so the large unused values (eg: "articleBodyHtml") are released
+    right after the decoding, together with the body. The item is then used as it is
+    by the spider, without another copy.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.lean = self.settings.getbool('AUTOEXTRACT_LEAN_DECODING')
+        self.fields: Dict[str, FrozenSet[str]] = {
+            page_type: frozenset(fields).union(REQUIRED_FIELDS)
+            for page_type, fields in self.settings.getdict('AUTOEXTRACT_FIELDS').items() if fields}
+
+    def process_response(self, request, response, spider):
+        if not self.lean:
+            return super().process_response(request, response, spider)
+        if not self._is_enabled_for_request(request):
+            return response
+        # If the request was never processed by AutoExtract
+        if not request.meta.get(AUTOEXTRACT_META_KEY):
+            return response
+
+        url = request.meta[AUTOEXTRACT_META_KEY]['original_url']
+        try:
+            response_object = loads(response.body)
+        except Exception:
+            self.inc_metric('autoextract/errors/json_decode')
+            self._log_debug_error(response, _error_body(response))
+            raise AutoExtractError('Cannot parse JSON response from AutoExtract'
+                                   ' for {}: {}'.format(url, response.body[:MAX_ERROR_BODY]))
+
+        if response.status != 200:
+            self.inc_metric('autoextract/errors/response_error/{}'.format(response.status))
+            self._log_debug_error(response, _error_body(response))
+            raise AutoExtractError('Received error from AutoExtract for '
+                                   '{}: {}'.format(url, response_object))
+
+        if not isinstance(response_object, list) or not response_object \
+                or not isinstance(response_object[0], dict):
+            self.inc_metric('autoextract/errors/type_error')
+            self._log_debug_error(response, _error_body(response))
+            raise AutoExtractError('Received invalid response from AutoExtract for '
+                                   '{}: {}'.format(url, response_object))
+        result = response_object[0]
+        # The other records of the response are released here
+        del response_object
+
+        if result.get('error'):
+            self.inc_metric('autoextract/errors/result_error')
+            self._log_debug_error(response, _error_body(response))
+            raise AutoExtractError('Received error from AutoExtract for '
+                                   '{}: {}'.format(url, result['error']))
+
+        stop_time = time.time()
+        latency = stop_time - request.meta[AUTOEXTRACT_META_KEY]['timing']['start_ts']
+        self.nr_resp += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.avg_latency = float(self.total_latency) / self.nr_resp
+        self.autoextract_latency_stats()
+
+        autoextract = request.meta.pop(AUTOEXTRACT_META_KEY)
+        autoextract['timing'].update({'end_ts': stop_time, 'latency': latency})
+
+        page_type = self._check_page_type(request)
+        logger.debug('AutoExtract latency for %s URL %s was %.3fs', page_type, url, latency,
+                     extra={'spider': spider})
+
+        page_html = result.get('html')
+        autoextract[page_type] = self.project(result.get(page_type), page_type)
+        # The item is already without the empty values, the spider doesn't copy it again
+        autoextract['projected'] = True
+        request.meta['autoextract'] = autoextract
+        return HtmlResponse(url, request=request, encoding='utf-8',
+                            body=page_html.encode('utf-8') if page_html else EMPTY_HTML)
+
+    def project(self, item: Optional[dict], page_type: str) -> dict:
+        """
+        The configured fields of the item, without the empty values.
+        """
+        if not item or not isinstance(item, dict):
+            return {}
+        fields = self.fields.get(page_type)
+        if fields is None:
+            return {k: v for k, v in item.items() if v}
+        return {k: v for k, v in item.items() if v and k in fields}
+
+
+def _error_body(response) -> str:
+    """
+    The body for the debug logs, only decoded on errors.
+    """
+    return response.body.decode('utf8', errors='replace')
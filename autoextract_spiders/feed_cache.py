@@ -0,0 +1,103 @@
+import os
+import time
+import sqlite3
+import logging
+from typing import List, Optional
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from scrapy import signals
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+DEFAULT_TTL = 7 * DAY
+DEFAULT_COMMIT_INTERVAL = 100
+
+
+class FeedCache:
+    """
+    Remember the RSS and Atom feeds discovered for each seed URL, between the runs,
+    so the seeds with known feeds don't need their page downloaded and scanned again.
+
+    The seeds with known feeds are sent directly to their feeds. The feeds are discovered again
+    when they are older than FEED_CACHE_TTL, or when one of them fails, or is empty.
+    The "feed_cache/" stats count the hits, the misses and the expired seeds.
+
+    Settings:
+    * FEED_CACHE_DIR: the directory of the cache; the cache is disabled if it's not set
+    * FEED_CACHE_TTL: the seconds the feeds of a seed are valid; default: 7 days
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.path = settings.get('FEED_CACHE_DIR')
+        self.enabled = bool(self.path)
+        self.ttl = settings.getfloat('FEED_CACHE_TTL', DEFAULT_TTL)
+        self.db = None
+        self._changes = 0
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(self.path, 'feeds.db'))
+            self.db.execute('CREATE TABLE IF NOT EXISTS feeds ('
+                            'source_url TEXT PRIMARY KEY, feed_urls TEXT, discovered_at REAL)')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_closed(self, spider):
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def get(self, source_url: str) -> Optional[List[str]]:
+        """
+        The known feeds of the seed URL, or None if they must be discovered.
+        """
+        if not self.enabled:
+            return None
+        stats = self.crawler.stats
+        row = self.db.execute('SELECT feed_urls, discovered_at FROM feeds WHERE source_url = ?',
+                              (source_url,)).fetchone()
+        if not row:
+            stats.inc_value('feed_cache/misses')
+            return None
+        if time.time() - row[1] >= self.ttl:
+            stats.inc_value('feed_cache/expired')
+            return None
+        stats.inc_value('feed_cache/hits')
+        return json.loads(row[0])
+
+    def put(self, source_url: str, feed_urls: List[str]):
+        if not self.enabled or not feed_urls:
+            return
+        self.db.execute('INSERT OR REPLACE INTO feeds (source_url, feed_urls, discovered_at) VALUES (?, ?, ?)',
+                        (source_url, json.dumps(sorted(feed_urls)), time.time()))
+        self.crawler.stats.inc_value('feed_cache/stored')
+        self._changed()
+
+    def invalidate(self, source_url: str) -> bool:
+        """
+        Forget the feeds of the seed URL; returns False if they were not known.
+        """
+        if not self.enabled:
+            return False
+        cursor = self.db.execute('DELETE FROM feeds WHERE source_url = ?', (source_url,))
+        self._changed()
+        if cursor.rowcount > 0:
+            self.crawler.stats.inc_value('feed_cache/invalidated')
+            return True
+        return False
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= DEFAULT_COMMIT_INTERVAL:
+            self.db.commit()
+            self._changes = 0
@@ -0,0 +1,334 @@
+import logging
+from collections import deque, defaultdict
+from time import time
+from typing import Callable, Iterable
+from urllib.parse import urlsplit
+
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import Request
+from scrapy.utils.misc import arg_to_iter
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+from twisted.internet import task
+
+from .resolver import AsyncCachingResolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ACTIVE_HOSTS = 100
+DEFAULT_MAX_QUEUED = 1000
+DEFAULT_INTERVAL = 1.0
+DEFAULT_HOST_TIMEOUT = 300
+
+
+class SeedFeeder:
+    """
+    Admit the seed requests gradually, instead of scheduling all of them at once.
+
+    Only a limited number of hosts are crawled at the same time. A new seed is admitted
+    when the scheduler and the downloader are not full and an active host either
+    reached its page limit ("page_host_count"), or ran out of links to follow.
+
+    The discovery requests of the active hosts are counted from the moment they are
+    scheduled, until the spider output of their response is processed (see the
+    SeedFeederMiddleware), or until they leave the downloader without a response.
+    The AutoExtract item requests are ignored, the AutoExtract list requests are discovery requests.
+    The redirected requests (eg: to the "www." host) and the requests that follow them
+    count for the seed host.
+    A host without any activity for SEED_FEEDER_HOST_TIMEOUT seconds is also released.
+
+    Settings:
+    * SEED_FEEDER_MAX_ACTIVE_HOSTS: how many seed hosts are crawled at the same time
+    * SEED_FEEDER_MAX_QUEUED: stop admitting seeds while more requests than this are
+        queued, or in progress
+    * SEED_FEEDER_INTERVAL: how often (in seconds) to check for free room
+    * SEED_FEEDER_HOST_TIMEOUT: release an active host after this many idle seconds
+
+    With the AsyncCachingResolver as DNS_RESOLVER, the seed hosts are resolved in advance,
+    as the seeds are added; a seed is admitted once its host is resolved, and the seeds
+    of the hosts that don't exist are dropped without any request ("seeds/dead_hosts" stat).
+    """
+
+    def __init__(self, crawler, spider, request_factory: Callable, resolver=None):
+        self.crawler = crawler
+        self.spider = spider
+        self.request_factory = request_factory
+        settings = crawler.settings
+        self.max_active_hosts = settings.getint('SEED_FEEDER_MAX_ACTIVE_HOSTS', DEFAULT_MAX_ACTIVE_HOSTS)
+        self.max_queued = settings.getint('SEED_FEEDER_MAX_QUEUED', DEFAULT_MAX_QUEUED)
+        self.interval = settings.getfloat('SEED_FEEDER_INTERVAL', DEFAULT_INTERVAL)
+        self.host_timeout = settings.getfloat('SEED_FEEDER_HOST_TIMEOUT', DEFAULT_HOST_TIMEOUT)
+
+        self.pending = deque()
+        # Active host -> number of discovery requests scheduled, or downloading
+        self.active = {}
+        # Active host -> the seed URLs admitted for it
+        self.active_seeds = defaultdict(list)
+        # Where the seeds came from (eg: the seeds file URL), to not add them twice after a resume
+        self.sources = set()
+        # The seeds added and finished since the last checkpoint, once the state was saved
+        self._added = None
+        self._finished = None
+        self._sources_changed = False
+        self.pages = defaultdict(int)
+        # Request -> active host, for the responses being processed by the spider
+        self.scraping = {}
+        self.last_seen = {}
+        self.running = False
+        self._loop = None
+        self.resolver = resolver
+
+    @classmethod
+    def from_crawler(cls, crawler, spider, request_factory: Callable):
+        o = cls(crawler, spider, request_factory)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(o.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(o.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(o.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(o.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(o.response_received, signal=signals.response_received)
+        return o
+
+    def add(self, urls: Iterable[str], source: str = None):
+        """
+        Queue seed URLs; they will be admitted when there's room for them.
+        The seeds from a source that was already added (before a resume) are ignored.
+        """
+        if source:
+            if source in self.sources:
+                logger.info('Seeds from %s were already added', source)
+                return
+            self.sources.add(source)
+            self._sources_changed = True
+        if self.resolver is None:
+            # The DNS resolver is installed when the reactor starts, after the spider is opened
+            from twisted.internet import reactor
+            if isinstance(getattr(reactor, 'resolver', None), AsyncCachingResolver):
+                self.resolver = reactor.resolver
+        if self.resolver or self._added is not None:
+            urls = list(urls)
+        if self._added is not None:
+            self._added.extend(urls)
+        if self.resolver:
+            self.resolver.prewarm((urlsplit(url).hostname or '' for url in urls), self._host_resolved)
+        self.pending.extend(urls)
+        self.crawler.stats.set_value('seeds/pending', len(self.pending))
+        if self.running:
+            self.feed()
+
+    def spider_opened(self, spider):
+        self.running = True
+        self._loop = task.LoopingCall(self.feed)
+        self._loop.start(self.interval, now=True)
+
+    def spider_closed(self, spider):
+        self.running = False
+        if self._loop and self._loop.running:
+            self._loop.stop()
+        if self.resolver:
+            for key, count in self.resolver.counts.items():
+                self.crawler.stats.set_value(f'dns/{key}', count)
+
+    def spider_idle(self, spider):
+        # Nothing is queued, or downloading, so all the active hosts are finished
+        self._release_hosts(list(self.active))
+        if self.feed() or self._waiting_for_dns():
+            raise DontCloseSpider
+
+    def request_scheduled(self, request, spider):
+        host = self._active_host(request)
+        if host and not self._is_sent_to_api(request):
+            self.active[host] += 1
+            self.last_seen[host] = time()
+
+    def request_dropped(self, request, spider):
+        host = self._active_host(request)
+        if host and not self._is_sent_to_api(request):
+            self.active[host] -= 1
+
+    def request_left_downloader(self, request, spider):
+        host = self._active_host(request)
+        if host:
+            self.active[host] -= 1
+            self.pages[host] += 1
+            self.last_seen[host] = time()
+
+    def response_received(self, response, request, spider):
+        # The host is still active until the spider output of the response is processed
+        host = self._active_host(request)
+        if host:
+            self.active[host] += 1
+            self.scraping[request] = host
+
+    def process_spider_output(self, response, result: Iterable) -> Iterable:
+        """
+        The output of the response, with the new requests attributed to the seed host.
+        The response is finished when all the output is processed.
+        """
+        host = self.scraping.get(response.request)
+        try:
+            for output in result:
+                if host and isinstance(output, Request) and 'seed_host' not in output.meta \
+                        and urlsplit(output.url).netloc.lower() != host:
+                    output.meta['seed_host'] = host
+                yield output
+        finally:
+            self.response_finished(response)
+
+    def response_finished(self, response):
+        host = self.scraping.pop(response.request, None)
+        if host in self.active:
+            self.active[host] -= 1
+            self.last_seen[host] = time()
+
+    def feed(self) -> int:
+        """
+        Release the finished hosts and admit new seeds, while there's room.
+        Returns the number of admitted seeds.
+        """
+        self._release_hosts([h for h in self.active if self._is_host_finished(h)])
+        admitted = 0
+        while self.pending and self._has_room():
+            if self.resolver:
+                host = urlsplit(self.pending[0]).hostname or ''
+                if self.resolver.is_resolving(host):
+                    # The seeds are admitted in order, once their host is resolved
+                    break
+                if self.resolver.status(host) is False:
+                    url = self.pending.popleft()
+                    if self._finished is not None:
+                        self._finished.append(url)
+                    self.crawler.stats.inc_value('seeds/dead_hosts')
+                    continue
+            url = self.pending.popleft()
+            host = urlsplit(url).netloc.lower()
+            self.active.setdefault(host, 0)
+            self.active_seeds[host].append(url)
+            self.last_seen[host] = time()
+            # A seed can start with several requests (eg: its known feeds)
+            for request in arg_to_iter(self.request_factory(url)):
+                self.crawler.engine.crawl(request, self.spider)
+            admitted += 1
+        if admitted:
+            self.crawler.stats.inc_value('seeds/admitted', admitted)
+        self.crawler.stats.set_value('seeds/pending', len(self.pending))
+        self.crawler.stats.max_value('seeds/max_active_hosts', len(self.active))
+        return admitted
+
+    def get_state(self) -> dict:
+        """
+        The seeds not finished yet, to be saved in a checkpoint.
+        The active seeds are admitted again after a resume.
+        The seeds added and finished from now on are tracked for the next checkpoints.
+        """
+        self._added, self._finished, self._sources_changed = [], [], False
+        pending = dict.fromkeys(url for urls in self.active_seeds.values() for url in urls)
+        pending.update(dict.fromkeys(self.pending))
+        return {'pending': {url: 1 for url in pending}, 'sources': sorted(self.sources)}
+
+    def get_state_changes(self) -> dict:
+        """
+        The changes since the last checkpoint: the seeds added (1) and finished (None).
+        """
+        if self._added is None:
+            return {}
+        changes = {}
+        pending = {url: 1 for url in self._added}
+        pending.update(dict.fromkeys(self._finished))
+        if pending:
+            changes['pending'] = pending
+        if self._sources_changed:
+            changes['sources'] = sorted(self.sources)
+        self._added, self._finished, self._sources_changed = [], [], False
+        return changes
+
+    def set_state(self, state: dict):
+        # The pending seeds are the keys of a dict, to save the changes
+        self.pending = deque(state.get('pending', ()))
+        self.sources = set(state.get('sources', ()))
+        self.crawler.stats.set_value('seeds/pending', len(self.pending))
+
+    def _waiting_for_dns(self) -> bool:
+        if not self.resolver or not self.pending:
+            return False
+        return self.resolver.is_resolving(urlsplit(self.pending[0]).hostname or '')
+
+    def _host_resolved(self, host: str):
+        # The next seed was waiting for its host
+        if self.running and self.pending and urlsplit(self.pending[0]).hostname == host:
+            self.feed()
+
+    def _has_room(self) -> bool:
+        if len(self.active) >= self.max_active_hosts > 0:
+            return False
+        if self.max_queued > 0:
+            engine = self.crawler.engine
+            try:
+                queued = len(engine.slot.scheduler) + len(engine.downloader.active)
+            except (AttributeError, TypeError):
+                queued = 0
+            if queued >= self.max_queued:
+                return False
+        return True
+
+    def _is_host_finished(self, host: str) -> bool:
+        if self.active[host] <= 0:
+            return True
+        count_limits = getattr(self.spider, 'count_limits', None) or {}
+        max_pages = count_limits.get('page_host_count', 0)
+        if max_pages > 0 and self.pages[host] >= max_pages:
+            return True
+        return time() - self.last_seen.get(host, 0) > self.host_timeout
+
+    def _release_hosts(self, hosts):
+        for host in hosts:
+            del self.active[host]
+            seeds = self.active_seeds.pop(host, None)
+            if seeds and self._finished is not None:
+                self._finished.extend(seeds)
+            self.pages.pop(host, None)
+            self.last_seen.pop(host, None)
+        if hosts:
+            self.crawler.stats.inc_value('seeds/finished_hosts', len(hosts))
+
+    def _active_host(self, request) -> str:
+        url = request.url
+        if request.meta.get('autoextract'):
+            # AutoExtract item requests don't count for discovery
+            if not request.meta.get('list_page'):
+                return ''
+            if self._is_sent_to_api(request):
+                url = request.meta[AUTOEXTRACT_META_KEY]['original_url']
+        host = request.meta.get('seed_host')
+        if not host:
+            # A redirected request counts for the host of its first URL
+            host = urlsplit(request.meta.get('redirect_urls', [url])[0]).netloc.lower()
+            if host not in self.active and request.meta.get('source_url'):
+                # Or for the host of its seed (eg: the known feeds of a seed, on a feeds host)
+                host = urlsplit(request.meta['source_url']).netloc.lower()
+        return host if host in self.active else ''
+
+    @staticmethod
+    def _is_sent_to_api(request) -> bool:
+        # The AutoExtract middleware replaces the request with a new request to the API,
+        # and the new request is scheduled again; only the first one is counted
+        return AUTOEXTRACT_META_KEY in request.meta
+
+
+class SeedFeederMiddleware:
+    """
+    Spider middleware that keeps the seed host of a response active until the spider output
+    of the response is processed, so a host isn't released while its new requests are created.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        feeder = getattr(spider, 'seed_feeder', None)
+        if feeder is None:
+            return result
+        return feeder.process_spider_output(response, result)
+
+    def process_spider_exception(self, response, exception, spider):
+        feeder = getattr(spider, 'seed_feeder', None)
+        if feeder is not None:
+            feeder.response_finished(response)
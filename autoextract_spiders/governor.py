@@ -0,0 +1,103 @@
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 50
+DEFAULT_MIN_CALLS = 20
+DEFAULT_MIN_YIELD = 0.05
+DEFAULT_THROTTLE_YIELD = 0.2
+
+
+class _HostSpend:
+    __slots__ = ('results', 'calls', 'accepted', 'credit', 'stopped')
+
+    def __init__(self, window):
+        self.results = deque(maxlen=window)
+        self.calls = 0
+        self.accepted = 0
+        self.credit = 0.0
+        self.stopped = False
+
+    @property
+    def window_yield(self) -> float:
+        return sum(self.results) / len(self.results) if self.results else 1.0
+
+
+class SpendGovernor:
+    """
+    Adapt the AutoExtract spending per host, based on the observed yield:
+    the share of AutoExtract calls that returned an item above the threshold.
+
+    The yield is computed over the last SPEND_GOVERNOR_WINDOW calls of each host.
+    After SPEND_GOVERNOR_MIN_CALLS calls, a host with a yield below SPEND_GOVERNOR_THROTTLE_YIELD
+    gets only a part of its candidate URLs extracted, proportional to its yield,
+    and a host with a yield below SPEND_GOVERNOR_MIN_YIELD is stopped.
+    The pages and the items not spent on these hosts are left for the productive hosts,
+    within the global "page_count" and "item_count" limits.
+
+    If SPEND_GOVERNOR_STOP_DISCOVERY is disabled, the URLs that are not extracted
+    are still fetched, to continue discovering links from them.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.enabled = settings.getbool('SPEND_GOVERNOR_ENABLED', False)
+        self.window = settings.getint('SPEND_GOVERNOR_WINDOW', DEFAULT_WINDOW)
+        self.min_calls = settings.getint('SPEND_GOVERNOR_MIN_CALLS', DEFAULT_MIN_CALLS)
+        self.min_yield = settings.getfloat('SPEND_GOVERNOR_MIN_YIELD', DEFAULT_MIN_YIELD)
+        self.throttle_yield = settings.getfloat('SPEND_GOVERNOR_THROTTLE_YIELD', DEFAULT_THROTTLE_YIELD)
+        self.stop_discovery = settings.getbool('SPEND_GOVERNOR_STOP_DISCOVERY', True)
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _host(self, url: str) -> _HostSpend:
+        host = urlsplit(url).netloc.lower()
+        if host not in self.hosts:
+            self.hosts[host] = _HostSpend(self.window)
+        return self.hosts[host]
+
+    def record(self, url: str, accepted: bool):
+        """
+        Record the result of one AutoExtract call.
+        """
+        if not self.enabled:
+            return
+        spend = self._host(url)
+        spend.calls += 1
+        spend.accepted += int(accepted)
+        spend.results.append(int(accepted))
+
+    def allow(self, url: str) -> bool:
+        """
+        Decide if the URL should be sent to AutoExtract.
+        """
+        if not self.enabled:
+            return True
+        spend = self._host(url)
+        if spend.stopped:
+            self.crawler.stats.inc_value('governor/skipped/stopped')
+            return False
+        if spend.calls < self.min_calls:
+            return True
+
+        window_yield = spend.window_yield
+        if window_yield < self.min_yield:
+            spend.stopped = True
+            logger.info('Stopping AutoExtract for host %s: yield %.3f after %d calls',
+                        urlsplit(url).netloc, window_yield, spend.calls)
+            self.crawler.stats.inc_value('governor/stopped_hosts')
+            self.crawler.stats.inc_value('governor/skipped/stopped')
+            return False
+        if window_yield < self.throttle_yield:
+            spend.credit += window_yield / self.throttle_yield
+            if spend.credit < 1:
+                self.crawler.stats.inc_value('governor/skipped/throttled')
+                return False
+            spend.credit -= 1
+        return True
@@ -0,0 +1,117 @@
+"""
+The HTTP/2 connection pool of the AutoExtractDownloadHandler.
+Only imported when the handler is enabled, it needs Scrapy 2.5 and the "h2" package (Twisted[http2]).
+"""
+from collections import deque
+from typing import Tuple
+
+from twisted.internet.defer import Deferred
+from twisted.web.client import URI
+from twisted.internet.endpoints import HostnameEndpoint
+from scrapy.core.downloader.handlers.http2 import H2DownloadHandler
+from scrapy.core.http2.agent import H2ConnectionPool
+from scrapy.core.http2.protocol import H2ClientProtocol, H2ClientFactory
+
+DEFAULT_MAX_CONNECTIONS = 2
+DEFAULT_MAX_STREAMS = 100
+
+
+class _LimitedH2ClientProtocol(H2ClientProtocol):
+    """
+    HTTP/2 connection with at most "max_streams" requests at the same time.
+    """
+
+    max_streams = DEFAULT_MAX_STREAMS
+
+    def connectionMade(self) -> None:
+        # The frames of a request are written separately (headers, then body),
+        # without TCP_NODELAY the body waits for the delayed ACK of the headers
+        self.transport.setTcpNoDelay(True)
+        super().connectionMade()
+
+    @property
+    def allowed_max_concurrent_streams(self) -> int:
+        return min(super().allowed_max_concurrent_streams, self.max_streams)
+
+    @property
+    def load(self) -> int:
+        return self.metadata['active_streams'] + len(self._pending_request_stream_pool)
+
+
+class _LimitedH2ClientFactory(H2ClientFactory):
+
+    def __init__(self, uri, settings, conn_lost_deferred, max_streams: int):
+        super().__init__(uri, settings, conn_lost_deferred)
+        self.max_streams = max_streams
+
+    def buildProtocol(self, addr) -> H2ClientProtocol:
+        protocol = _LimitedH2ClientProtocol(self.uri, self.settings, self.conn_lost_deferred)
+        protocol.max_streams = self.max_streams
+        return protocol
+
+
+class MultiplexedH2ConnectionPool(H2ConnectionPool):
+    """
+    Keep a few persistent HTTP/2 connections for each host, instead of only one.
+    A new request goes to the connection with the fewest streams;
+    a new connection is made only when all the connections have "max_streams" streams.
+    """
+
+    def __init__(self, reactor, settings, max_connections: int, max_streams: int):
+        super().__init__(reactor, settings)
+        self.max_connections = max(1, max_connections)
+        self.max_streams = max(1, max_streams)
+
+    def get_connection(self, key: Tuple, uri: URI, endpoint: HostnameEndpoint) -> Deferred:
+        return super().get_connection(self._choose_key(key), uri, endpoint)
+
+    def _choose_key(self, key: Tuple) -> Tuple:
+        loads = {}
+        for n in range(self.max_connections):
+            sub_key = key + (n,)
+            if sub_key in self._pending_requests:
+                # Still connecting
+                loads[sub_key] = len(self._pending_requests[sub_key])
+            elif sub_key in self._connections:
+                loads[sub_key] = self._connections[sub_key].load
+        if loads:
+            sub_key = min(loads, key=loads.get)
+            if loads[sub_key] < self.max_streams or len(loads) >= self.max_connections:
+                return sub_key
+        # All the connections are busy, make a new one
+        return next(key + (n,) for n in range(self.max_connections) if key + (n,) not in loads)
+
+    def _new_connection(self, key: Tuple, uri: URI, endpoint: HostnameEndpoint) -> Deferred:
+        self._pending_requests[key] = deque()
+
+        conn_lost_deferred = Deferred()
+        conn_lost_deferred.addCallback(self._remove_connection, key)
+
+        factory = _LimitedH2ClientFactory(uri, self.settings, conn_lost_deferred, self.max_streams)
+        conn_d = endpoint.connect(factory)
+        conn_d.addCallback(self.put_connection, key)
+        conn_d.addErrback(self._connection_failed, key)
+
+        d = Deferred()
+        self._pending_requests[key].append(d)
+        return d
+
+    def _connection_failed(self, failure, key: Tuple):
+        # Fail the requests waiting for the connection, and allow a new connection
+        pending_requests = self._pending_requests.pop(key, None)
+        while pending_requests:
+            pending_requests.popleft().errback(failure)
+
+
+class MultiplexedH2DownloadHandler(H2DownloadHandler):
+    """
+    HTTP/2 download handler with a MultiplexedH2ConnectionPool.
+    """
+
+    def __init__(self, settings, crawler=None):
+        super().__init__(settings, crawler)
+        from twisted.internet import reactor
+        self._pool = MultiplexedH2ConnectionPool(
+            reactor, settings,
+            max_connections=settings.getint('AUTOEXTRACT_HTTP2_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS),
+            max_streams=settings.getint('AUTOEXTRACT_HTTP2_MAX_STREAMS', DEFAULT_MAX_STREAMS))
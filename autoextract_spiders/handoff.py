@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+from typing import Iterator, Optional
+
+from scrapy import signals
+
+logger = logging.getLogger(__name__)
+
+MODES = ('discovery', 'extraction')
+
+PENDING, CLAIMED, DONE, FAILED = range(4)
+STATUS_NAMES = ('pending', 'claimed', 'done', 'failed')
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_LEASE = 3600
+DEFAULT_MAX_ATTEMPTS = 3
+
+FIELDS = ('id', 'url', 'page_type', 'source_url', 'link_text')
+
+
+class HandoffQueue:
+    """
+    On-disk queue of the candidate item URLs, between the discovery jobs and the extraction jobs,
+    so the two stages can be scaled and scheduled independently.
+
+    The discovery jobs ("handoff" spider argument set to "discovery") crawl the pages as usual,
+    but instead of sending the candidate URLs to AutoExtract, they add them to the queue,
+    in batches; each URL is added once. The extraction jobs ("handoff" set to "extraction")
+    take the candidates in large batches, the shallow pages first, and send them to AutoExtract
+    like the "items" list. The candidates taken by a job are leased to it; they are taken again
+    by another job if they're not finished after HANDOFF_LEASE seconds, and the unfinished
+    candidates are put back in the queue when the job closes. The failed candidates are tried
+    HANDOFF_MAX_ATTEMPTS times. The state of the queue is in the "handoff/" stats of each job.
+
+    Settings:
+    * HANDOFF_DIR: the directory of the queue, shared by the discovery and the extraction jobs
+    * HANDOFF_BATCH_SIZE: how many candidates are written, or taken at once; default: 1000
+    * HANDOFF_LEASE: the seconds a job has to finish the candidates it took; default: 3600
+    * HANDOFF_MAX_ATTEMPTS: how many times a failed candidate is sent to AutoExtract; default: 3
+    """
+
+    def __init__(self, crawler, mode: Optional[str] = None):
+        if mode and mode not in MODES:
+            raise ValueError(f'Invalid handoff mode "{mode}", expected one of: {", ".join(MODES)}')
+        self.crawler = crawler
+        settings = crawler.settings
+        self.mode = mode
+        self.path = settings.get('HANDOFF_DIR')
+        if mode and not self.path:
+            raise ValueError('The handoff mode requires the HANDOFF_DIR setting')
+        self.batch_size = settings.getint('HANDOFF_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.lease = settings.getfloat('HANDOFF_LEASE', DEFAULT_LEASE)
+        self.max_attempts = settings.getint('HANDOFF_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        # Each job claims the candidates with its own id
+        self.job_id = uuid.uuid4().hex
+        self.db = None
+        self._pending = []
+        self._changes = 0
+        if mode:
+            os.makedirs(self.path, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(self.path, 'candidates.db'), timeout=60)
+            self.db.execute('CREATE TABLE IF NOT EXISTS candidates ('
+                            'id INTEGER PRIMARY KEY, url TEXT UNIQUE, page_type TEXT, source_url TEXT, '
+                            'link_text TEXT, priority INTEGER, status INTEGER, attempts INTEGER, '
+                            'claimed_by TEXT, claimed_at REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS candidates_queue ON candidates (status, priority)')
+            self.db.commit()
+
+    @classmethod
+    def from_crawler(cls, crawler, mode: Optional[str] = None):
+        o = cls(crawler, mode)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    @property
+    def discovery(self) -> bool:
+        return self.mode == 'discovery'
+
+    @property
+    def extraction(self) -> bool:
+        return self.mode == 'extraction'
+
+    def spider_closed(self, spider):
+        if not self.db:
+            return
+        self.flush()
+        # The candidates not finished by this job are left to the next jobs
+        cursor = self.db.execute('UPDATE candidates SET status = ?, claimed_by = NULL WHERE status = ? '
+                                 'AND claimed_by = ?', (PENDING, CLAIMED, self.job_id))
+        if cursor.rowcount > 0:
+            self.crawler.stats.inc_value('handoff/released', cursor.rowcount)
+        self.db.commit()
+        for status, count in self.db.execute('SELECT status, COUNT(*) FROM candidates GROUP BY status'):
+            self.crawler.stats.set_value(f'handoff/queue/{STATUS_NAMES[status]}', count)
+        self.db.close()
+        self.db = None
+
+    def put(self, url: str, page_type: str, meta: dict):
+        """
+        Add a candidate to the queue; the shallow pages are extracted first.
+        """
+        self._pending.append((url, page_type, meta.get('source_url'), (meta.get('link_text') or '').strip(),
+                              -meta.get('depth', 0), PENDING, 0))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        cursor = self.db.executemany('INSERT OR IGNORE INTO candidates (url, page_type, source_url, link_text, '
+                                     'priority, status, attempts) VALUES (?, ?, ?, ?, ?, ?, ?)', self._pending)
+        self.db.commit()
+        stats = self.crawler.stats
+        stats.inc_value('handoff/queued', cursor.rowcount)
+        stats.inc_value('handoff/duplicates', len(self._pending) - cursor.rowcount)
+        self._pending = []
+
+    def consume(self) -> Iterator[dict]:
+        """
+        The candidates to extract, claimed in batches, until the queue is empty.
+        """
+        while True:
+            batch = self._claim()
+            if not batch:
+                return
+            yield from batch
+
+    def _claim(self):
+        now = time.time()
+        # The finished candidates are committed first
+        self.db.commit()
+        with self.db:
+            # Lock the queue, so the other extraction jobs don't claim the same candidates
+            self.db.execute('BEGIN IMMEDIATE')
+            rows = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM candidates '
+                                   'WHERE status = ? OR (status = ? AND claimed_at < ?) '
+                                   'ORDER BY priority DESC, id LIMIT ?',
+                                   (PENDING, CLAIMED, now - self.lease, self.batch_size)).fetchall()
+            self.db.executemany('UPDATE candidates SET status = ?, claimed_by = ?, claimed_at = ? WHERE id = ?',
+                                [(CLAIMED, self.job_id, now, row[0]) for row in rows])
+        self.crawler.stats.inc_value('handoff/claimed', len(rows))
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def done(self, meta: dict):
+        """
+        The candidate of a request was extracted.
+        """
+        if self.extraction and meta.get('handoff_id'):
+            self.db.execute('UPDATE candidates SET status = ? WHERE id = ?', (DONE, meta['handoff_id']))
+            self.crawler.stats.inc_value('handoff/extracted')
+            self._changed()
+
+    def failed(self, meta: dict):
+        """
+        The candidate of a request failed; it's tried again later, up to HANDOFF_MAX_ATTEMPTS times.
+        """
+        if not self.extraction or not meta.get('handoff_id'):
+            return
+        self.db.execute('UPDATE candidates SET attempts = attempts + 1, claimed_by = NULL, '
+                        'status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE id = ?',
+                        (self.max_attempts, FAILED, PENDING, meta['handoff_id']))
+        self.crawler.stats.inc_value('handoff/failed')
+        self._changed()
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self.batch_size:
+            self.db.commit()
+            self._changes = 0
@@ -0,0 +1,59 @@
+import logging
+from urllib.parse import urlsplit
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.misc import create_instance
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTOEXTRACT_URL = 'https://autoextract.scrapinghub.com/v1/extract'
+
+
+def update_download_handlers(settings):
+    """
+    Use the AutoExtractDownloadHandler for HTTPS, when AUTOEXTRACT_HTTP2_ENABLED is set.
+    The HTTP/2 support (scrapy.core.http2 and the "h2" package) is only imported by the handler.
+    """
+    if settings.getbool('AUTOEXTRACT_HTTP2_ENABLED'):
+        handlers = settings.getdict('DOWNLOAD_HANDLERS')
+        handlers['https'] = 'autoextract_spiders.http2.AutoExtractDownloadHandler'
+        settings.set('DOWNLOAD_HANDLERS', handlers, priority=settings.getpriority('DOWNLOAD_HANDLERS') or 0)
+
+
+class AutoExtractDownloadHandler:
+    """
+    HTTPS download handler that sends the AutoExtract API requests over a small pool of
+    persistent HTTP/2 connections, multiplexing many requests on each connection.
+    All the other requests are downloaded by the default HTTP/1.1 handler.
+
+    Settings:
+    * AUTOEXTRACT_HTTP2_ENABLED: use this handler for HTTPS; default: False
+    * AUTOEXTRACT_HTTP2_MAX_CONNECTIONS: the HTTP/2 connections to the API; default: 2
+    * AUTOEXTRACT_HTTP2_MAX_STREAMS: the requests sent at the same time on one connection,
+        if the server allows them; default: 100
+    """
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        # Imported here, the spiders are imported without the HTTP/2 dependencies
+        from .h2pool import MultiplexedH2DownloadHandler
+        self.crawler = crawler
+        self._default = create_instance(HTTP11DownloadHandler, settings, crawler)
+        self._h2 = create_instance(MultiplexedH2DownloadHandler, settings, crawler)
+        self._api_host = urlsplit(settings.get('AUTOEXTRACT_URL') or DEFAULT_AUTOEXTRACT_URL).netloc
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def download_request(self, request, spider):
+        if AUTOEXTRACT_META_KEY in request.meta and urlsplit(request.url).netloc == self._api_host:
+            if self.crawler:
+                self.crawler.stats.inc_value('autoextract/http2/requests')
+            return self._h2.download_request(request, spider)
+        return self._default.download_request(request, spider)
+
+    def close(self):
+        self._h2.close()
+        return self._default.close()
@@ -0,0 +1,148 @@
+import re
+import logging
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+from scrapy.utils.misc import arg_to_iter
+
+logger = logging.getLogger(__name__)
+
+RULE_KEYS = ('allow', 'deny', 'allow_domains', 'deny_domains')
+
+# The patterns without special regex characters are matched as plain sub-strings
+REGEX_CHARS = re.compile(r'[\\^$.|?*+()\[\]{}]')
+
+
+def _trie_pattern(literals: Iterable[str]) -> str:
+    """
+    One regex for many sub-strings, with the common prefixes factored out,
+    so the matching cost depends on the length of the URL, not on the number of sub-strings.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node: dict) -> str:
+    if '' in node:
+        # A shorter sub-string already matches, the longer ones don't matter
+        return ''
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items())]
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+def _combined_regex(patterns) -> Optional['re.Pattern']:
+    """
+    Compile the allow, or deny patterns into a single regex.
+    """
+    patterns = [p for p in arg_to_iter(patterns) if p]
+    if not patterns:
+        return None
+    literals = [p for p in patterns if not REGEX_CHARS.search(p)]
+    regexes = [p for p in patterns if REGEX_CHARS.search(p)]
+    parts = [f'(?:{p})' for p in regexes]
+    if literals:
+        parts.append(_trie_pattern(literals))
+    return re.compile('|'.join(parts))
+
+
+def _domains(domains) -> frozenset:
+    return frozenset(d.lower().lstrip('.') for d in arg_to_iter(domains) if d)
+
+
+def _from_domains(host: str, domains: frozenset) -> bool:
+    """
+    True if the host is one of the domains, or a sub-domain of one of them.
+    """
+    while True:
+        if host in domains:
+            return True
+        if '.' not in host:
+            return False
+        host = host.split('.', 1)[1]
+
+
+class HostRules:
+    """
+    The link extraction rules of one host, with the same meaning as the LinkExtractor arguments:
+    the links must match one of the "allow" patterns, none of the "deny" patterns,
+    and be on one of the "allow_domains" and none of the "deny_domains".
+    """
+    __slots__ = ('allow', 'deny', 'allow_domains', 'deny_domains')
+
+    def __init__(self, allow=None, deny=None, allow_domains=None, deny_domains=None):
+        self.allow = _combined_regex(allow)
+        self.deny = _combined_regex(deny)
+        self.allow_domains = _domains(allow_domains)
+        self.deny_domains = _domains(deny_domains)
+
+    def matches(self, url: str, host: str = None) -> bool:
+        if self.allow and not self.allow.search(url):
+            return False
+        if self.deny and self.deny.search(url):
+            return False
+        if self.allow_domains or self.deny_domains:
+            host = host or urlsplit(url).hostname or ''
+            if self.allow_domains and not _from_domains(host, self.allow_domains):
+                return False
+            if self.deny_domains and _from_domains(host, self.deny_domains):
+                return False
+        return True
+
+
+class HostExtractRules:
+    """
+    Link extraction rules for each host, for multi-seed crawls.
+
+    The rules are a mapping of host -> {allow, deny, allow_domains, deny_domains};
+    the rules of a host are compiled once, the first time they're used.
+    The rules of a host also apply to its sub-domains, unless they have their own rules
+    (eg: the "example.com" rules apply to "www.example.com").
+    Looking up the rules of a page costs one dict lookup for each label of its host,
+    and matching a link costs one regex search for the allow patterns and one for the deny patterns,
+    whatever the number of hosts and patterns.
+    """
+
+    def __init__(self, rules: Dict[str, dict]):
+        # Host -> rules dict, or compiled HostRules
+        self.rules = {}
+        for host, host_rules in (rules or {}).items():
+            unknown = set(host_rules or {}) - set(RULE_KEYS)
+            if unknown:
+                raise ValueError(f'Invalid extract rules for {host}: {", ".join(sorted(unknown))}')
+            self.rules[host.lower().strip('.')] = host_rules or {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def get(self, host: str) -> Optional[HostRules]:
+        """
+        The rules of the host, or of its closest parent domain; None if there are no rules.
+        """
+        host = (host or '').lower().split(':', 1)[0]
+        while True:
+            rules = self.rules.get(host)
+            if rules is not None:
+                if not isinstance(rules, HostRules):
+                    rules = self.rules[host] = self._compile(host, rules)
+                return rules
+            if '.' not in host:
+                return None
+            host = host.split('.', 1)[1]
+
+    @staticmethod
+    def _compile(host: str, rules: dict) -> HostRules:
+        try:
+            return HostRules(**rules)
+        except re.error as err:
+            logger.error('Invalid extract rules for %s, all the links are allowed: %s', host, err)
+            return HostRules()
+
+    def rules_for_url(self, url: str) -> Optional[HostRules]:
+        return self.get(urlsplit(url).hostname)
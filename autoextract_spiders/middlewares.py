@@ -1,4 +1,6 @@
+from scrapy.http import Request
 from scrapy.settings import default_settings
+from scrapy.spidermiddlewares.depth import DepthMiddleware as _DepthMiddleware
 from scrapy_frontera.middlewares import (
     SchedulerSpiderMiddleware as _SSpiderMiddleware,
     SchedulerDownloaderMiddleware as _SDownloaderMiddleware,
@@ -10,6 +12,15 @@ def reset_scheduler_on_disabled_frontera(settings):
         settings['SCHEDULER'] = default_settings.SCHEDULER
 
 
+def use_compact_memory_queue(settings):
+    """
+    Keep the queued requests in memory as compact records, when COMPACT_MEMORY_QUEUE is set.
+    """
+    if settings.getbool('COMPACT_MEMORY_QUEUE'):
+        settings.set('SCHEDULER_MEMORY_QUEUE', 'autoextract_spiders.squeues.CompactFifoMemoryQueue',
+                     priority=settings.getpriority('COMPACT_MEMORY_QUEUE'))
+
+
 class FronteraDisabledMixin:
 
     @property
@@ -37,3 +48,18 @@ class SchedulerDownloaderMiddleware(_SDownloaderMiddleware, FronteraDisabledMixi
     def process_exception(self, request, exception, spider):
         if self.is_frontera_enabled:
             return self.scheduler.process_exception(request, exception, spider)
+
+
+class DepthMiddleware(_DepthMiddleware):
+    """
+    The pagination requests stay at the depth of the listing page they come from,
+    so the listings are followed to the end, independently of the DEPTH_LIMIT.
+    They have their own budget instead, see the PaginationDetector.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        for request in super().process_spider_output(response, result, spider):
+            if isinstance(request, Request) and request.meta.get('pagination'):
+                request.meta['depth'] -= 1
+                request.priority += self.prio
+            yield request
@@ -0,0 +1,80 @@
+from typing import Iterable
+from urllib.parse import urlsplit
+
+from scrapy.spidermiddlewares.offsite import OffsiteMiddleware as _OffsiteMiddleware
+from scrapy.utils.httpobj import urlparse_cached
+
+
+class AllowedHosts:
+    """
+    The hosts of the seeds, for the same-origin filter, in hashed sets.
+
+    Checking a link costs one set lookup for the same host (with the port),
+    or one set lookup for each label of the host for the sub-domains,
+    whatever the number of seeds, instead of scanning a list, or searching a giant regex.
+    The seeds can be added at any time, eg: when the seeds file is downloaded.
+    Until the first seed is added, all the hosts are allowed.
+    """
+
+    def __init__(self, default_domains: Iterable[str] = ()):
+        # The netlocs of the seeds, with the port
+        self.hosts = set()
+        # The domains of the seeds and the default domains, without the port
+        self.domains = set()
+        for domain in default_domains:
+            self.domains.add(domain.lower().lstrip('.'))
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __contains__(self, netloc: str) -> bool:
+        """
+        True if the netloc is the netloc of a seed, or if there are no seeds.
+        """
+        return not self.hosts or netloc.lower() in self.hosts
+
+    def add(self, urls: Iterable[str]):
+        for url in urls:
+            parts = urlsplit(url)
+            if parts.netloc:
+                self.hosts.add(parts.netloc.lower())
+                self.domains.add(parts.hostname)
+
+    def allows(self, host: str) -> bool:
+        """
+        True if the host is the domain of a seed, or a sub-domain of one of them,
+        with the same meaning as the "allowed_domains" of the spiders.
+        """
+        if not self.hosts:
+            return True
+        domains = self.domains
+        host = host.lower()
+        while True:
+            if host in domains:
+                return True
+            dot = host.find('.')
+            if dot < 0:
+                return False
+            host = host[dot + 1:]
+
+
+class OffsiteMiddleware(_OffsiteMiddleware):
+    """
+    Replaces the Scrapy OffsiteMiddleware, for the spiders with "allowed_hosts":
+    the requests are checked in the hashed sets of the seed hosts, instead of the regex
+    of all the allowed domains, which is slow to build and to search with many seeds
+    and doesn't know about the seeds loaded after the spider is opened.
+    The other spiders use the "allowed_domains" regex, as usual.
+    """
+
+    def should_follow(self, request, spider):
+        allowed_hosts = getattr(spider, 'allowed_hosts', None)
+        if allowed_hosts is None:
+            return super().should_follow(request, spider)
+        # hostname can be None for wrong urls (like javascript links)
+        return allowed_hosts.allows(urlparse_cached(request).hostname or '')
+
+    def get_host_regex(self, spider):
+        if getattr(spider, 'allowed_hosts', None) is not None:
+            return None
+        return super().get_host_regex(spider)
@@ -0,0 +1,175 @@
+import re
+import logging
+from collections import defaultdict
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, SplitResult
+
+from w3lib.html import strip_html5_whitespace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = 100
+DEFAULT_HOST_BUDGET = 1000
+DEFAULT_PRIORITY = 100
+
+# The query parameters and the path segments used for page numbers by most websites
+DEFAULT_QUERY_PARAMS = ('page', 'p', 'pg', 'paged', 'pagenum', 'page_no', 'pageno', 'pagina', 'seite')
+DEFAULT_PATH_PARAMS = ('page', 'p', 'pg', 'seite', 'pagina')
+
+NEXT_TEXT = re.compile(r'^\s*(next|next page|older|older posts|more|[>»›→]+|next\s*[>»›→]+)\s*$', re.I)
+PATH_PAGE = re.compile(r'/([a-z_-]+)[/-]([0-9]+)/?$', re.I)
+
+# A page number pattern: ("query", parameter name), or ("path", segment name)
+Pattern = Tuple[str, str]
+
+
+def page_number(url: str, pattern: Pattern) -> Optional[int]:
+    """
+    The page number of the URL for the pattern, or None.
+    """
+    return _page_number(urlsplit(url), pattern)
+
+
+def _page_number(parts: SplitResult, pattern: Pattern) -> Optional[int]:
+    kind, name = pattern
+    if kind == 'query':
+        for key, value in parse_qsl(parts.query):
+            if key.lower() == name:
+                return int(value) if value.isdigit() else None
+        return None
+    match = PATH_PAGE.search(parts.path)
+    if match and match.group(1).lower() == name:
+        return int(match.group(2))
+    return None
+
+
+def _strip_page(parts: SplitResult, pattern: Pattern) -> str:
+    """
+    The URL without the page number, to compare the pages of the same listing.
+    """
+    kind, name = pattern
+    if kind == 'query':
+        query = sorted((k, v) for k, v in parse_qsl(parts.query) if k.lower() != name)
+        return f'{parts.netloc}{parts.path}?{query}'
+    return parts.netloc + PATH_PAGE.sub('', parts.path).rstrip('/')
+
+
+class PaginationDetector:
+    """
+    Recognise the pagination links of the discovery pages, to follow the listings to the end,
+    independently of the DEPTH_LIMIT.
+
+    The next pages are found from:
+    * the rel="next" links
+    * the links with a "next" text (eg: "Next", "»", "Older posts")
+    * the numbered links to the page after the current one, using the page number patterns
+        learned for each host (eg: "?page=3", "/page/3/"), or the common ones
+
+    The patterns are learned from the rel="next" and the "next" links.
+    The pagination requests have a high priority and don't increase the depth,
+    but each listing can follow at most PAGINATION_MAX_PAGES pages
+    and each host at most PAGINATION_HOST_BUDGET pagination pages.
+
+    Settings:
+    * PAGINATION_ENABLED: default: False
+    * PAGINATION_MAX_PAGES: the pages followed in one listing; default: 100
+    * PAGINATION_HOST_BUDGET: the pagination pages followed for one host; default: 1000
+    * PAGINATION_PRIORITY: the priority of the pagination requests; default: 100
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.enabled = settings.getbool('PAGINATION_ENABLED', False)
+        self.max_pages = settings.getint('PAGINATION_MAX_PAGES', DEFAULT_MAX_PAGES)
+        self.host_budget = settings.getint('PAGINATION_HOST_BUDGET', DEFAULT_HOST_BUDGET)
+        self.priority = settings.getint('PAGINATION_PRIORITY', DEFAULT_PRIORITY)
+        # Host -> learned page number patterns
+        self.patterns = defaultdict(set)
+        # Host -> pagination pages followed
+        self.pages = defaultdict(int)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def find_next_pages(self, response) -> List[str]:
+        """
+        The URLs of the next pages of a listing page.
+        """
+        host = urlsplit(response.url).netloc.lower()
+        next_urls = []
+        for href in response.xpath('//link[contains(concat(" ", normalize-space(@rel), " "), " next ")]/@href'
+                                   '|//a[contains(concat(" ", normalize-space(@rel), " "), " next ")]/@href').getall():
+            next_urls.append(response.urljoin(strip_html5_whitespace(href)))
+        links = [(response.urljoin(strip_html5_whitespace(a.attrib['href'])),
+                  [' '.join(a.xpath('.//text()').getall()), a.attrib.get('title', ''), a.attrib.get('aria-label', '')])
+                 for a in response.xpath('//a[@href]')]
+        if not next_urls:
+            next_urls = [url for url, texts in links if any(NEXT_TEXT.match(text) for text in texts)]
+        for url in next_urls:
+            self._learn(host, response.url, url)
+        if not next_urls:
+            next_urls = self._numbered_next_pages(host, response.url, [url for url, _ in links])
+
+        # The order is kept, without duplicates, without the current page and without other hosts
+        return [url for url in dict.fromkeys(next_urls)
+                if url != response.url and urlsplit(url).netloc.lower() == host]
+
+    def allow(self, url: str, response) -> bool:
+        """
+        Check the budget for following a pagination link from the response.
+        """
+        if response.meta.get('pagination_page', 0) >= self.max_pages > 0:
+            self.crawler.stats.inc_value('pagination/max_pages')
+            return False
+        host = urlsplit(url).netloc.lower()
+        if self.pages[host] >= self.host_budget > 0:
+            self.crawler.stats.inc_value('pagination/host_budget')
+            return False
+        self.pages[host] += 1
+        self.crawler.stats.inc_value('pagination/pages')
+        return True
+
+    def request_meta(self, response) -> dict:
+        """
+        The meta of a pagination request, followed from the response.
+        """
+        return {'pagination': True, 'pagination_page': response.meta.get('pagination_page', 0) + 1}
+
+    def _learn(self, host: str, url: str, next_url: str):
+        parts, next_parts = urlsplit(url), urlsplit(next_url)
+        for pattern in self._candidate_patterns(host, next_parts):
+            number = _page_number(next_parts, pattern)
+            current = _page_number(parts, pattern) or 1
+            if number and number > current and _strip_page(parts, pattern) == _strip_page(next_parts, pattern):
+                if pattern not in self.patterns[host]:
+                    logger.debug('Learned pagination pattern %s for %s', pattern, host)
+                    self.patterns[host].add(pattern)
+                    self.crawler.stats.inc_value('pagination/learned_patterns')
+                return
+
+    def _candidate_patterns(self, host: str, parts: SplitResult) -> List[Pattern]:
+        patterns = list(self.patterns[host])
+        patterns.extend(('query', key.lower()) for key, _ in parse_qsl(parts.query))
+        match = PATH_PAGE.search(parts.path)
+        if match:
+            patterns.append(('path', match.group(1).lower()))
+        return patterns
+
+    def _numbered_next_pages(self, host: str, url: str, link_urls: List[str]) -> List[str]:
+        patterns = self.patterns[host] or {('query', name) for name in DEFAULT_QUERY_PARAMS} | \
+            {('path', name) for name in DEFAULT_PATH_PARAMS}
+        parts = urlsplit(url)
+        # Only the links to the same path, or to a page number path, can be the next page
+        links = [(link_url, urlsplit(link_url)) for link_url in link_urls]
+        links = [(link_url, link_parts) for link_url, link_parts in links
+                 if link_parts.path == parts.path or PATH_PAGE.search(link_parts.path)]
+        next_urls = []
+        for pattern in patterns:
+            current = _page_number(parts, pattern) or 1
+            base = _strip_page(parts, pattern)
+            for link_url, link_parts in links:
+                if _page_number(link_parts, pattern) == current + 1 and _strip_page(link_parts, pattern) == base:
+                    next_urls.append(link_url)
+        return next_urls
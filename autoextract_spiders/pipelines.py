@@ -0,0 +1,56 @@
+import os
+import logging
+
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import JsonLinesItemExporter
+
+logger = logging.getLogger(__name__)
+
+
+class PageTypeFeedsPipeline:
+    """
+    Write the items of each page type to a separate JSON lines file,
+    when several page types are extracted in the same crawl.
+    The items without a "page_type" field are ignored; they go only to the normal feeds.
+
+    Settings:
+    * PAGE_TYPE_FEEDS_URI: the local path of the files, with "%(page_type)s" in it,
+        and optionally "%(name)s" for the spider name; the pipeline is disabled if it's not set
+        example: output/%(name)s-%(page_type)s.jl
+    """
+
+    def __init__(self, uri: str):
+        if '%(page_type)s' not in uri:
+            raise ValueError('PAGE_TYPE_FEEDS_URI must contain %(page_type)s')
+        self.uri = uri
+        self.files = {}
+        self.exporters = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        uri = crawler.settings.get('PAGE_TYPE_FEEDS_URI')
+        if not uri:
+            raise NotConfigured
+        return cls(uri)
+
+    def process_item(self, item, spider):
+        page_type = item.get('page_type') if isinstance(item, dict) else None
+        if page_type:
+            self._exporter(page_type, spider).export_item(item)
+        return item
+
+    def close_spider(self, spider):
+        for page_type, exporter in self.exporters.items():
+            exporter.finish_exporting()
+            self.files[page_type].close()
+            logger.info('Stored the %s items in %s', page_type, self.files[page_type].name)
+
+    def _exporter(self, page_type: str, spider) -> JsonLinesItemExporter:
+        if page_type not in self.exporters:
+            path = self.uri % {'page_type': page_type, 'name': spider.name}
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.files[page_type] = open(path, 'ab')
+            self.exporters[page_type] = JsonLinesItemExporter(self.files[page_type])
+            self.exporters[page_type].start_exporting()
+        return self.exporters[page_type]
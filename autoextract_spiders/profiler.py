@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from dis import findlinestarts
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_REPORT_INTERVAL = 60.0
+DEFAULT_TOP = 25
+DEFAULT_TRACEMALLOC_FRAMES = 25
+
+# The spider callbacks and the middleware methods the time and the allocations are attributed to
+SPIDER_FUNCTIONS = ('parse_page', 'parse_source', 'parse_feed', 'parse_list', 'parse_item', 'parse_recrawl',
+                    '_requests_to_follow', 'make_extract_request')
+MIDDLEWARE_FUNCTIONS = ('process_request', 'process_response', 'process_exception', 'process_spider_input',
+                        'process_spider_output', 'process_spider_exception', 'process_start_requests',
+                        'process_item')
+OTHER = 'other'
+
+
+def _label(code) -> str:
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+def _frame_name(code, module: str) -> str:
+    return f'{module}:{_label(code)}'
+
+
+def _code_objects(func, name: str):
+    """
+    The code of a function, looking through its decorators:
+    the wrapped functions are in __wrapped__, or in the closure of the wrapper.
+    """
+    func = getattr(func, '__func__', func)
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return
+    if code.co_name == name:
+        yield code
+    wrapped = [getattr(func, '__wrapped__', None)]
+    wrapped.extend(cell.cell_contents for cell in func.__closure__ or () if _is_set(cell))
+    for inner in wrapped:
+        if inner is not func and getattr(inner, '__name__', None) == name:
+            yield from _code_objects(inner, name)
+
+
+def _is_set(cell) -> bool:
+    try:
+        cell.cell_contents
+    except ValueError:
+        return False
+    return True
+
+
+class Profiler:
+    """
+    Extension that profiles a running job, without changing its code:
+    a statistical profiler samples the stack of the crawler thread every PROFILER_SAMPLE_INTERVAL seconds,
+    and tracemalloc tracks the memory allocations.
+
+    The time (samples) and the allocated memory are attributed to the innermost spider callback
+    (eg: parse_page, parse_feed, parse_item, _requests_to_follow), or middleware method
+    (eg: process_request, process_spider_output) found in the stack.
+
+    Every PROFILER_INTERVAL seconds and when the spider is closed, the directory gets:
+    * stacks.folded: the sampled stacks, in the folded format of flamegraph.pl and speedscope
+    * profile.json: the samples, the seconds and the allocated bytes of each callback and middleware
+    * allocations.txt: the top allocation lines, and the top growth since the previous report
+
+    Settings:
+    * PROFILER_DIR: the directory of the reports; the extension is disabled if it's not set
+    * PROFILER_SAMPLE_INTERVAL: default: 0.005 seconds
+    * PROFILER_INTERVAL: how often (in seconds) to write the reports; default: 60
+    * PROFILER_TRACEMALLOC: track the allocations; default: True
+    * PROFILER_TRACEMALLOC_FRAMES: the frames saved for each allocation; default: 25
+    * PROFILER_TOP: the lines in the allocation reports; default: 25
+    """
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.path = path
+        settings = crawler.settings
+        self.sample_interval = settings.getfloat('PROFILER_SAMPLE_INTERVAL', DEFAULT_SAMPLE_INTERVAL)
+        self.interval = settings.getfloat('PROFILER_INTERVAL', DEFAULT_REPORT_INTERVAL)
+        self.trace_allocations = settings.getbool('PROFILER_TRACEMALLOC', True)
+        self.tracemalloc_frames = settings.getint('PROFILER_TRACEMALLOC_FRAMES', DEFAULT_TRACEMALLOC_FRAMES)
+        self.top = settings.getint('PROFILER_TOP', DEFAULT_TOP)
+
+        self.stacks = Counter()
+        self.components = Counter()
+        # The seconds between the samples of each component, measured
+        self.seconds = Counter()
+        self.samples = 0
+        # Code object -> component label, for the tracked functions
+        self.tracked = {}
+        # File name -> [(first line, last line, component label)], for the allocations
+        self.tracked_lines = defaultdict(list)
+        self._frame_names = {}
+        self._lock = threading.Lock()
+        self._thread_id = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._snapshot = None
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('PROFILER_DIR')
+        if not path:
+            raise NotConfigured
+        os.makedirs(path, exist_ok=True)
+        o = cls(crawler, path)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        self.track(spider, SPIDER_FUNCTIONS)
+        for middleware in self._middlewares():
+            self.track(middleware, MIDDLEWARE_FUNCTIONS)
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        # The crawler runs in the reactor thread
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        self._loop = task.LoopingCall(self.report)
+        self._loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self._loop and self._loop.running:
+            self._loop.stop()
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        self.report()
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def track(self, obj, names):
+        """
+        Attribute the time and the allocations of these methods of the object to them.
+        """
+        for name in names:
+            for code in _code_objects(getattr(obj, name, None), name):
+                if code in self.tracked:
+                    continue
+                label = _label(code)
+                self.tracked[code] = label
+                lines = [line for _, line in findlinestarts(code) if line] + [code.co_firstlineno]
+                self.tracked_lines[code.co_filename].append((min(lines), max(lines), label))
+
+    def sample(self, frame, elapsed: float = None):
+        """
+        Count the stack of the frame, for the time elapsed since the previous sample.
+        """
+        stack = []
+        component = None
+        while frame is not None:
+            code = frame.f_code
+            if component is None and code in self.tracked:
+                component = self.tracked[code]
+            name = self._frame_names.get(code)
+            if name is None:
+                name = self._frame_names[code] = _frame_name(code, frame.f_globals.get('__name__', '?'))
+            stack.append(name)
+            frame = frame.f_back
+        stack.reverse()
+        with self._lock:
+            self.stacks[';'.join(stack)] += 1
+            self.components[component or OTHER] += 1
+            self.seconds[component or OTHER] += self.sample_interval if elapsed is None else elapsed
+            self.samples += 1
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(self.sample_interval):
+            # The sampling thread can wait longer than the interval for the GIL
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.sample(frame, now - last)
+            last = now
+            # Don't keep the frame alive, with its locals
+            frame = None
+
+    def report(self):
+        """
+        Write the reports for the samples and the allocations so far.
+        """
+        # The sampling thread keeps counting
+        with self._lock:
+            samples, stacks, components, seconds = \
+                self.samples, self.stacks.copy(), self.components.copy(), self.seconds.copy()
+        stats = self.crawler.stats
+        stats.set_value('profiler/samples', samples)
+        profile = {
+            'samples': samples,
+            'sample_interval': self.sample_interval,
+            'components': {label: {'samples': count,
+                                   'seconds': round(seconds[label], 3),
+                                   'share': round(count / samples, 4)}
+                           for label, count in components.most_common()},
+        }
+        self._write('stacks.folded', ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()))
+        if self.trace_allocations and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            profile['allocations'] = self.attribute_allocations(snapshot)
+            self._write('allocations.txt', self._allocations_report(snapshot))
+            self._snapshot = snapshot
+        self._write('profile.json', json.dumps(profile, indent=2))
+        stats.inc_value('profiler/reports')
+
+    def attribute_allocations(self, snapshot) -> dict:
+        """
+        The bytes allocated by each tracked function (and the functions it calls), still in memory.
+        """
+        allocations = Counter()
+        for stat in snapshot.statistics('traceback'):
+            label = None
+            # From the most recent frame
+            for frame in reversed(stat.traceback):
+                label = self._line_label(frame.filename, frame.lineno)
+                if label:
+                    break
+            allocations[label or OTHER] += stat.size
+        return dict(allocations.most_common())
+
+    def _line_label(self, filename: str, lineno: int):
+        for first, last, label in self.tracked_lines.get(filename, ()):
+            if first <= lineno <= last:
+                return label
+        return None
+
+    def _allocations_report(self, snapshot) -> str:
+        lines = [f'Top {self.top} allocation lines, {time.strftime("%Y-%m-%d %H:%M:%S")}']
+        lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:self.top])
+        if self._snapshot is not None:
+            lines.append('')
+            lines.append(f'Top {self.top} growth since the previous report')
+            lines.extend(str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:self.top])
+        return '\n'.join(lines) + '\n'
+
+    def _middlewares(self):
+        engine = self.crawler.engine
+        if not engine:
+            return []
+        managers = [getattr(engine.downloader, 'middleware', None),
+                    getattr(engine.scraper, 'spidermw', None),
+                    getattr(engine.scraper, 'itemproc', None)]
+        return [mw for manager in managers if manager for mw in manager.middlewares]
+
+    def _write(self, name: str, text: str):
+        fname = os.path.join(self.path, name)
+        with open(fname + '.tmp', 'w') as fd:
+            fd.write(text)
+        os.replace(fname + '.tmp', fname)
@@ -0,0 +1,203 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Optional
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from scrapy import signals
+from scrapy.http import TextResponse
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+# How long an extraction is valid, for each page type (in seconds)
+DEFAULT_TTL = {'article': 30 * DAY, 'product': DAY, 'jobPosting': 7 * DAY}
+DEFAULT_COMMIT_INTERVAL = 1000
+
+FIELDS = ('url', 'page_type', 'hash', 'etag', 'last_modified', 'extracted_at', 'checked_at')
+
+
+def content_hash(response) -> str:
+    """
+    Hash of the visible text of the page, so the changes of the scripts, or the markup don't count.
+    """
+    if not isinstance(response, TextResponse):
+        return hashlib.sha1(response.body).hexdigest()
+    text = response.xpath('//body//text()[not(ancestor::script|ancestor::style|ancestor::noscript)]').getall()
+    return hashlib.sha1(' '.join(' '.join(text).split()).encode('utf8')).hexdigest()
+
+
+class RecrawlStore:
+    """
+    SQLite table with one record for each extracted URL.
+    """
+
+    def __init__(self, path: str, commit_interval: int = DEFAULT_COMMIT_INTERVAL):
+        self.path = path
+        self.commit_interval = commit_interval
+        self._changes = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS records ('
+                        'url TEXT PRIMARY KEY, page_type TEXT, hash TEXT, etag TEXT, last_modified TEXT, '
+                        'extracted_at REAL, checked_at REAL)')
+
+    def get(self, url: str) -> Optional[dict]:
+        row = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM records WHERE url = ?', (url,)).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def upsert(self, url: str, **fields):
+        names = list(fields)
+        self.db.execute(f'INSERT INTO records (url, {", ".join(names)}) VALUES (?{", ?" * len(names)}) '
+                        f'ON CONFLICT(url) DO UPDATE SET {", ".join(f"{n} = excluded.{n}" for n in names)}',
+                        (url, *fields.values()))
+        self._changed()
+
+    def update(self, url: str, **fields) -> bool:
+        """
+        Update the record of a known URL; returns False if the URL is not known.
+        """
+        cursor = self.db.execute(f'UPDATE records SET {", ".join(f"{n} = ?" for n in fields)} WHERE url = ?',
+                                 (*fields.values(), url))
+        self._changed()
+        return cursor.rowcount > 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self.commit_interval:
+            self.db.commit()
+            self._changes = 0
+
+
+class IncrementalRecrawl:
+    """
+    Re-extract only the pages that changed since the last crawl.
+
+    A record is kept for each URL sent to AutoExtract: the hash of the visible text of the page,
+    the ETag and Last-Modified headers, and the last extraction time.
+    On a recrawl, the known URLs are first downloaded as normal pages, with conditional headers,
+    and they are sent to AutoExtract only if the page changed. The URLs extracted longer than
+    the TTL of their page type ago, and the new URLs, are sent to AutoExtract directly.
+    The unchanged URLs are reported in the "unchanged.jl" file of the directory.
+
+    The page hash is saved when the page is downloaded after the extraction, for discovering links.
+    The pages without a hash (eg: from the "items" lists) are extracted again once, on the first recrawl.
+
+    Settings:
+    * RECRAWL_DIR: the directory of the records; the recrawl mode is disabled if it's not set
+    * RECRAWL_TTL: the seconds an extraction is valid, as a number, or a dict for each page type;
+        default: 30 days for articles, 1 day for products, 7 days for job postings
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.path = settings.get('RECRAWL_DIR')
+        self.enabled = bool(self.path)
+        ttl = settings.get('RECRAWL_TTL')
+        # From the command line, the dict is a JSON string
+        if isinstance(ttl, (int, float)) or (isinstance(ttl, str) and not ttl.strip().startswith('{')):
+            self.ttl = {page_type: settings.getfloat('RECRAWL_TTL') for page_type in DEFAULT_TTL}
+        else:
+            self.ttl = dict(DEFAULT_TTL, **settings.getdict('RECRAWL_TTL'))
+        self.store = None
+        self._report = None
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+            self.store = RecrawlStore(os.path.join(self.path, 'records.db'))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_closed(self, spider):
+        if self.store:
+            self.store.close()
+            self.store = None
+        if self._report:
+            self._report.close()
+            self._report = None
+
+    def needs_check(self, url: str, page_type: str) -> bool:
+        """
+        True if the URL was extracted recently, so it must be checked for changes
+        before sending it to AutoExtract again.
+        """
+        if not self.enabled:
+            return False
+        record = self.store.get(url)
+        if not record or not record['extracted_at']:
+            self.crawler.stats.inc_value('recrawl/new')
+            return False
+        if time.time() - record['extracted_at'] >= self.ttl.get(page_type, 0):
+            self.crawler.stats.inc_value('recrawl/expired')
+            return False
+        self.crawler.stats.inc_value('recrawl/checked')
+        return True
+
+    def conditional_headers(self, url: str) -> dict:
+        record = self.store.get(url) or {}
+        headers = {}
+        if record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+        return headers
+
+    def is_changed(self, url: str, response) -> bool:
+        """
+        Check the page downloaded for a known URL; the unchanged URLs are reported.
+        """
+        record = self.store.get(url) or {}
+        now = time.time()
+        if response.status == 304:
+            changed = False
+            self.store.update(url, checked_at=now)
+        else:
+            page_hash = content_hash(response)
+            changed = not record.get('hash') or record['hash'] != page_hash
+            self.store.update(url, checked_at=now, hash=page_hash, **self._validators(response))
+        if changed:
+            self.crawler.stats.inc_value('recrawl/changed')
+        else:
+            self.crawler.stats.inc_value('recrawl/unchanged')
+            self._report_unchanged(url, record, now)
+        return changed
+
+    def record_extraction(self, url: str, page_type: str):
+        if self.enabled:
+            self.store.upsert(url, page_type=page_type, extracted_at=time.time())
+
+    def record_page(self, response):
+        """
+        Save the hash and the validators of a downloaded page, if it was extracted.
+        """
+        if self.enabled and response.status == 200 and self.store.get(response.url):
+            self.store.update(response.url, hash=content_hash(response), **self._validators(response))
+
+    @staticmethod
+    def _validators(response) -> dict:
+        return {
+            'etag': (response.headers.get('ETag') or b'').decode('latin1') or None,
+            'last_modified': (response.headers.get('Last-Modified') or b'').decode('latin1') or None,
+        }
+
+    def _report_unchanged(self, url: str, record: dict, now: float):
+        if not self._report:
+            self._report = open(os.path.join(self.path, 'unchanged.jl'), 'a')
+        self._report.write(json.dumps({
+            'url': url,
+            'page_type': record.get('page_type'),
+            'extracted_at': record.get('extracted_at'),
+            'checked_at': now,
+        }) + '\n')
@@ -0,0 +1,221 @@
+import time
+import socket
+import logging
+from collections import OrderedDict, deque, Counter
+from ipaddress import ip_address
+from typing import Callable, Iterable, Optional
+
+from twisted.internet import defer
+from twisted.internet.error import DNSLookupError
+from twisted.internet.interfaces import IResolverSimple
+from twisted.names import client, dns, hosts, resolve
+from twisted.names.error import DNSNameError
+from zope.interface import implementer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 100000
+DEFAULT_MIN_TTL = 60
+DEFAULT_MAX_TTL = 86400
+DEFAULT_NEGATIVE_TTL = 600
+DEFAULT_TIMEOUT = 10
+DEFAULT_PREWARM_CONCURRENCY = 100
+# The CNAME records followed when the server didn't resolve them
+MAX_CNAME_DEPTH = 5
+
+
+@implementer(IResolverSimple)
+class AsyncCachingResolver:
+    """
+    DNS resolver for the broad crawls, replacing the Scrapy resolver (a thread pool with a small cache):
+    the DNS queries are sent asynchronously, the results are cached for their TTL
+    (between DNS_MIN_TTL and DNS_MAX_TTL seconds) and the hosts that don't exist (NXDOMAIN)
+    are also cached, for DNS_NEGATIVE_TTL seconds. The CNAME records are followed, and a host
+    without an IPv4 address is looked up for an IPv6 address; the errors and the hosts without
+    any address are not cached. Up to DNSCACHE_SIZE hosts are kept, the least recently used are evicted first.
+
+    The hosts of the seeds are resolved in advance, DNS_PREWARM_CONCURRENCY at a time, as the seeds
+    are read, so their requests don't wait for the DNS, and the seeds of the dead domains
+    can be dropped before being crawled (see the SeedFeeder).
+
+    Enable it with DNS_RESOLVER = 'autoextract_spiders.resolver.AsyncCachingResolver'.
+    The DNS servers are the DNS_SERVERS (eg: ["8.8.8.8", "1.1.1.1:53"]), or the ones of /etc/resolv.conf;
+    the /etc/hosts file is checked first.
+    """
+
+    def __init__(self, reactor, settings, resolver=None):
+        self.reactor = reactor
+        self.cache_size = settings.getint('DNSCACHE_SIZE', DEFAULT_CACHE_SIZE)
+        self.min_ttl = settings.getint('DNS_MIN_TTL', DEFAULT_MIN_TTL)
+        self.max_ttl = settings.getint('DNS_MAX_TTL', DEFAULT_MAX_TTL)
+        self.negative_ttl = settings.getint('DNS_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)
+        self.timeout = settings.getfloat('DNS_TIMEOUT', DEFAULT_TIMEOUT)
+        self.prewarm_concurrency = settings.getint('DNS_PREWARM_CONCURRENCY', DEFAULT_PREWARM_CONCURRENCY)
+        if resolver is None:
+            servers = [_parse_server(s) for s in settings.getlist('DNS_SERVERS')]
+            resolver = resolve.ResolverChain([
+                hosts.Resolver(settings.get('DNS_HOSTS_FILE', '/etc/hosts')),
+                client.Resolver(resolv=None if servers else '/etc/resolv.conf', servers=servers or None,
+                                reactor=reactor)])
+        self.resolver = resolver
+        # Host -> (IP address, or None if the host doesn't exist; expiration time)
+        self.cache = OrderedDict()
+        self.counts = Counter()
+        self._waiting = {}
+        self._prewarm = deque()
+        self._prewarming = 0
+        self._on_resolved = None
+
+    @classmethod
+    def from_crawler(cls, crawler, reactor):
+        return cls(reactor, crawler.settings)
+
+    def install_on_reactor(self):
+        self.reactor.installResolver(self)
+
+    def getHostByName(self, name: str, timeout=None) -> defer.Deferred:
+        if _is_ip(name):
+            return defer.succeed(name)
+        name = name.lower()
+        cached = self.cache.get(name)
+        if cached is not None:
+            address, expires = cached
+            if expires > time.time():
+                self.cache.move_to_end(name)
+                if address is None:
+                    self.counts['negative_hits'] += 1
+                    return defer.fail(DNSLookupError(name))
+                self.counts['hits'] += 1
+                return defer.succeed(address)
+            del self.cache[name]
+        d = defer.Deferred()
+        self._resolve(name).addCallbacks(d.callback, d.errback)
+        return d
+
+    def status(self, name: str) -> Optional[bool]:
+        """
+        True if the host was resolved, False if it doesn't exist, None if it's not known (yet).
+        """
+        cached = self.cache.get(name.lower())
+        if cached is None or cached[1] <= time.time():
+            return None
+        return cached[0] is not None
+
+    def is_resolving(self, name: str) -> bool:
+        return name.lower() in self._waiting
+
+    def prewarm(self, names: Iterable[str], on_resolved: Callable = None):
+        """
+        Resolve the hosts in the background, in order, without waiting for the results.
+        on_resolved(host) is called after each host is resolved.
+        """
+        if on_resolved is not None:
+            self._on_resolved = on_resolved
+        for name in names:
+            name = name.lower()
+            if not _is_ip(name) and self.status(name) is None and name not in self._waiting:
+                # Marked as waiting, so it's not crawled before being resolved
+                self._waiting[name] = []
+                self._prewarm.append(name)
+        self._next_prewarm()
+
+    def _next_prewarm(self):
+        while self._prewarm and self._prewarming < self.prewarm_concurrency:
+            name = self._prewarm.popleft()
+            self._prewarming += 1
+            self.counts['prewarmed'] += 1
+            self._lookup(name).addBoth(self._prewarmed, name)
+
+    def _prewarmed(self, result, name):
+        self._prewarming -= 1
+        if self._on_resolved is not None:
+            self._on_resolved(name)
+        self._next_prewarm()
+
+    def _resolve(self, name: str) -> defer.Deferred:
+        """
+        One lookup for each host, shared by the concurrent requests.
+        """
+        d = defer.Deferred()
+        if name in self._waiting:
+            self._waiting[name].append(d)
+            # The prewarmed hosts are looked up in order; a request doesn't wait for its turn
+            if name in self._prewarm:
+                self._prewarm.remove(name)
+                self._prewarming += 1
+                self._lookup(name).addBoth(self._prewarmed, name)
+        else:
+            self._waiting[name] = [d]
+            self._lookup(name)
+        return d
+
+    def _lookup(self, name: str) -> defer.Deferred:
+        self.counts['lookups'] += 1
+        return self._query(name, name)
+
+    def _query(self, name: str, target: str, ipv6: bool = False, depth: int = 0) -> defer.Deferred:
+        """
+        Look up the address of the target: the host itself, or the canonical name of its CNAME record.
+        """
+        lookup = self.resolver.lookupIPV6Address if ipv6 else self.resolver.lookupAddress
+        d = lookup(target, timeout=(self.timeout,))
+        d.addCallbacks(self._resolved, self._failed, callbackArgs=(name, ipv6, depth), errbackArgs=(name,))
+        return d
+
+    def _resolved(self, result, name: str, ipv6: bool = False, depth: int = 0):
+        answers = result[0]
+        records = [r for r in answers if r.type == (dns.AAAA if ipv6 else dns.A)]
+        if not records:
+            # The host exists: follow its CNAME, or look for an IPv6 address
+            cname = next((r.payload.name for r in answers if r.type == dns.CNAME), None)
+            if cname is not None and depth < MAX_CNAME_DEPTH:
+                return self._query(name, str(cname), ipv6, depth + 1)
+            if not ipv6:
+                return self._query(name, name, ipv6=True)
+            return self._failed(None, name)
+        ttl = min(max(min(r.ttl for r in records), self.min_ttl), self.max_ttl)
+        if ipv6:
+            address = socket.inet_ntop(socket.AF_INET6, records[0].payload.address)
+            self.counts['ipv6'] += 1
+        else:
+            address = records[0].payload.dottedQuad()
+        self._store(name, address, ttl)
+        for d in self._waiting.pop(name, ()):
+            d.callback(address)
+        return address
+
+    def _failed(self, failure, name: str):
+        if failure is not None and failure.check(DNSNameError):
+            # The host doesn't exist
+            self._store(name, None, self.negative_ttl)
+            self.counts['not_found'] += 1
+        elif failure is None:
+            # The host has no address (yet); tried again on the next request
+            self.counts['no_address'] += 1
+            logger.debug('No address for %s', name)
+        else:
+            # A timeout, or a failing server; tried again on the next request
+            self.counts['errors'] += 1
+            logger.debug('DNS lookup failed for %s: %s', name, failure.getErrorMessage())
+        for d in self._waiting.pop(name, ()):
+            d.errback(DNSLookupError(name))
+        return None
+
+    def _store(self, name: str, address: Optional[str], ttl: int):
+        self.cache[name] = (address, time.time() + ttl)
+        self.cache.move_to_end(name)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+def _is_ip(name: str) -> bool:
+    try:
+        ip_address(name)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_server(server: str):
+    host, _, port = server.partition(':')
+    return host, int(port or 53)
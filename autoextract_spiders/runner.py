@@ -0,0 +1,250 @@
+"""
+Run one of the spiders split into several worker processes.
+
+The seeds, or the items are partitioned by host, so every host lives in exactly
+one shard. This way the per-host count limits ("page_host_count" and "item_host_count")
+still hold, while the global limits ("page_count" and "item_count") are split between
+the shards by their share of the URLs. The link extraction, feed parsing and JSON decoding are spread
+are spread across multiple cores. The stats and the items from all the shards are merged at the end.
+
+Example:
+> shard_runner.py articles --shards 4 --seeds-file seeds.txt -o articles.jl -s AUTOEXTRACT_USER=<key>
+"""
+import os
+import math
+import zlib
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from typing import Dict, Iterable, List
+from urllib.parse import urlsplit
+
+from scrapy.utils.misc import arg_to_iter
+
+from .spiders.args import SpiderArgs, load_yaml
+from .spiders.crawler_spider import DEFAULT_COUNT_LIMITS
+from .spiders.util import is_valid_url, load_sources
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKDIR = '.shards'
+
+
+def host_shard(url: str, shards: int) -> int:
+    """
+    Stable shard number for the host of the URL.
+    The same host always ends up in the same shard, in any process.
+    """
+    host = urlsplit(url).netloc.lower()
+    return zlib.crc32(host.encode('utf8')) % shards
+
+
+def partition_urls(urls: Iterable[str], shards: int) -> List[List[str]]:
+    """
+    Split the URLs by host into the given number of shards.
+    """
+    partitions = [[] for _ in range(shards)]
+    for url in urls:
+        url = url.strip()
+        if not is_valid_url(url):
+            logger.warning('Ignoring invalid URL: %s', url)
+            continue
+        partitions[host_shard(url, shards)].append(url)
+    return partitions
+
+
+def merge_stats(all_stats: List[Dict]) -> Dict:
+    """
+    Merge the stats collected by all the shards.
+    Numbers are added, the start time is the earliest and the finish time is the latest.
+    """
+    merged = {}
+    for stats in all_stats:
+        for key, value in stats.items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, datetime):
+                if key == 'start_time':
+                    merged[key] = min(merged[key], value)
+                else:
+                    merged[key] = max(merged[key], value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] += value
+            elif merged[key] != value:
+                values = set(str(merged[key]).split(','))
+                values.add(str(value))
+                merged[key] = ','.join(sorted(values))
+    merged['shards/count'] = len(all_stats)
+    return merged
+
+
+def merge_outputs(paths: List[str], output: str):
+    """
+    Concatenate the JSON lines outputs of all the shards.
+    """
+    with open(output, 'wb') as out:
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as fd:
+                for line in fd:
+                    out.write(line)
+
+
+def shard_settings(settings: Dict, n: int) -> Dict:
+    """
+    The settings of the shard number n.
+    Every shard has its own JOBDIR and CHECKPOINT_DIR sub-folder, because the
+    saved crawl state (queue, fingerprints, counters and seeds) belongs to one shard.
+    """
+    settings = dict(settings)
+    for name in ('JOBDIR', 'CHECKPOINT_DIR'):
+        if settings.get(name):
+            settings[name] = os.path.join(settings[name], f'shard-{n}')
+    return settings
+
+
+def global_count_limits(spider_args: Dict, seeds: int) -> Dict:
+    """
+    The count limits of the whole crawl, the same way the spider derives them
+    from "count-limits", "max-pages" and "max-items", for the given number of seeds.
+    """
+    args = SpiderArgs(spider_args)
+    limits = dict(args.count_limits or DEFAULT_COUNT_LIMITS)
+    for kind, value in (('page', args.max_pages), ('item', args.max_items)):
+        if value:
+            limits[f'{kind}_host_count'] = value
+            limits[f'{kind}_count'] = value * (seeds or 1) * 2
+    return limits
+
+
+def shard_args(spider_args: Dict, limits: Dict, share: float) -> Dict:
+    """
+    The spider args of a shard with the given share of the URLs.
+    The global count limits are split between the shards, otherwise every shard
+    would stop only at the limit of the whole crawl; the per-host limits are kept.
+    The limits are passed as "count-limits", because "max-pages" and "max-items"
+    would derive the global limits again.
+    """
+    args = {k: v for k, v in spider_args.items()
+            if k.replace('-', '_') not in ('count_limits', 'max_pages', 'max_items')}
+    args['count-limits'] = {
+        key: value if key.endswith('_host_count') or value <= 0 else math.ceil(value * share)
+        for key, value in limits.items()
+    }
+    return args
+
+
+def _run_shard(spider_name: str, spider_args: Dict, settings: Dict, output: str) -> Dict:
+    """
+    Run the spider in the current process and return its stats.
+    Called in a fresh worker process, because the Twisted reactor can't be restarted.
+    """
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    project_settings = get_project_settings()
+    project_settings.setdict(settings, priority='cmdline')
+    project_settings.set('FEEDS', {output: {'format': 'jsonlines'}}, priority='cmdline')
+    process = CrawlerProcess(project_settings)
+    crawler = process.create_crawler(spider_name)
+    process.crawl(crawler, **spider_args)
+    process.start()
+    return crawler.stats.get_stats()
+
+
+def run_sharded(spider_name: str,
+                shards: int,
+                seeds: Iterable[str] = None,
+                items: Iterable[str] = None,
+                output: str = None,
+                workdir: str = DEFAULT_WORKDIR,
+                spider_args: Dict = None,
+                settings: Dict = None) -> Dict:
+    """
+    Partition the seeds, or the items by host and run one spider process per shard.
+    Returns the merged stats.
+    """
+    if shards < 1:
+        raise ValueError('The number of shards must be at least 1')
+    os.makedirs(workdir, exist_ok=True)
+    settings = dict(settings or {})
+    # Frontera would share one consumer slot between all the shards
+    settings.setdefault('FRONTERA_DISABLED', True)
+
+    seed_parts = partition_urls(seeds or [], shards)
+    item_parts = partition_urls(items or [], shards)
+    total = sum(map(len, seed_parts)) + sum(map(len, item_parts))
+    limits = global_count_limits(spider_args or {}, sum(map(len, seed_parts)))
+
+    tasks = []
+    outputs = []
+    for n in range(shards):
+        if not seed_parts[n] and not item_parts[n]:
+            continue
+        args = shard_args(spider_args or {}, limits, (len(seed_parts[n]) + len(item_parts[n])) / total)
+        if seed_parts[n]:
+            args['seeds'] = seed_parts[n]
+        if item_parts[n]:
+            items_file = os.path.join(workdir, f'items-{n}.txt')
+            with open(items_file, 'w') as fd:
+                fd.write('\n'.join(item_parts[n]))
+            args['items'] = items_file
+        shard_output = os.path.join(workdir, f'output-{n}.jl')
+        outputs.append(shard_output)
+        tasks.append((spider_name, args, shard_settings(settings, n), shard_output))
+
+    logger.info('Running %d shards of the "%s" spider', len(tasks), spider_name)
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(processes=len(tasks) or 1, maxtasksperchild=1) as pool:
+        all_stats = pool.starmap(_run_shard, tasks)
+
+    if output:
+        merge_outputs(outputs, output)
+    return merge_stats(all_stats)
+
+
+def _parse_key_values(values: List[str]) -> Dict:
+    result = {}
+    for value in values or ():
+        key, _, val = value.partition('=')
+        result[key] = val
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a spider sharded by host across multiple processes.')
+    parser.add_argument('spider', help='The spider name, eg: articles')
+    parser.add_argument('--shards', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of worker processes. Default: the number of CPUs')
+    parser.add_argument('--seeds', help='One, or more seed URLs, as YAML, or JSON list')
+    parser.add_argument('--seeds-file', help='A file, or URL with a list of seed URLs')
+    parser.add_argument('--items', help='A file, or URL with a list of item URLs')
+    parser.add_argument('-o', '--output', help='Merged JSON lines output file')
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help='Directory for the shard files')
+    parser.add_argument('-a', dest='spider_args', action='append', default=[], metavar='NAME=VALUE',
+                        help='Spider argument, can be repeated')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='Scrapy setting, can be repeated')
+    args = parser.parse_args()
+
+    seeds = []
+    if args.seeds:
+        seeds.extend(arg_to_iter(load_yaml(args.seeds)))
+    if args.seeds_file:
+        seeds.extend(load_sources(args.seeds_file))
+    items = list(load_sources(args.items)) if args.items else []
+    if not seeds and not items:
+        parser.error('Either the seeds, or the items are required')
+
+    stats = run_sharded(args.spider,
+                        args.shards,
+                        seeds=seeds,
+                        items=items,
+                        output=args.output,
+                        workdir=args.workdir,
+                        spider_args=_parse_key_values(args.spider_args),
+                        settings=_parse_key_values(args.settings))
+    for key in sorted(stats):
+        print(f'{key}: {stats[key]}')
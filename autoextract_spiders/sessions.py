@@ -1,5 +1,13 @@
+import logging
+from typing import Optional
 
 from crawlera_session import RequestSession as _Session
+from scrapy import signals
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import Deferred
+
+logger = logging.getLogger(__name__)
 
 
 def update_redirect_middleware(settings):
@@ -30,3 +38,176 @@ class RequestSession(_Session):
 
 
 crawlera_session = RequestSession(x_crawlera_profile='desktop')
+
+
+# Crawlera errors after which a session can't be used anymore
+RETIRED_SESSION_ERRORS = {b'banned', b'bad_session_id', b'slavebanned'}
+
+
+class PooledSession:
+    __slots__ = ('id', 'inflight', 'requests', 'failures', 'latency')
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency = 0.0
+
+    def record(self, ok: bool, latency: float):
+        self.requests += 1
+        if not ok:
+            self.failures += 1
+        self.latency = 0.8 * self.latency + 0.2 * latency if self.latency else latency
+
+
+class HostSessions:
+    """
+    The warm Crawlera sessions of a host, the sessions being created,
+    and the requests waiting for the first sessions.
+    """
+    __slots__ = ('sessions', 'creating', 'size', 'waiting')
+
+    def __init__(self, size: int):
+        self.sessions = {}
+        self.creating = 0
+        self.size = size
+        self.waiting = []
+
+    @property
+    def full(self) -> bool:
+        return len(self.sessions) + self.creating >= self.size
+
+    def choose(self) -> Optional[PooledSession]:
+        """
+        The least busy, then the fastest session; None if there's no session,
+        or if all of them are busy and a new session can be created.
+        """
+        best = min(self.sessions.values(), key=lambda s: (s.inflight, s.latency), default=None)
+        if best is None or best.inflight and not self.full:
+            return None
+        return best
+
+
+class CrawleraSessionPool:
+    """
+    Spread the Crawlera session requests of each host over CRAWLERA_SESSION_POOL_SIZE warm sessions,
+    instead of one session for each seed, so the discovery of a large website runs in parallel.
+
+    The session chosen by the "crawlera_session" decorators is replaced when the request is downloaded,
+    by the least busy session of the host; a new session is created while all of them are busy
+    and the pool is not full (counting the sessions being created). The first requests of a host wait
+    for its first sessions, when the pool is full of sessions being created. The banned sessions
+    are retired and their requests are retried with another session. The success and the latency
+    of each session are kept, the fastest sessions are preferred and the totals are in the
+    "crawlera_pool/" stats.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.size = crawler.settings.getint('CRAWLERA_SESSION_POOL_SIZE')
+        self.enabled = crawler.settings.getbool('CRAWLERA_ENABLED') and self.size > 0
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_closed(self, spider):
+        for host, pool in self.hosts.items():
+            for session in pool.sessions.values():
+                logger.debug('Crawlera session %s of %s: %d requests, %d failed, latency %.2fs', session.id,
+                             host, session.requests, session.failures, session.latency)
+        self.stats.set_value('crawlera_pool/sessions/active', sum(len(p.sessions) for p in self.hosts.values()))
+
+    def process_request(self, request, spider):
+        if not self.enabled or 'X-Crawlera-Session' not in request.headers \
+                or request.meta.get('no_crawlera_session'):
+            return None
+        # The redirects and the retries get a session again
+        host = urlparse_cached(request).netloc
+        pool = self.hosts.get(host)
+        if pool is None:
+            pool = self.hosts[host] = HostSessions(self.size)
+        session = pool.choose()
+        if session is None and pool.full:
+            # All the sessions are being created
+            waiting = Deferred()
+            waiting.addCallback(lambda _: self.process_request(request, spider))
+            pool.waiting.append(waiting)
+            self.stats.inc_value('crawlera_pool/waiting')
+            return waiting
+        if session is None:
+            pool.creating += 1
+            request.headers['X-Crawlera-Session'] = 'create'
+            request.meta['_pool_session'] = None
+        else:
+            session.inflight += 1
+            request.headers['X-Crawlera-Session'] = session.id
+            request.meta['_pool_session'] = session.id
+        self.stats.inc_value('crawlera_pool/requests')
+        return None
+
+    def process_response(self, request, response, spider):
+        if '_pool_session' not in request.meta:
+            return response
+        pool = self.hosts[urlparse_cached(request).netloc]
+        session = self._release(pool, request)
+        if request.meta['_pool_session'] is None:
+            session_id = response.headers.get('X-Crawlera-Session')
+            if session_id:
+                session = pool.sessions[session_id.decode()] = PooledSession(session_id.decode())
+                self.stats.inc_value('crawlera_pool/sessions/created')
+            self._wake(pool)
+            if not session_id:
+                return response
+        error = response.headers.get('X-Crawlera-Error')
+        # None if the session was already retired, by another request
+        if session is not None:
+            session.record(response.status < 400, request.meta.get('download_latency') or 0.0)
+        if error in RETIRED_SESSION_ERRORS:
+            if session is not None:
+                del pool.sessions[session.id]
+                self.stats.inc_value('crawlera_pool/sessions/retired')
+            retry_request = get_retry_request(request, spider=spider, reason=f'crawlera_{error.decode()}',
+                                              stats_base_key='crawlera_pool/retry')
+            if retry_request is not None:
+                return retry_request
+        elif error == b'user_session_limit':
+            # No more sessions for this account
+            pool.size = max(len(pool.sessions), 1)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if '_pool_session' in request.meta:
+            pool = self.hosts[urlparse_cached(request).netloc]
+            session = self._release(pool, request)
+            if session is not None:
+                session.record(False, request.meta.get('download_latency') or 0.0)
+            elif request.meta['_pool_session'] is None:
+                # The session wasn't created, one of the waiting requests creates it
+                self._wake(pool)
+        return None
+
+    @staticmethod
+    def _wake(pool: HostSessions):
+        """
+        Choose the session of the requests waiting for the first sessions again.
+        """
+        waiting, pool.waiting = pool.waiting, []
+        for d in waiting:
+            d.callback(None)
+
+    @staticmethod
+    def _release(pool: HostSessions, request) -> Optional[PooledSession]:
+        session_id = request.meta['_pool_session']
+        if session_id is None:
+            pool.creating -= 1
+            return None
+        session = pool.sessions.get(session_id)
+        if session is not None:
+            session.inflight -= 1
+        return session
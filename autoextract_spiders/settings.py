@@ -25,6 +25,57 @@ CONCURRENT_REQUESTS = 16
 DEPTH_LIMIT = 2
 DEPTH_STATS_VERBOSE = True
 
+# Seed feeder: how many seed hosts are crawled at the same time,
+# and how many requests can be queued before admitting new seeds
+SEED_FEEDER_MAX_ACTIVE_HOSTS = 100
+SEED_FEEDER_MAX_QUEUED = 1000
+
+# Async DNS, with the seed hosts resolved in advance and the dead domains dropped, for the broad crawls:
+# DNS_RESOLVER = 'autoextract_spiders.resolver.AsyncCachingResolver'
+DNS_SERVERS = []
+DNS_MIN_TTL = 60
+DNS_MAX_TTL = 86400
+DNS_NEGATIVE_TTL = 600
+DNS_PREWARM_CONCURRENCY = 100
+
+# Spend governor: stop, or throttle the AutoExtract calls for the hosts
+# that rarely return an item above the threshold
+SPEND_GOVERNOR_ENABLED = False
+
+# Check the schema.org markup of the discovered pages before sending them to AutoExtract,
+# and optionally emit the items directly from the markup
+STRUCTURED_DATA_ENABLED = False
+STRUCTURED_DATA_ITEMS = False
+
+# Follow the pagination of the listing pages, independently of the DEPTH_LIMIT
+PAGINATION_ENABLED = False
+PAGINATION_MAX_PAGES = 100
+PAGINATION_HOST_BUDGET = 1000
+
+# Incremental recrawl: re-extract only the changed pages, when RECRAWL_DIR is set
+# RECRAWL_TTL = {'article': 2592000, 'product': 86400, 'jobPosting': 604800}
+
+# Remember the feeds of the article seeds between the runs, when FEED_CACHE_DIR is set
+FEED_CACHE_TTL = 604800
+
+# Discovery and extraction in separate jobs ("handoff" spider argument),
+# through a queue of candidate item URLs in HANDOFF_DIR
+HANDOFF_BATCH_SIZE = 1000
+HANDOFF_LEASE = 3600
+HANDOFF_MAX_ATTEMPTS = 3
+
+# Stop downloading the discovery pages after DISCOVERY_MAX_BYTES,
+# or after the head, if it has feed links (article sources)
+DISCOVERY_STREAMING_ENABLED = False
+DISCOVERY_MAX_BYTES = 1048576
+DISCOVERY_HEAD_ONLY = False
+
+# Exact per host counts for "count-limits" only for the top COUNT_FILTER_MAX_HOSTS hosts,
+# estimated for the others in a fixed amount of memory (0: all exact)
+COUNT_FILTER_MAX_HOSTS = 0
+COUNT_FILTER_ERROR = 0.00001
+COUNT_FILTER_CONFIDENCE = 0.99
+
 # Disable AutoThrottle middleware
 AUTHTHROTTLE_ENABLED = False
 
@@ -32,6 +83,19 @@ AUTHTHROTTLE_ENABLED = False
 RETRY_TIMES = 2
 RETRY_HTTP_CODES = [429]
 
+# Pause the failing, or very slow hosts and delay the retries, without holding download slots
+HOST_BREAKER_ENABLED = False
+HOST_BREAKER_WINDOW = 20
+HOST_BREAKER_MIN_REQUESTS = 10
+HOST_BREAKER_ERROR_RATE = 0.5
+HOST_BREAKER_SLOW = 30
+HOST_BREAKER_OPEN_TIME = 60
+HOST_BREAKER_MAX_OPEN_TIME = 1800
+HOST_BREAKER_PROBE_TIMEOUT = 900
+RETRY_DELAY = 5
+AUTOEXTRACT_RETRY_DELAY = 10
+AUTOEXTRACT_RETRY_TIMES = 5
+
 # More spam from Link Filter Middleware
 # LINK_FILTER_MIDDLEWARE_DEBUG = True
 
@@ -44,12 +108,24 @@ SCHEDULER_PRIORITY_QUEUE = 'scrapy.pqueues.DownloaderAwarePriorityQueue'
 
 # Breadth-first order
 DEPTH_PRIORITY = 1
-SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleFifoDiskQueue'
+# Compact records instead of pickle, when JOBDIR is set
+SCHEDULER_DISK_QUEUE = 'autoextract_spiders.squeues.CompactFifoDiskQueue'
+COMPACT_QUEUE_COMPRESSION = False
 SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.FifoMemoryQueue'
+# Keep the queued requests in memory as compact records (less memory, more CPU)
+COMPACT_MEMORY_QUEUE = False
 
 SPIDER_MIDDLEWARES = {
+    # The pagination requests don't increase the depth
+    'scrapy.spidermiddlewares.depth.DepthMiddleware': None,
+    'autoextract_spiders.middlewares.DepthMiddleware': 900,
+    # The seed hosts are checked in a hashed set, instead of a regex
+    'scrapy.spidermiddlewares.offsite.OffsiteMiddleware': None,
+    'autoextract_spiders.offsite.OffsiteMiddleware': 500,
     'scrapy_link_filter.middleware.LinkFilterMiddleware': 950,
     'autoextract_spiders.middlewares.SchedulerSpiderMiddleware': 0,
+    # The seed hosts stay active until the output of their responses is processed
+    'autoextract_spiders.feeder.SeedFeederMiddleware': 50,
 }
 
 # Enable or disable downloader middlewares
@@ -58,14 +134,45 @@ DOWNLOADER_MIDDLEWARES = {
     'autoextract_spiders.middlewares.SchedulerDownloaderMiddleware': 0,
     'scrapy_crawlera.CrawleraMiddleware': 300,
     'scrapy_count_filter.middleware.GlobalCountFilterMiddleware': 541,
-    'scrapy_count_filter.middleware.HostsCountFilterMiddleware': 542,
-    'scrapy_autoextract.middlewares.AutoExtractMiddleware': 543,
+    # The per host counts can be approximate, with COUNT_FILTER_MAX_HOSTS
+    'scrapy_count_filter.middleware.HostsCountFilterMiddleware': None,
+    'autoextract_spiders.counters.HostsCountFilterMiddleware': 542,
+    # Decodes only the fields that are used, with AUTOEXTRACT_LEAN_DECODING
+    'scrapy_autoextract.middlewares.AutoExtractMiddleware': None,
+    'autoextract_spiders.decoding.LeanAutoExtractMiddleware': 543,
+    # Delayed retries and per host circuit breakers, with HOST_BREAKER_ENABLED
+    'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+    'autoextract_spiders.breaker.CircuitBreakerMiddleware': 550,
+    # After the redirects and the retries, so each response releases its session
+    'autoextract_spiders.sessions.CrawleraSessionPool': 650,
+}
+
+# Split the items of each page type into separate files, when PAGE_TYPE_FEEDS_URI is set
+ITEM_PIPELINES = {
+    'autoextract_spiders.pipelines.PageTypeFeedsPipeline': 800,
+}
+
+# Save the crawl state periodically when CHECKPOINT_DIR is set, to resume it later
+# Profile the job (stack samples and allocations) when PROFILER_DIR is set
+EXTENSIONS = {
+    'autoextract_spiders.checkpoint.Checkpoint': 100,
+    'autoextract_spiders.profiler.Profiler': 200,
 }
+CHECKPOINT_INTERVAL = 60
 
 # Custom filter to allow fingerprinting prefix customization
 DUPEFILTER_CLASS = 'autoextract_spiders.dupe_filter.DupeFilter'
 
 AUTOEXTRACT_USER = '[API key]'
+# Decode the AutoExtract responses with a fast JSON parser, keeping only the AUTOEXTRACT_FIELDS of each page type
+AUTOEXTRACT_LEAN_DECODING = False
+# AUTOEXTRACT_FIELDS = {'article': ['headline', 'articleBody', 'datePublished', 'author', 'mainImage']}
+# Send the AutoExtract requests over a few multiplexed HTTP/2 connections
+AUTOEXTRACT_HTTP2_ENABLED = False
+AUTOEXTRACT_HTTP2_MAX_CONNECTIONS = 2
+AUTOEXTRACT_HTTP2_MAX_STREAMS = 100
 
 CRAWLERA_ENABLED = False
 CRAWLERA_APIKEY = '[API key]'
+# Warm Crawlera sessions per host, for parallel discovery (0: one session for each seed)
+CRAWLERA_SESSION_POOL_SIZE = 0
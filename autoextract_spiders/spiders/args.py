@@ -0,0 +1,132 @@
+import os
+from functools import cached_property
+from typing import Any, List, Optional
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from scrapy.utils.misc import arg_to_iter
+
+_YAML_LOADER = None
+
+
+def load_yaml(value: Any) -> Any:
+    """
+    Parse a YAML (or JSON) argument; the values that are not strings are returned as they are.
+    The JSON values are parsed without YAML, then the C YAML loader is used, when available.
+    """
+    global _YAML_LOADER
+    if not isinstance(value, str):
+        return value
+    if value[:1] in ('{', '[', '"') or value in ('true', 'false', 'null') or value.isdigit():
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    import yaml
+    if _YAML_LOADER is None:
+        _YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(value, Loader=_YAML_LOADER)
+
+
+class SpiderArgs:
+    """
+    The spider arguments, with "-" and "_" as the same character in the names (eg: "page-type"
+    and "page_type"), parsed once into typed values. Each value is parsed when it's first used,
+    and an invalid value raises ValueError.
+    """
+
+    def __init__(self, spider_args: dict):
+        self._args = {k.replace('-', '_'): v for k, v in spider_args.items()}
+
+    def get(self, key: str, default=None):
+        return self._args.get(key.replace('-', '_'), default)
+
+    def _yaml(self, key: str, name: str = None) -> Any:
+        value = self._args.get(key)
+        if not value:
+            return None
+        try:
+            return load_yaml(value)
+        except Exception as err:
+            raise ValueError(f'Invalid {name or key.replace("_", "-")}: {value} {err}')
+
+    def _int(self, key: str) -> Optional[int]:
+        value = self._args.get(key)
+        return int(value) if value else None
+
+    @cached_property
+    def discovery_only(self) -> Optional[bool]:
+        return self._yaml('discovery_only')
+
+    @cached_property
+    def same_domain(self) -> Optional[bool]:
+        return self._yaml('same_domain')
+
+    @cached_property
+    def list_discovery(self) -> Optional[bool]:
+        value = self._args.get('list_discovery')
+        return self._yaml('list_discovery') if isinstance(value, str) else value
+
+    @cached_property
+    def seeds(self) -> Optional[List[str]]:
+        # The seeds can be many, the string is not kept
+        value = self._args.pop('seeds', None)
+        if isinstance(value, str):
+            try:
+                value = load_yaml(value)
+            except Exception as err:
+                raise ValueError(f'Invalid seed URLs: {value} {err}')
+        elif not isinstance(value, (list, tuple)):
+            return None
+        return arg_to_iter(value) if value else None
+
+    @cached_property
+    def count_limits(self) -> Optional[dict]:
+        return self._yaml('count_limits')
+
+    @cached_property
+    def extract_rules(self) -> Optional[dict]:
+        return self._yaml('extract_rules', 'extraction rules')
+
+    @cached_property
+    def host_extract_rules(self) -> Optional[dict]:
+        """
+        The rules of each host, or the path of a YAML, or JSON file with them.
+        """
+        rules = self._args.get('host_extract_rules')
+        if isinstance(rules, str) and os.path.isfile(rules):
+            with open(rules) as f:
+                rules = f.read()
+        try:
+            return load_yaml(rules) if rules else None
+        except Exception as err:
+            raise ValueError(f'Invalid host extraction rules: {err}')
+
+    @cached_property
+    def allow_links(self):
+        return self._yaml('allow_links')
+
+    @cached_property
+    def ignore_links(self):
+        return self._yaml('ignore_links')
+
+    @cached_property
+    def max_pages(self) -> Optional[int]:
+        return self._int('max_pages')
+
+    @cached_property
+    def max_items(self) -> Optional[int]:
+        return self._int('max_items')
+
+    @cached_property
+    def page_types(self) -> Optional[List[str]]:
+        page_types = self._args.get('page_types')
+        if not page_types:
+            return None
+        if isinstance(page_types, str):
+            page_types = self._yaml('page_types')
+            if isinstance(page_types, str):
+                page_types = page_types.split(',')
+        return [t.strip() for t in arg_to_iter(page_types)]
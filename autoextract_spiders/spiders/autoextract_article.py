@@ -1,7 +1,10 @@
-import feedparser
 from w3lib.html import strip_html5_whitespace
+from scrapy.exceptions import IgnoreRequest
 from scrapy.http import Request, TextResponse, HtmlResponse
+from scrapy.spidermiddlewares.httperror import HttpError
 
+from ..checkpoint import TrackedDict
+from ..feed_cache import FeedCache
 from ..sessions import crawlera_session
 from .util import is_valid_url
 from .crawler_spider import CrawlerSpider
@@ -18,8 +21,66 @@ class ArticleAutoExtract(CrawlerSpider):
         spider.main_errback = spider.errback_source
         # A switch to enable revisiting article pages.
         spider.dont_filter = spider.get_arg('dont-filter', False)
+        # Feed URLs discovered for each source page URL
+        spider.feed_urls = TrackedDict()
+        # Feed URLs discovered for each seed URL, in the previous runs
+        spider.feed_cache = FeedCache.from_crawler(crawler)
+        # The seeds with failed cached feeds, already sent to discovery again
+        spider.rediscovered_seeds = set()
+        # The source pages can be cut after the head, if it has the feed links
+        spider.discovery_stream.watch(spider.parse_source, head_only=True)
         return spider
 
+    def get_checkpoint_state(self) -> dict:
+        state = super().get_checkpoint_state()
+        state['feeds'] = self.feed_urls
+        self.feed_urls.changes()
+        return state
+
+    def get_checkpoint_changes(self) -> dict:
+        changes = super().get_checkpoint_changes()
+        feeds = self.feed_urls.changes()
+        if feeds:
+            changes['feeds'] = feeds
+        return changes
+
+    def restore_checkpoint_state(self, state: dict):
+        super().restore_checkpoint_state(state)
+        self.feed_urls.update(state.get('feeds', {}))
+
+    def _make_seed_request(self, url):
+        """
+        Initial request to the seed URL, or to its feeds, if they are known from a previous run.
+        """
+        feed_urls = None if self.list_discovery else self.feed_cache.get(url)
+        if not feed_urls:
+            return super()._make_seed_request(url)
+        return [self._make_feed_request(feed_url, url, feed_cache_hit=True) for feed_url in feed_urls]
+
+    def _make_feed_request(self, feed_url, source_url, **meta):
+        self.crawler.stats.inc_value('sources/rss')
+        self.crawler.stats.inc_value('x_request/feeds')
+        meta.update({'source_url': source_url, 'feed_url': feed_url})
+        return Request(
+            feed_url,
+            meta=meta,
+            callback=self.parse_feed,
+            errback=self.errback_feed,
+            dont_filter=True)  # parse the feed everytime
+
+    def _rediscover_feeds(self, meta):
+        """
+        A cached feed failed, or is empty: forget the feeds of the seed and discover them again.
+        """
+        source_url = meta.get('source_url')
+        if not meta.get('feed_cache_hit') or source_url in self.rediscovered_seeds:
+            return
+        self.rediscovered_seeds.add(source_url)
+        self.feed_cache.invalidate(source_url)
+        self.feed_urls.pop(source_url, None)
+        self.crawler.stats.inc_value('feed_cache/rediscovered')
+        yield super()._make_seed_request(source_url)
+
     @crawlera_session.follow_session
     def parse_source(self, response: HtmlResponse):
         """
@@ -30,22 +91,27 @@ class ArticleAutoExtract(CrawlerSpider):
             self.crawler.stats.inc_value('error/invalid_source_response')
             return
 
-        feed_urls = self.get_feed_urls(response)
-        if not feed_urls:
-            self.logger.info('No feed found for URL: <%s>', response.url)
+        source_url = response.meta['source_url']
+        # The feeds of the page might be known, from a previous run
+        feed_urls = self.feed_urls.get(response.url)
+        if feed_urls:
+            self.crawler.stats.inc_value('sources/known_feeds')
+        else:
+            feed_urls = sorted(self.get_feed_urls(response))
+            if feed_urls:
+                self.feed_urls[response.url] = feed_urls
+                self.feed_cache.put(source_url, feed_urls)
+            else:
+                self.logger.info('No feed found for URL: <%s>', response.url)
 
         # Initial request to the Feed URLs. Sent as normal request.
         for feed_url in feed_urls:
-            self.crawler.stats.inc_value('sources/rss')
-            meta = {'source_url': response.meta['source_url'], 'feed_url': feed_url}
-            self.crawler.stats.inc_value('x_request/feeds')
-            yield Request(
-                feed_url,
-                meta=meta,
-                callback=self.parse_feed,
-                errback=self.errback_feed,
-                dont_filter=True)  # parse the feed everytime
+            yield self._make_feed_request(feed_url, source_url)
 
+        if response.meta.get('download_stopped') == 'head_only':
+            # Only the page head was downloaded, without the links
+            self.crawler.stats.inc_value('discovery_stream/links_skipped')
+            return
         # Cycle and follow all the rest of the links
         yield from self._requests_to_follow(response)
 
@@ -89,9 +155,12 @@ class ArticleAutoExtract(CrawlerSpider):
             self.logger.warning('Invalid Feed response: %s', response)
             self.crawler.stats.inc_value('error/invalid_feed_response')
             return
+        # Imported with the first feed, the product and job spiders never need it
+        import feedparser
         feed = feedparser.parse(response.text)
         if not feed:
             self.crawler.stats.inc_value('error/rss_initially_empty')
+            yield from self._rediscover_feeds(response.meta)
             return
 
         seen = set()
@@ -105,6 +174,7 @@ class ArticleAutoExtract(CrawlerSpider):
 
         if not seen:
             self.crawler.stats.inc_value('error/rss_finally_empty')
+            yield from self._rediscover_feeds(response.meta)
             return
 
         self.logger.info('Links extracted from <%s> feed = %d', response.url, len(seen))
@@ -113,6 +183,8 @@ class ArticleAutoExtract(CrawlerSpider):
 
         for url in seen:
             self.crawler.stats.inc_value('links/rss')
+            if not self.governor.allow(url):
+                continue
             yield self.make_extract_request(url,
                                             meta={'source_url': source_url,
                                                   'feed_url': feed_url,
@@ -121,4 +193,10 @@ class ArticleAutoExtract(CrawlerSpider):
 
     def errback_feed(self, failure):
         """ Feed XML request error """
+        # Dropped before the download (eg: a count limit), the feed didn't fail
+        if failure.check(IgnoreRequest) and not failure.check(HttpError):
+            return
         self.crawler.stats.inc_value('error/failed_feed_request')
+        request = getattr(failure, 'request', None)
+        if request is not None:
+            yield from self._rediscover_feeds(request.meta)
@@ -1,3 +1,4 @@
+import sys
 import logging
 
 from scrapy import signals
@@ -7,20 +8,66 @@ from scrapy.exceptions import IgnoreRequest, DropItem
 import scrapy_autoextract.middlewares
 
 from ..__version__ import __version__
+from ..governor import SpendGovernor
+from ..handoff import HandoffQueue
+from ..recrawl import IncrementalRecrawl
+from ..http2 import update_download_handlers
+from .args import SpiderArgs
 from .util import load_sources, is_valid_url, is_blacklisted_url, \
     FingerprintPrefix
-from .util import utc_iso_date, maybe_is_article, maybe_is_product, maybe_is_job_posting
+from .util import utc_iso_date, maybe_is_page_type, autoextract_original_url
 
 DEFAULT_THRESHOLD = .1
 
 SUPPORTED_TYPES = ('article', 'product', 'jobPosting')
 
+# AutoExtract list page types used for discovery, and the key of the items in the result
+LIST_TYPES = {'product': 'productList', 'article': 'articleList'}
+LIST_ITEMS_KEYS = {'productList': 'products', 'articleList': 'articles'}
+
 USER_AGENT = 'autoextract-spiders/{}'.format(__version__)
 if hasattr(scrapy_autoextract.middlewares, 'USER_AGENT'):
     USER_AGENT += ' ' + scrapy_autoextract.middlewares.USER_AGENT
 
 
+class FrozenDict(dict):
+    """
+    Read-only dict, used for the meta values shared by many requests.
+    Copies (and unpickled values) are normal dicts.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Shared meta values are read-only, replace them instead')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+_AUTOEXTRACT_META = {}
+
+
+def autoextract_meta(page_type: str = None) -> FrozenDict:
+    """
+    The AutoExtract meta shared by all the requests of the same page type.
+    """
+    if page_type not in _AUTOEXTRACT_META:
+        meta = {'enabled': True, 'headers': FrozenDict({'User-Agent': USER_AGENT})}
+        if page_type:
+            meta['pageType'] = page_type
+        _AUTOEXTRACT_META[page_type] = FrozenDict(meta)
+    return _AUTOEXTRACT_META[page_type]
+
+
 class AutoExtractRequest(Request):
+    """
+    Request sent to AutoExtract.
+
+    To keep the queued requests small, the "autoextract" meta is shared by all the requests
+    of the same page type and it's read-only; replace it to change it for one request.
+    The source and feed URLs are interned, because they are the same for many requests.
+    """
 
     def __init__(self, url, **kwargs):
         meta = kwargs.pop('meta', None) or {}
@@ -29,20 +76,22 @@ class AutoExtractRequest(Request):
             no_crawlera_session=True,
         )
         page_type = kwargs.pop('page_type', None)
-        feed_url = kwargs.pop('feed_url', None)
+        feed_url = kwargs.pop('feed_url', None) or meta.get('feed_url')
         if feed_url:
-            meta['feed_url'] = feed_url
-        source_url = kwargs.pop('source_url', None)
+            meta['feed_url'] = sys.intern(feed_url)
+        source_url = kwargs.pop('source_url', None) or meta.get('source_url')
         if source_url:
-            meta['source_url'] = source_url
+            meta['source_url'] = sys.intern(source_url)
         without_autoextract = kwargs.pop('without_autoextract', None)
 
         super().__init__(url, meta=meta, **kwargs)
         if without_autoextract is not True:
-            self.meta['autoextract'] = {'enabled': True}
-            self.meta['autoextract']['headers'] = {'User-Agent': USER_AGENT}
-            if page_type:
-                self.meta['autoextract']['pageType'] = page_type
+            # Keep the AutoExtract meta of requests restored from the disk queues
+            autoextract = self.meta.get('autoextract')
+            if not autoextract:
+                self.meta['autoextract'] = autoextract_meta(page_type)
+            elif page_type and autoextract.get('pageType') != page_type:
+                self.meta['autoextract'] = dict(autoextract, pageType=page_type)
 
     def __str__(self):
         return f'<AutoExtract {self.url}>'
@@ -63,6 +112,8 @@ class AutoExtractSpider(Spider):
         but also defines the page-type as "article"
     * products: a file, or URL with a list of item URLs, just like the "items",
         but also defines the page-type as "product"
+    * handoff: "discovery", to add the item URLs to the HANDOFF_DIR queue instead of extracting them,
+        or "extraction", to extract the item URLs of the queue
 
     Example:
     > -a page-type=article -a items=item-urls.jl
@@ -71,18 +122,33 @@ class AutoExtractSpider(Spider):
     """
     # name = 'base'
     threshold = DEFAULT_THRESHOLD
+    # Several page types extracted in the same crawl (see the CrawlerSpider)
+    page_types = None
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        update_download_handlers(settings)
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         # Less noise from the Depth Spider Middleware
         logging.getLogger('scrapy.spidermiddlewares.depth').setLevel(logging.INFO)
         spider = super().from_crawler(crawler, *args, **kwargs)
+        # The arguments are parsed once, when they're first used
+        spider.args = SpiderArgs(vars(spider))
 
         # Default page-type for all requests
         if spider.get_arg('page-type', ''):
             spider.page_type = spider.get_arg('page-type')
         # Minimum probability threshold (Float in range [0.0 to 1.0])
         spider.threshold = float(spider.threshold)
+        # Adaptive AutoExtract spending per host
+        spider.governor = SpendGovernor.from_crawler(crawler)
+        # Re-extract only the pages that changed since the last crawl
+        spider.recrawl = IncrementalRecrawl.from_crawler(crawler)
+        # Discovery and extraction in separate jobs, through an on-disk queue
+        spider.handoff = HandoffQueue.from_crawler(crawler, spider.get_arg('handoff'))
 
         crawler.signals.connect(spider.open_spider, signals.spider_opened)
         return spider
@@ -101,10 +167,7 @@ class AutoExtractSpider(Spider):
         """
         Helper function to normalize getting args with - and _ characters.
         """
-        spider_vars = vars(self)
-        spider_vars.update({k.replace('-', '_'): v for k, v in spider_vars.items()})
-        key = key.replace('-', '_')
-        return spider_vars.get(key, default)
+        return self.args.get(key, default)
 
     def start_requests(self):
         """
@@ -128,7 +191,21 @@ class AutoExtractSpider(Spider):
         Process exact item URLs (can be JSON, JL, TXT, or CSV with 1 column)
         Because the list is expected to be large, the input must be file, or URL.
         The links from the list will be sent directly to AutoExtract, without processing.
+        For the extraction jobs, the item URLs are the candidates found by the discovery jobs.
         """
+        if self.handoff.extraction:
+            self.logger.info('Using the handoff queue: %s', self.handoff.path)
+            for candidate in self.handoff.consume():
+                meta = {'dont_filter': True, 'handoff_id': candidate['id'], 'source_url': candidate['source_url'],
+                        'link_text': candidate['link_text']}
+                autoextract_req = self.make_extract_request(candidate['url'],
+                                                            meta=meta,
+                                                            check_page_type=False,
+                                                            page_type=candidate['page_type'])
+                if autoextract_req:
+                    yield autoextract_req
+            return
+
         articles_src = getattr(self, 'articles', '')
         products_src = getattr(self, 'products', '')
         if articles_src and len(articles_src) > 3:
@@ -153,11 +230,12 @@ class AutoExtractSpider(Spider):
                 if autoextract_req:
                     yield autoextract_req
 
-    def make_extract_request(self, url, meta=None, check_page_type=True):
+    def make_extract_request(self, url, meta=None, check_page_type=True, page_type=None):
         """
         Create a AutoExtract Request with all the meta and info.
         The blacklisted domains will be dropped.
         The URLs that are unlikely to be content pages are dropped by default.
+        The page type of the spider is used, if no page type is specified.
         """
         if not is_valid_url(url):
             self.logger.warning('Cannot make AutoExtract request, invalid URL: %s', url)
@@ -165,34 +243,79 @@ class AutoExtractSpider(Spider):
         if is_blacklisted_url(url):
             self.crawler.stats.inc_value('error/blacklisted_url')
             return
+        page_type = page_type or self.page_type
         meta = meta or {}
         meta['cf_store'] = True
         meta['fingerprint_prefix'] = FingerprintPrefix.AUTOEXTRACT.value
         req = AutoExtractRequest(url,
                                  meta=meta,
-                                 page_type=self.page_type,
+                                 page_type=page_type,
                                  callback=self.parse_item,
                                  errback=self.errback_item)
 
-        if check_page_type:
-            if (self.page_type == 'article' and not maybe_is_article(url)) or \
-                    (self.page_type == 'product' and not maybe_is_product(url)) or \
-                    (self.page_type == 'jobPosting' and not maybe_is_job_posting(url)):
-                self.logger.debug('Dropping URL: %s because is not %s', url, self.page_type)
-                self.crawler.stats.inc_value('error/probably_not_{}'.format(self.page_type))
-                return
+        if check_page_type and not maybe_is_page_type(url, page_type):
+            self.logger.debug('Dropping URL: %s because is not %s', url, page_type)
+            self.crawler.stats.inc_value('error/probably_not_{}'.format(page_type))
+            return
 
+        if self.handoff.discovery:
+            # Extracted later, by an extraction job
+            self.handoff.put(url, page_type, meta)
+            return None
+        if not meta.get('recrawl_checked') and self.recrawl.needs_check(url, page_type):
+            return self._make_recrawl_request(url, meta, page_type)
         return req
 
+    def _page_meta(self, meta: dict) -> dict:
+        """
+        The meta of an AutoExtract request, changed for downloading the page itself.
+        """
+        meta = {k: v for k, v in meta.items() if k not in ('dont_proxy', 'no_crawlera_session', 'cf_store')}
+        meta['fingerprint_prefix'] = FingerprintPrefix.SCRAPY.value
+        return meta
+
+    def _make_recrawl_request(self, url, meta, page_type):
+        """
+        Download a page that was already extracted, to send it to AutoExtract only if it changed.
+        """
+        meta = self._page_meta(meta)
+        meta['recrawl_check'] = page_type
+        meta['handle_httpstatus_list'] = [304]
+        return Request(url,
+                       meta=meta,
+                       headers=self.recrawl.conditional_headers(url),
+                       callback=self.parse_recrawl,
+                       errback=self.errback_item)
+
+    def parse_recrawl(self, response):
+        """
+        Send a known page to AutoExtract again, only if it changed since the last extraction.
+        """
+        url = response.meta.get('redirect_urls', [response.url])[0]
+        if not self.recrawl.is_changed(url, response):
+            self.handoff.done(response.meta)
+            return
+        meta = {k: response.meta[k] for k in ('source_url', 'feed_url', 'link_text', 'handoff_id')
+                if response.meta.get(k)}
+        meta['recrawl_checked'] = True
+        # The page HTML is already downloaded, for discovering links
+        meta['html_fetched'] = True
+        request = self.make_extract_request(url, meta=meta, check_page_type=False,
+                                            page_type=response.meta['recrawl_check'])
+        if request:
+            yield request
+
     def parse_item(self, response):
         """
         Return the AutoExtract item containing the full HTML page + enriched data.
         """
         if not response.meta.get('autoextract'):
             self.crawler.stats.inc_value('error/empty')
+            self.handoff.failed(response.meta)
             return
 
         autoextract = response.meta['autoextract']
+        accepted = 0
         # Try all supported page types
         for page_type in SUPPORTED_TYPES:
             item = autoextract.get(page_type, {})
@@ -203,14 +326,33 @@ class AutoExtractSpider(Spider):
                                   response.url, item['probability'])
                 self.crawler.stats.inc_value('error/probability')
                 continue
-            # Remove empty values from the item to enable ScrapyCloud stats
+            accepted += 1
+            yield self._finish_item(item, response, page_type)
+        self.governor.record(response.url, accepted > 0)
+        # The response meta has no "pageType", only the result of the requested page type
+        requested_type = next((t for t in SUPPORTED_TYPES if t in autoextract), None)
+        if requested_type:
+            self.recrawl.record_extraction(response.url, requested_type)
+        self.handoff.done(response.meta)
+
+    def _finish_item(self, item: dict, response, page_type: str) -> dict:
+        """
+        Add the crawl info to an extracted item.
+        """
+        # Remove empty values from the item to enable ScrapyCloud stats;
+        # with AUTOEXTRACT_LEAN_DECODING, the item is already a new dict without them
+        if not (response.meta.get('autoextract') or {}).get('projected'):
             item = {k: v for k, v in item.items() if v}
-            # Add source URL
-            if response.meta.get('source_url'):
-                item['source_url'] = response.meta['source_url']
-            # Add current timestamp
-            item['scraped_at'] = utc_iso_date()
-            yield item
+        # Add source URL
+        if response.meta.get('source_url'):
+            item['source_url'] = response.meta['source_url']
+        # Add current timestamp
+        item['scraped_at'] = utc_iso_date()
+        # The items of several page types are split by the PageTypeFeedsPipeline
+        if self.page_types:
+            item['page_type'] = page_type
+        self.crawler.stats.inc_value(f'items/{page_type}')
+        return item
 
     def errback_item(self, failure):
         if failure.check(IgnoreRequest, DropItem):
@@ -219,3 +361,8 @@ class AutoExtractSpider(Spider):
         if request:
             self.logger.warning('Item %s failed: %s', request.body, failure)
             self.crawler.stats.inc_value('error/failed_item')
+            self.handoff.failed(request.meta)
+            # A failed AutoExtract call doesn't return an item either
+            url = autoextract_original_url(request)
+            if url:
+                self.governor.record(url, False)
@@ -1,4 +1,4 @@
-import yaml
+import copy
 from urllib.parse import urlsplit
 
 from scrapy import signals
@@ -7,12 +7,18 @@ from scrapy.linkextractors import LinkExtractor
 from scrapy.exceptions import IgnoreRequest, DropItem
 from scrapy.utils.misc import arg_to_iter
 
-from ..middlewares import reset_scheduler_on_disabled_frontera
+from ..feeder import SeedFeeder
+from ..link_rules import HostExtractRules
+from ..middlewares import reset_scheduler_on_disabled_frontera, use_compact_memory_queue
+from ..offsite import AllowedHosts
+from ..pagination import PaginationDetector
 from ..sessions import crawlera_session, update_redirect_middleware
+from ..streaming import DiscoveryStreaming
+from ..structured_data import StructuredDataSniffer
 from .rule import Rule
-from .autoextract_spider import AutoExtractSpider
-from .util import is_valid_url, utc_iso_date, is_autoextract_request, \
-    FingerprintPrefix
+from .autoextract_spider import AutoExtractSpider, AutoExtractRequest, SUPPORTED_TYPES, LIST_TYPES, LIST_ITEMS_KEYS
+from .util import is_valid_url, utc_iso_date, is_autoextract_request, is_index_url, guess_page_type, \
+    hinted_page_type, is_blacklisted_url, maybe_is_page_type, FingerprintPrefix
 
 META_TO_KEEP = ('source_url',)
 
@@ -45,9 +51,19 @@ class CrawlerSpider(AutoExtractSpider):
     * extract-rules: a YAML dict with allowed and denied hosts and patterns;
         They will be used to initialize a scrapy.linkextractors.LinkExtractor;
         example: {allow: "/en/items/", deny: ["/privacy-?policy/?$", "/about-?(us)?$"]}
+    * host-extract-rules: a YAML dict with the extract rules of each host, or the path of a YAML,
+        or JSON file with this dict; used together with the global extract-rules;
+        example: {shop.com: {allow: "/products/"}, blog.com: {deny: "/tag/"}}
     * same-domain: limit the discovery of links to the same domains as the seeds;
         default: True
     * discovery-only: discover the links and return them, without AutoExtract items;
+        the pages at the last depth are returned, but not downloaded; default: False
+    * page-types: several page types to extract in the same crawl (as YAML list);
+        the links are discovered once, and each link is sent to AutoExtract with the most likely
+        page type; the items have a "page_type" field;
+        example: [product, article]
+    * list-discovery: send the seeds and the index pages to AutoExtract as product, or article lists,
+        and follow the item and the next page links from the lists, instead of crawling the HTML;
         default: False
 
     Extra options:
@@ -57,9 +73,12 @@ class CrawlerSpider(AutoExtractSpider):
     """
     # name = 'crawler'
     only_discovery = False
+    list_discovery = False
     same_origin = True
     seed_urls = None
     seeds_file_url = None
+    host_rules = None
+    allowed_hosts = None
     count_limits = DEFAULT_COUNT_LIMITS
     rules = [
         Rule(LinkExtractor(),
@@ -83,6 +102,7 @@ class CrawlerSpider(AutoExtractSpider):
     def update_settings(cls, settings):
         super().update_settings(settings)
         reset_scheduler_on_disabled_frontera(settings)
+        use_compact_memory_queue(settings)
         update_redirect_middleware(settings)
 
     @classmethod
@@ -91,26 +111,23 @@ class CrawlerSpider(AutoExtractSpider):
         spider.main_callback = spider.parse_page
         spider.main_errback = spider.errback_page
 
+        # The rules are bound to this spider, not shared with the other instances
+        spider.rules = [copy.copy(rule) for rule in spider.rules]
         for rule in spider.rules:
             rule._compile(spider)
 
+        args = spider.args
         # Discovery only for seeds, without items
-        if spider.get_arg('discovery-only'):
-            spider.only_discovery = yaml.load(spider.get_arg('discovery-only'))
+        if args.discovery_only is not None:
+            spider.only_discovery = args.discovery_only
         # Limit requests to the same domain
-        if spider.get_arg('same-domain'):
-            spider.same_origin = yaml.load(spider.get_arg('same-domain'))
+        if args.same_domain is not None:
+            spider.same_origin = args.same_domain
 
         # Seed URLs
-        if getattr(spider, 'seeds', None):
-            seeds = spider.seeds
-            if isinstance(seeds, str):
-                try:
-                    spider.seed_urls = yaml.load(seeds)
-                except Exception as err:
-                    raise ValueError('Invalid seed URLs: %s %s', seeds, err)
-            elif isinstance(seeds, (list, tuple)):
-                spider.seed_urls = seeds
+        if args.seeds:
+            spider.seed_urls = args.seeds
+        if hasattr(spider, 'seeds'):
             del spider.seeds
         if spider.seed_urls:
             spider.seed_urls = arg_to_iter(spider.seed_urls)
@@ -118,11 +135,25 @@ class CrawlerSpider(AutoExtractSpider):
         if spider.get_arg('seeds-file-url'):
             spider.seeds_file_url = spider.get_arg('seeds-file-url')
 
-        # Domains allowed to be crawled, for OffsiteMiddleware and others
-        if spider.same_origin and spider.seed_urls:
-            if not hasattr(spider, 'allowed_domains'):
-                spider.allowed_domains = DEFAULT_ALLOWED_DOMAINS
-            spider.allowed_domains.extend(urlsplit(u).netloc.lower() for u in spider.seed_urls)
+        # Hosts allowed to be crawled, for OffsiteMiddleware and others;
+        # the seed hosts are added when the seeds are scheduled
+        if spider.same_origin:
+            spider.allowed_hosts = AllowedHosts(
+                DEFAULT_ALLOWED_DOMAINS + list(getattr(spider, 'allowed_domains', None) or []))
+
+        # The links already returned in discovery-only mode, and the maximum depth of the pages to download
+        spider.discovered_links = set()
+        spider.max_depth = crawler.settings.getint('DEPTH_LIMIT')
+
+        # Seeds are admitted gradually, to keep the memory and the scheduler bounded
+        spider.seed_feeder = SeedFeeder.from_crawler(crawler, spider, spider._make_seed_request)
+        # Check the schema.org markup of the pages, before sending them to AutoExtract
+        spider.structured_data = StructuredDataSniffer.from_crawler(crawler)
+        # Follow the listings to the end, with their own budget
+        spider.pagination = PaginationDetector.from_crawler(crawler)
+        # Stop downloading the big discovery pages early
+        spider.discovery_stream = DiscoveryStreaming.from_crawler(crawler)
+        spider.discovery_stream.watch(spider.parse_page)
 
         crawler.signals.connect(spider.open_spider, signals.spider_opened)
         return spider
@@ -133,33 +164,30 @@ class CrawlerSpider(AutoExtractSpider):
         """
         super().open_spider()
 
+        args = self.args
         # JSON count limits for pages or items
-        if self.get_arg('count-limits'):
-            limits = self.get_arg('count-limits')
-            try:
-                self.count_limits = yaml.load(limits) if not isinstance(limits, dict) else limits
-            except Exception as err:
-                raise ValueError('Invalid count limits: %s %s', limits, err)
+        if args.count_limits:
+            self.count_limits = args.count_limits
         # JSON link extraction rules
-        if self.get_arg('extract-rules'):
-            rules = self.get_arg('extract-rules')
+        self.extract_rules = args.extract_rules or {}
+        # Link extraction rules for each host
+        if args.host_extract_rules:
             try:
-                self.extract_rules = yaml.load(rules) if not isinstance(rules, dict) else rules
+                self.host_rules = HostExtractRules(args.host_extract_rules)
             except Exception as err:
-                raise ValueError('Invalid extraction rules: %s %s', rules, err)
-        else:
-            self.extract_rules = {}
+                raise ValueError(f'Invalid host extraction rules: {err}')
+            self.logger.debug('Using extract rules for %d hosts', len(self.host_rules))
 
         # Shortcut to limit global requests
-        if self.get_arg('max-pages'):
-            max_pages = int(self.get_arg('max-pages'))
+        if args.max_pages:
+            max_pages = args.max_pages
             self.count_limits['page_host_count'] = max_pages
             if self.seed_urls:
                 self.count_limits['page_count'] = max_pages * len(self.seed_urls) * 2
             else:
                 self.count_limits['page_count'] = max_pages * 2
-        if self.get_arg('max-items'):
-            max_items = int(self.get_arg('max-items'))
+        if args.max_items:
+            max_items = args.max_items
             self.count_limits['item_host_count'] = max_items
             if self.seed_urls:
                 self.count_limits['item_count'] = max_items * len(self.seed_urls) * 2
@@ -169,21 +197,32 @@ class CrawlerSpider(AutoExtractSpider):
             self.logger.debug('Using count limits: %s', self.count_limits)
 
         # Shortcut to allow and ignore links
-        if self.get_arg('allow-links'):
-            try:
-                self.extract_rules['allow'] = yaml.load(self.get_arg('allow-links'))
-            except Exception as err:
-                raise ValueError('Invalid allow-links: %s', err)
-        if self.get_arg('ignore-links'):
-            try:
-                self.extract_rules['deny'] = yaml.load(self.get_arg('ignore-links'))
-            except Exception as err:
-                raise ValueError('Invalid ignore-links: %s', err)
+        if args.allow_links:
+            self.extract_rules['allow'] = args.allow_links
+        if args.ignore_links:
+            self.extract_rules['deny'] = args.ignore_links
         if self.extract_rules:
             self.logger.debug('Using extract rules: %s', self.extract_rules)
 
         if self.only_discovery:
             self.logger.debug('Discovery ONLY mode enabled')
+        # Discovery with the AutoExtract list page types
+        if args.list_discovery is not None:
+            self.list_discovery = args.list_discovery
+        if self.list_discovery:
+            if not self._list_type():
+                raise ValueError('No AutoExtract list page type for "{}"'.format(self.page_type))
+            self.logger.debug('List discovery mode enabled')
+
+        # Several page types in the same crawl; the first one is the default
+        if args.page_types:
+            self.page_types = args.page_types
+            self.page_type = self.page_types[0]
+        if self.page_types:
+            for page_type in self.page_types:
+                if page_type not in SUPPORTED_TYPES:
+                    raise ValueError('Invalid page type "{}"'.format(page_type))
+            self.logger.debug('Using page types: %s', self.page_types)
 
         return self
 
@@ -214,7 +253,7 @@ class CrawlerSpider(AutoExtractSpider):
             return
 
         self.logger.info('Using seeds: %s', self.seed_urls)
-        yield from self._schedule_seed_urls(self.seed_urls)
+        self._schedule_seed_urls(self.seed_urls, source='seeds')
 
     def parse_seeds_file(self, response):
         """
@@ -223,35 +262,79 @@ class CrawlerSpider(AutoExtractSpider):
         if not isinstance(response, TextResponse):
             return
         seeds = response.text.split()
-        yield from self._schedule_seed_urls(seeds)
+        self._schedule_seed_urls(seeds, source=response.meta['source_url'])
 
-    def _schedule_seed_urls(self, seed_urls):
+    def _schedule_seed_urls(self, seed_urls, source=None):
         """
-        A helper to process seed urls and yield appropriate requests.
+        A helper to validate seed urls and pass them to the seed feeder.
+        The feeder admits the seeds gradually, so they are never starving, nor flooding the scheduler.
         """
+        valid_urls = []
         for url in seed_urls:
             url = url.strip()
             if not is_valid_url(url):
                 self.logger.warning('Ignoring invalid seed URL: %s', url)
                 continue
-            # Initial request to the seed URL
             self.crawler.stats.inc_value('x_request/seeds')
-            request = Request(url,
-                          meta={'source_url': url},
-                          callback=self.main_callback,
-                          errback=self.main_errback,
-                          dont_filter=True)
-            # Trick required to avoid some seeds to be never processed or too late.
-            try:
-                self.crawler.engine.crawl(request, self)
-            except AssertionError:
-                yield request
+            valid_urls.append(url)
+        if self.allowed_hosts is not None:
+            self.allowed_hosts.add(valid_urls)
+        self.seed_feeder.add(valid_urls, source=source)
 
+    def _make_seed_request(self, url):
+        """
+        Initial request to the seed URL.
+        """
+        if self.list_discovery:
+            return self.make_list_request(url, meta={'source_url': url}, dont_filter=True)
+        return Request(url,
+                       meta={'source_url': url},
+                       callback=self.main_callback,
+                       errback=self.main_errback,
+                       dont_filter=True)
+
+    def get_checkpoint_state(self) -> dict:
+        """
+        The spider state saved by the Checkpoint extension.
+        """
+        state = {'seeds': self.seed_feeder.get_state()}
+        if self.page_types:
+            state['items'] = self._checkpoint_items = self._item_counts()
+        return state
+
+    def get_checkpoint_changes(self) -> dict:
+        """
+        The changes of the spider state since the last checkpoint.
+        """
+        changes = {}
+        seeds = self.seed_feeder.get_state_changes()
+        if seeds:
+            changes['seeds'] = seeds
+        if self.page_types:
+            items = self._item_counts()
+            if items != getattr(self, '_checkpoint_items', None):
+                changes['items'] = self._checkpoint_items = items
+        return changes
+
+    def _item_counts(self) -> dict:
+        return {t: self.crawler.stats.get_value(f'items/{t}', 0) for t in self.page_types}
+
+    def restore_checkpoint_state(self, state: dict):
+        """
+        Resume from the state saved by the Checkpoint extension.
+        """
+        if state.get('seeds'):
+            self.seed_feeder.set_state(state['seeds'])
+        # The item counts of each page type, for the per type limits
+        for page_type, count in state.get('items', {}).items():
+            self.crawler.stats.set_value(f'items/{page_type}', count)
 
     def parse_page(self, response):
         """
         Parse the spider response.
         """
+        if response.meta.get('recrawl_check'):
+            yield from self.parse_recrawl(response)
         if not isinstance(response, TextResponse):
             return
 
@@ -260,8 +343,11 @@ class CrawlerSpider(AutoExtractSpider):
         if not self.only_discovery:
             if is_autoextract_response:
                 yield from self.parse_item(response)
-        else:
-            # For discovery-only mode, return only the URLs
+            elif response.meta.get('check_structured_data'):
+                yield from self._parse_structured_data(response)
+        elif self.list_discovery or self._is_new_link(response.url):
+            # For discovery-only mode, return only the URLs;
+            # the links are returned when they're found, only the seeds and the next pages are left
             item = {'url': response.url}
             item['scraped_at'] = utc_iso_date()
             if response.meta.get('source_url'):
@@ -274,9 +360,13 @@ class CrawlerSpider(AutoExtractSpider):
         # Currently AutoExtract responses don't contain the full page HTML,
         # so there are no links and nothing to follow
         if response.body and not is_autoextract_response:
+            # The hash of a truncated page would never match the full page
+            if not response.meta.get('recrawl_check') and 'download_stopped' not in response.flags:
+                self.recrawl.record_page(response)
             for request in self._requests_to_follow(response):
-                yield crawlera_session.init_request(request)
-        elif is_autoextract_response:
+                # Discovery-only mode returns the links as items
+                yield crawlera_session.init_request(request) if isinstance(request, Request) else request
+        elif is_autoextract_response and not response.meta.get('html_fetched'):
             # Make another request to fetch the full page HTML
             # Risk of being banned
             self.crawler.stats.inc_value('x_request/discovery')
@@ -288,19 +378,156 @@ class CrawlerSpider(AutoExtractSpider):
                           errback=self.main_errback)
             yield crawlera_session.init_request(request)
 
+    def _parse_structured_data(self, response):
+        """
+        Use the schema.org markup of a discovered page to emit the item directly,
+        to drop the listings and the items of the other page types, or else to send the page to AutoExtract.
+        """
+        result, page_type, item = self.structured_data.sniff(response, self.page_types or [self.page_type])
+        if page_type and self._type_limit_reached(page_type):
+            return
+        if item:
+            item['url'] = response.url
+            yield self._finish_item(item, response, page_type)
+        elif result not in (StructuredDataSniffer.LISTING, StructuredDataSniffer.OTHER_ITEM):
+            page_type = page_type or self._route_page_type(response.url)
+            if not page_type:
+                return
+            meta = {'source_url': response.meta.get('source_url'),
+                    'link_text': response.meta.get('link_text'),
+                    # The page HTML is already downloaded, for discovering links
+                    'html_fetched': True}
+            request = self.make_extract_request(response.url, meta=meta, check_page_type=False,
+                                                page_type=page_type)
+            if request:
+                yield request
+
+    def _list_type(self):
+        """
+        The AutoExtract list page type used for discovery: the list type of the first page type that has one.
+        """
+        for page_type in self.page_types or [self.page_type]:
+            if page_type in LIST_TYPES:
+                return LIST_TYPES[page_type]
+        return None
+
+    def make_list_request(self, url, meta=None, dont_filter=False, priority=0):
+        """
+        Create an AutoExtract request for a listing page, to discover the item links.
+        """
+        meta = meta or {}
+        meta['list_page'] = True
+        # The AutoExtract response meta only has the result, not the requested page type
+        meta['list_type'] = list_type = self._list_type()
+        meta['fingerprint_prefix'] = FingerprintPrefix.AUTOEXTRACT_LIST.value
+        self.crawler.stats.inc_value('x_request/list')
+        return AutoExtractRequest(url,
+                                  meta=meta,
+                                  page_type=list_type,
+                                  callback=self.parse_list,
+                                  errback=self.main_errback,
+                                  dont_filter=dont_filter,
+                                  priority=priority)
+
+    def parse_list(self, response):
+        """
+        Parse an AutoExtract list response: send the item links to AutoExtract and follow the next page.
+        If the page is not a list, the links are discovered from the page HTML instead.
+        """
+        list_type = response.meta.get('list_type')
+        data = (response.meta.get('autoextract') or {}).get(list_type) or {}
+        entries = data.get(LIST_ITEMS_KEYS.get(list_type)) or []
+        source_url = response.meta.get('source_url')
+        if not entries:
+            self.crawler.stats.inc_value('list_discovery/not_list')
+            self.crawler.stats.inc_value('x_request/discovery')
+            request = Request(response.url,
+                              meta={'source_url': source_url,
+                                    'fingerprint_prefix': FingerprintPrefix.SCRAPY.value},
+                              callback=self.main_callback,
+                              errback=self.main_errback)
+            yield crawlera_session.init_request(request)
+            return
+
+        page_type = next(t for t, lt in LIST_TYPES.items() if lt == list_type)
+        for entry in entries:
+            url = entry.get('url')
+            if not is_valid_url(url):
+                continue
+            self.crawler.stats.inc_value('list_discovery/links')
+            link_text = entry.get('name') or entry.get('headline') or ''
+            if self.only_discovery:
+                yield {'url': url, 'source_url': source_url, 'link_text': link_text.strip(),
+                       'scraped_at': utc_iso_date()}
+                continue
+            if self._type_limit_reached(page_type) or not self.governor.allow(url):
+                continue
+            request = self.make_extract_request(url,
+                                                meta={'source_url': source_url, 'link_text': link_text},
+                                                check_page_type=False,
+                                                page_type=page_type)
+            if request:
+                yield request
+
+        next_url = (data.get('paginationNext') or {}).get('url')
+        if is_valid_url(next_url):
+            self.crawler.stats.inc_value('list_discovery/next_pages')
+            if not self.pagination.enabled:
+                yield self.make_list_request(next_url, meta={'source_url': source_url})
+            elif self.pagination.allow(next_url, response):
+                meta = self.pagination.request_meta(response)
+                meta['source_url'] = source_url
+                yield self.make_list_request(next_url, meta=meta, priority=self.pagination.priority)
+
+    def _make_pagination_request(self, url, response):
+        """
+        Request to the next page of a listing.
+        """
+        meta = self.pagination.request_meta(response)
+        meta['source_url'] = response.meta.get('source_url')
+        if self.list_discovery:
+            return self.make_list_request(url, meta=meta, priority=self.pagination.priority)
+        meta['fingerprint_prefix'] = FingerprintPrefix.SCRAPY.value
+        return Request(url,
+                       meta=meta,
+                       priority=self.pagination.priority,
+                       callback=self.parse_page,
+                       errback=self.errback_page)
+
+    def _route_page_type(self, url: str):
+        """
+        The page type used to extract a link. With several page types, the most likely one
+        that didn't reach its item limit; None if there's no such page type.
+        The links hinted as a page type that reached its limit are dropped.
+        """
+        if not self.page_types:
+            return self.page_type
+        hinted = hinted_page_type(url, self.page_types)
+        if hinted and self._type_limit_reached(hinted):
+            # Not worth an AutoExtract call as another page type
+            self.crawler.stats.inc_value(f'page_types/dropped/{hinted}')
+            return None
+        page_type = guess_page_type(url, [t for t in self.page_types if not self._type_limit_reached(t)])
+        if not page_type:
+            self.crawler.stats.inc_value('error/no_page_type')
+        return page_type
+
+    def _type_limit_reached(self, page_type: str) -> bool:
+        """
+        Check the item limit of a page type, defined in "count-limits" as "<page type>_item_count".
+        """
+        max_items = (self.count_limits or {}).get(f'{page_type}_item_count', 0)
+        return max_items > 0 and self.crawler.stats.get_value(f'items/{page_type}', 0) >= max_items
+
     def _rule_process_links(self, links):
         """
         Simple helper used by the default Rule to drop links,
         when the same-origin option is enabled.
         """
-        if not self.same_origin:
+        if not self.same_origin or self.allowed_hosts is None:
             return links
-        valid_links = []
-        for lnk in links:
-            host = urlsplit(lnk.url).netloc.lower()
-            if not hasattr(self, 'allowed_domains') or host in self.allowed_domains:
-                valid_links.append(lnk)
-        return valid_links
+        allowed_hosts = self.allowed_hosts
+        return [lnk for lnk in links if urlsplit(lnk.url).netloc in allowed_hosts]
 
     def _rule_process_req_resp(self, request, response):
         """
@@ -314,21 +541,114 @@ class CrawlerSpider(AutoExtractSpider):
         request.errback = self.errback_page
         return request
 
+    def _filter_host_rules(self, urls, host_rules):
+        """
+        Keep the URLs allowed by the extract rules of the page host.
+        """
+        if not host_rules:
+            return urls
+        allowed = [url for url in urls if host_rules.matches(getattr(url, 'url', url))]
+        if len(allowed) < len(urls):
+            self.crawler.stats.inc_value('link_filtering/host_rules/dropped_requests', len(urls) - len(allowed))
+        return allowed
+
     def _requests_to_follow(self, response):
         seen = set()
+        host_rules = self.host_rules.get(urlsplit(response.url).hostname) if self.host_rules else None
+        if self.pagination.enabled:
+            next_pages = self.pagination.find_next_pages(response)
+            seen.update(next_pages)
+            for url in self._filter_host_rules(next_pages, host_rules):
+                if self.pagination.allow(url, response):
+                    yield self._make_pagination_request(url, response)
         for n, rule in enumerate(self.rules):
             links = [lnk for lnk in rule.link_extractor.extract_links(response) if lnk.url not in seen]
+            links = self._filter_host_rules(links, host_rules)
             if links and callable(rule.process_links):
                 links = rule.process_links(links)
             for link in links:
                 seen.add(link.url)
-                meta = {'rule': n, 'link_text': link.text}
-                request = self.make_extract_request(link.url, meta=meta)
-                if not request:
+                if (self.only_discovery or self.handoff.discovery) and not self.list_discovery:
+                    yield from self._discover_link(link, n, response)
                     continue
-                if callable(rule.process_req_resp):
-                    request = rule.process_req_resp(request, response)
-                yield request
+                request = self._make_link_request(link, n, response)
+                if request:
+                    yield request
+
+    def _make_link_request(self, link, n, response):
+        """
+        The request of a link found by the rule "n": sent to AutoExtract,
+        or downloaded first to check its markup, or if it doesn't need AutoExtract.
+        """
+        meta = {'rule': n, 'link_text': link.text}
+        if self.list_discovery and is_index_url(link.url):
+            # Index pages are listings, their links are discovered by AutoExtract
+            meta['source_url'] = response.meta.get('source_url')
+            return self.make_list_request(link.url, meta=meta)
+        page_type = self._route_page_type(link.url)
+        if not page_type:
+            return None
+        request = self.make_extract_request(link.url, meta=meta, page_type=page_type)
+        if not request:
+            return None
+        if request.meta.get('recrawl_check'):
+            # Already extracted, it's downloaded first to check if it changed
+            pass
+        elif not self.governor.allow(link.url):
+            if self.governor.stop_discovery:
+                return None
+            # Don't spend AutoExtract on it, but keep discovering links
+            request = Request(link.url, meta=self._page_meta(meta))
+        elif self.structured_data.enabled and not self.only_discovery:
+            # Download the page first, to check its markup before spending AutoExtract
+            meta = self._page_meta(meta)
+            meta['check_structured_data'] = True
+            request = Request(link.url, meta=meta)
+        rule = self.rules[n]
+        if callable(rule.process_req_resp):
+            request = rule.process_req_resp(request, response)
+        return request
+
+    def _discover_link(self, link, n, response):
+        """
+        For discovery-only mode, return the link as soon as it's found,
+        or add it to the handoff queue, for the discovery jobs;
+        and download the page only if its own links can still be followed under the DEPTH_LIMIT.
+        """
+        # The same links as the ones that would be sent to AutoExtract
+        page_type = self._route_page_type(link.url)
+        if not page_type or is_blacklisted_url(link.url) or not maybe_is_page_type(link.url, page_type):
+            return
+        if not self._is_new_link(link.url):
+            return
+        depth = response.meta.get('depth', 0) + 1
+        if self.handoff.discovery:
+            meta = {'source_url': response.meta.get('source_url'), 'link_text': link.text, 'depth': depth}
+            self.make_extract_request(link.url, meta=meta, check_page_type=False, page_type=page_type)
+        else:
+            yield {'url': link.url,
+                   'source_url': response.meta.get('source_url'),
+                   'link_text': (link.text or '').strip(),
+                   'scraped_at': utc_iso_date()}
+        if 0 < self.max_depth <= depth:
+            self.crawler.stats.inc_value('discovery/not_fetched')
+            return
+        request = Request(link.url, meta={'rule': n, 'link_text': link.text})
+        rule = self.rules[n]
+        if callable(rule.process_req_resp):
+            request = rule.process_req_resp(request, response)
+        yield request
+
+    def _is_new_link(self, url: str) -> bool:
+        """
+        The discovered links are returned once, even if they're found on many pages.
+        """
+        key = hash(url)
+        if key in self.discovered_links:
+            return False
+        self.discovered_links.add(key)
+        self.crawler.stats.inc_value('discovery/links')
+        return True
 
     def errback_page(self, failure):
         if failure.check(IgnoreRequest, DropItem):
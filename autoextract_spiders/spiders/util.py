@@ -2,7 +2,7 @@ import os
 import re
 import logging
 from enum import Enum
-from typing import Iterable
+from typing import Iterable, Optional
 from urllib.parse import urlsplit
 from datetime import datetime, timezone
 try:
@@ -10,7 +10,8 @@ try:
 except ImportError:
     import json
 
-import requests
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
 from .config import CONFIG_PER_NETLOC
 
 logger = logging.getLogger(__name__)
@@ -45,6 +46,16 @@ def is_autoextract_request(request):
     return False
 
 
+def autoextract_original_url(request) -> Optional[str]:
+    """
+    The URL of the page sent to AutoExtract, if the request is an AutoExtract call.
+    """
+    autoextract = request.meta.get(AUTOEXTRACT_META_KEY) or request.meta.get('autoextract')
+    if isinstance(autoextract, dict):
+        return autoextract.get('original_url')
+    return None
+
+
 def is_index_url(url: str) -> bool:
     """
     Check if the URL is an index page
@@ -124,6 +135,55 @@ def maybe_is_job_posting(url: str) -> bool:
     return True
 
 
+PAGE_TYPE_CHECKS = {
+    'article': maybe_is_article,
+    'product': maybe_is_product,
+    'jobPosting': maybe_is_job_posting,
+}
+
+# URL path hints for each page type, used to route the links of a multi page type crawl
+PAGE_TYPE_HINTS = {
+    'article': re.compile(r'/(blog|blogs|news|article|articles|story|stories|post|posts|press|magazine)/'
+                          r'|/[0-9]{4}/[0-9]{2}/'),
+    'product': re.compile(r'/(product|products|p|item|items|dp|shop|store|catalog)/'),
+    'jobPosting': re.compile(r'/(job|jobs|career|careers|vacancy|vacancies|position|positions|opening|openings)/'),
+}
+
+
+def maybe_is_page_type(url: str, page_type: str) -> bool:
+    """
+    Try to guess if the link can be a page of the page type.
+    """
+    check = PAGE_TYPE_CHECKS.get(page_type)
+    return check(url) if check else True
+
+
+def guess_page_type(url: str, page_types: Iterable[str]) -> Optional[str]:
+    """
+    Pick the most likely page type of a link, from a list of page types.
+    The page types hinted by the URL path are preferred, then the order of the list.
+    Returns None if the link is unlikely to be any of the page types.
+    """
+    candidates = [t for t in page_types if maybe_is_page_type(url, t)]
+    if len(candidates) > 1:
+        page_type = hinted_page_type(url, candidates)
+        if page_type:
+            return page_type
+    return candidates[0] if candidates else None
+
+
+def hinted_page_type(url: str, page_types: Iterable[str]) -> Optional[str]:
+    """
+    The page type hinted by the URL path (eg: "/blog/" for articles), from a list of page types.
+    """
+    path = urlsplit(url).path.lower()
+    for page_type in page_types:
+        hint = PAGE_TYPE_HINTS.get(page_type)
+        if hint and hint.search(path) and maybe_is_page_type(url, page_type):
+            return page_type
+    return None
+
+
 def load_sources(fname: str) -> Iterable:
     """
     Load article/ product URLs from a file, or a remote URL.
@@ -133,7 +193,9 @@ def load_sources(fname: str) -> Iterable:
     """
     # Load from remote URL
     if is_valid_url(fname):
-        # Using Requests lib because Scrapy Requests refuses to parse Google Drive links
+        # Using Requests lib because Scrapy Requests refuses to parse Google Drive links;
+        # imported here, most jobs don't load remote lists
+        import requests
         headers = {
             'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'en,en-UK;q=0.8,en-US;q=0.7',
@@ -199,4 +261,5 @@ class FingerprintPrefix(Enum):
     Allows to have independent deduplication for Scrapy and AutoExtract requests.
     """
     SCRAPY = 's'  # For Scrapy requests
-    AUTOEXTRACT = 'a'  # For AutoExtract requests
\ No newline at end of file
+    AUTOEXTRACT = 'a'  # For AutoExtract requests
+    AUTOEXTRACT_LIST = 'l'  # For AutoExtract list requests
@@ -0,0 +1,269 @@
+"""
+Compact scheduler disk queues, used instead of the Scrapy pickle queues.
+
+The requests are converted to a positional record, where the fields with default
+values are omitted and the meta fields that are the same for all the requests
+(eg: the AutoExtract meta with the User-Agent header) are stored as a bit mask.
+The records are encoded with marshal and they are optionally compressed in blocks.
+
+Settings:
+* COMPACT_QUEUE_COMPRESSION: compress the records in blocks with zlib; default: False
+* COMPACT_QUEUE_BLOCK_SIZE: how many records are compressed together; default: 100
+
+The memory queue keeps the same records, to use less memory for millions of queued requests;
+it's enabled with COMPACT_MEMORY_QUEUE.
+"""
+import pickle
+import marshal
+import zlib
+from collections import deque
+from typing import List
+
+from queuelib import queue
+from scrapy.http import Request
+from scrapy.utils.python import to_unicode
+from scrapy.utils.reqser import request_from_dict
+
+from .spiders.autoextract_spider import SUPPORTED_TYPES, LIST_TYPES, autoextract_meta
+from .spiders.util import FingerprintPrefix
+
+MARSHAL_RECORD = b'm'
+PICKLE_RECORD = b'p'
+
+DEFAULT_BLOCK_SIZE = 100
+
+# Request fields, in the order they are stored, with their default values
+FIELDS = ('callback', 'errback', 'method', 'headers', 'body', 'cookies', '_encoding',
+          'priority', 'dont_filter', 'flags', 'cb_kwargs', '_class')
+DEFAULTS = (None, None, 'GET', {}, b'', {}, 'utf-8', 0, False, [], {}, None)
+_CLASS_FIELD = FIELDS.index('_class')
+
+# Request classes stored as a number
+CLASSES = ('autoextract_spiders.spiders.autoextract_spider.AutoExtractRequest',)
+
+# Meta (key, value) pairs shared by most requests, stored as a bit mask
+CONSTANT_META = (
+    ('dont_proxy', True),
+    ('no_crawlera_session', True),
+    ('cf_store', True),
+    ('fingerprint_prefix', FingerprintPrefix.AUTOEXTRACT.value),
+    ('fingerprint_prefix', FingerprintPrefix.SCRAPY.value),
+    ('autoextract', autoextract_meta()),
+) + tuple(('autoextract', autoextract_meta(page_type)) for page_type in SUPPORTED_TYPES) + (
+    # Appended at the end, to keep the mask of the records already queued
+    ('fingerprint_prefix', FingerprintPrefix.AUTOEXTRACT_LIST.value),
+    ('list_page', True),
+) + tuple(('autoextract', autoextract_meta(list_type)) for list_type in LIST_TYPES.values()) + tuple(
+    ('list_type', list_type) for list_type in LIST_TYPES.values())
+# The constant values are immutable, so they are shared by all the decoded requests
+_CONSTANT_INDEX = {}
+for _n, (_key, _value) in enumerate(CONSTANT_META):
+    _CONSTANT_INDEX.setdefault(_key, []).append((_n, _value))
+
+
+def _method_name(spider, func):
+    """
+    Name of the spider method, like scrapy.utils.reqser does, but without inspecting all the members.
+    """
+    if not callable(func):
+        return func
+    name = getattr(func, '__name__', None)
+    method = getattr(spider, name, None) if spider and name else None
+    if method is not None and getattr(method, '__func__', method) is getattr(func, '__func__', None):
+        return name
+    raise ValueError(f'Function {func} is not an instance method in: {spider}')
+
+
+def _request_to_dict(request, spider=None) -> dict:
+    d = {
+        'url': to_unicode(request.url),
+        'callback': _method_name(spider, request.callback),
+        'errback': _method_name(spider, request.errback),
+        'method': request.method,
+        'headers': dict(request.headers),
+        'body': request.body,
+        'cookies': request.cookies,
+        'meta': request.meta,
+        '_encoding': request._encoding,
+        'priority': request.priority,
+        'dont_filter': request.dont_filter,
+        'flags': request.flags,
+        'cb_kwargs': request.cb_kwargs,
+    }
+    if type(request) is not Request:
+        d['_class'] = request.__module__ + '.' + request.__class__.__name__
+    return d
+
+
+def encode_request(request, spider=None) -> bytes:
+    """
+    Convert a request into a compact binary record.
+    """
+    d = _request_to_dict(request, spider)
+    fields = {}
+    for n, (name, default) in enumerate(zip(FIELDS, DEFAULTS)):
+        value = d.get(name)
+        if value is None or value == default:
+            continue
+        if n == _CLASS_FIELD and value in CLASSES:
+            value = CLASSES.index(value)
+        fields[n] = value
+
+    mask = 0
+    meta = {}
+    for key, value in d['meta'].items():
+        for n, const in _CONSTANT_INDEX.get(key, ()):
+            if value == const:
+                mask |= 1 << n
+                break
+        else:
+            meta[key] = value
+
+    record = (d['url'], fields, mask, meta)
+    try:
+        return MARSHAL_RECORD + marshal.dumps(record)
+    except ValueError:
+        # The meta contains objects that marshal doesn't support
+        try:
+            return PICKLE_RECORD + pickle.dumps(record, protocol=4)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError(str(e)) from e
+
+
+def decode_request(data: bytes, spider=None):
+    """
+    Convert a compact binary record back into a request.
+    """
+    if data[:1] == MARSHAL_RECORD:
+        url, fields, mask, meta = marshal.loads(data[1:])
+    else:
+        url, fields, mask, meta = pickle.loads(data[1:])
+
+    d = {'url': url, 'meta': meta}
+    for n, name in enumerate(FIELDS):
+        if n in fields:
+            d[name] = fields[n]
+        elif isinstance(DEFAULTS[n], (dict, list)):
+            d[name] = type(DEFAULTS[n])()
+        else:
+            d[name] = DEFAULTS[n]
+    if isinstance(d['_class'], int):
+        d['_class'] = CLASSES[d['_class']]
+    elif d['_class'] is None:
+        del d['_class']
+
+    n = 0
+    while mask:
+        if mask & 1:
+            key, value = CONSTANT_META[n]
+            meta[key] = value
+        mask >>= 1
+        n += 1
+    return request_from_dict(d, spider)
+
+
+def _encode_block(records: List[bytes]) -> bytes:
+    return zlib.compress(marshal.dumps(records))
+
+
+def _decode_block(data: bytes) -> List[bytes]:
+    return marshal.loads(zlib.decompress(data))
+
+
+class CompactFifoDiskQueue(queue.FifoDiskQueue):
+    """
+    FIFO disk queue storing the requests as compact records.
+
+    With compression enabled, the records are buffered and written in compressed blocks.
+    The records that are still buffered when the queue is closed are written to disk too.
+    """
+
+    def __init__(self, crawler, key):
+        self.spider = crawler.spider
+        settings = crawler.settings
+        self.block_size = 1
+        if settings.getbool('COMPACT_QUEUE_COMPRESSION', False):
+            self.block_size = max(1, settings.getint('COMPACT_QUEUE_BLOCK_SIZE', DEFAULT_BLOCK_SIZE))
+        super().__init__(key)
+        # Records from the last block read from disk, and records not written yet
+        self._head = deque()
+        self._tail = []
+        self.info.setdefault('records', self.info['size'])
+
+    @classmethod
+    def from_crawler(cls, crawler, key, *args, **kwargs):
+        return cls(crawler, key)
+
+    def push(self, request):
+        record = encode_request(request, self.spider)
+        if self.block_size == 1:
+            super().push(record)
+            self.info['records'] += 1
+            return
+        self._tail.append(record)
+        if len(self._tail) >= self.block_size:
+            self._flush(self._tail)
+            self._tail = []
+
+    def pop(self):
+        record = self._pop_record()
+        if record:
+            return decode_request(record, self.spider)
+
+    def _pop_record(self):
+        if self._head:
+            return self._head.popleft()
+        data = super().pop()
+        if data:
+            if data[:1] in (MARSHAL_RECORD, PICKLE_RECORD):
+                self.info['records'] -= 1
+                return data
+            records = _decode_block(data)
+            self.info['records'] -= len(records)
+            self._head.extend(records[1:])
+            return records[0]
+        if self._tail:
+            return self._tail.pop(0)
+
+    def _flush(self, records):
+        if records:
+            super().push(_encode_block(records))
+            self.info['records'] += len(records)
+
+    def close(self):
+        # The unread records go after the ones on disk, so the order is not strictly FIFO after a restart
+        self._flush(list(self._head) + self._tail)
+        self._head.clear()
+        self._tail = []
+        super().close()
+
+    def __len__(self):
+        return self.info['records'] + len(self._head) + len(self._tail)
+
+
+class CompactFifoMemoryQueue(queue.FifoMemoryQueue):
+    """
+    FIFO memory queue keeping the requests as compact records, instead of Request objects.
+    The requests that can't be encoded (eg: the callback is not a spider method) are kept as they are.
+    """
+
+    def __init__(self, crawler, key=None):
+        self.spider = crawler.spider
+        super().__init__()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        return cls(crawler)
+
+    def push(self, request):
+        try:
+            request = encode_request(request, self.spider)
+        except ValueError:
+            pass
+        super().push(request)
+
+    def pop(self):
+        record = super().pop()
+        if isinstance(record, bytes):
+            return decode_request(record, self.spider)
+        return record
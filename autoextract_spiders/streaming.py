@@ -0,0 +1,122 @@
+import logging
+from weakref import WeakKeyDictionary
+
+from lxml import etree
+from scrapy import signals
+from scrapy.exceptions import StopDownload
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+FEED_TYPES = ('rss+xml', 'atom+xml')
+
+
+class _BodyStream:
+    __slots__ = ('head_only', 'parser', 'size', 'expected_size', 'has_feeds')
+
+    def __init__(self, head_only: bool):
+        self.head_only = head_only
+        # The head is parsed incrementally, as the chunks arrive, to find the feed links
+        self.parser = etree.HTMLPullParser(events=('start', 'end')) if head_only else None
+        self.size = 0
+        self.expected_size = None
+        self.has_feeds = False
+
+    def feed_head(self, data: bytes) -> bool:
+        """
+        Parse the next chunk of the page head; returns True when the head is complete.
+        """
+        self.parser.feed(data)
+        for event, element in self.parser.read_events():
+            if event == 'start' and element.tag == 'link':
+                link_type = element.get('type') or ''
+                if element.get('href') and any(t in link_type for t in FEED_TYPES):
+                    self.has_feeds = True
+            elif (event, element.tag) in (('end', 'head'), ('start', 'body')):
+                self.parser = None
+                return True
+        return False
+
+
+class DiscoveryStreaming:
+    """
+    Stop downloading the discovery pages early, as the chunks of the body arrive,
+    instead of downloading and parsing the full pages (some pages have megabytes of inline scripts).
+
+    The discovery pages are cut after DISCOVERY_MAX_BYTES bytes; the links of the first part
+    of the page are still followed. In the head-only mode, the source pages of the article spider
+    are cut as soon as the page head is complete, if it has RSS, or Atom feed links; their links
+    are not followed, only their feeds.
+    The cut responses have the "download_stopped" flag, the reason in the "download_stopped" meta key,
+    and are counted in the "discovery_stream/" stats.
+
+    The AutoExtract requests, the feeds and the pages downloaded to check their markup,
+    or their changes, are always downloaded fully.
+
+    Settings:
+    * DISCOVERY_STREAMING_ENABLED: default: False
+    * DISCOVERY_MAX_BYTES: the bytes downloaded for one discovery page; default: 1 MB
+    * DISCOVERY_HEAD_ONLY: default: False
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.enabled = settings.getbool('DISCOVERY_STREAMING_ENABLED', False)
+        self.max_bytes = settings.getint('DISCOVERY_MAX_BYTES', DEFAULT_MAX_BYTES)
+        self.head_only = settings.getbool('DISCOVERY_HEAD_ONLY', False)
+        # Callback name -> head-only mode
+        self.callbacks = {}
+        self.streams = WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        if o.enabled:
+            crawler.signals.connect(o.headers_received, signal=signals.headers_received)
+            crawler.signals.connect(o.bytes_received, signal=signals.bytes_received)
+        return o
+
+    def watch(self, callback, head_only: bool = False):
+        """
+        Stream the discovery pages parsed by this spider callback.
+        """
+        self.callbacks[callback.__name__] = head_only and self.head_only
+
+    def is_discovery_request(self, request) -> bool:
+        meta = request.meta
+        if AUTOEXTRACT_META_KEY in meta or meta.get('check_structured_data') or meta.get('recrawl_check'):
+            return False
+        return getattr(request.callback, '__name__', None) in self.callbacks
+
+    def headers_received(self, headers, body_length, request, spider):
+        if not self.is_discovery_request(request):
+            return
+        stream = self.streams[request] = _BodyStream(self.callbacks[request.callback.__name__])
+        if isinstance(body_length, int):
+            stream.expected_size = body_length
+
+    def bytes_received(self, data, request, spider):
+        stream = self.streams.get(request)
+        if stream is None:
+            return
+        stats = self.crawler.stats
+        stream.size += len(data)
+        stats.inc_value('discovery_stream/bytes', len(data))
+
+        reason = None
+        if stream.parser is not None and stream.feed_head(data) and stream.has_feeds:
+            reason = 'head_only'
+        elif 0 < self.max_bytes <= stream.size:
+            reason = 'max_bytes'
+        if reason:
+            del self.streams[request]
+            request.meta['download_stopped'] = reason
+            stats.inc_value('discovery_stream/truncated')
+            stats.inc_value(f'discovery_stream/truncated/{reason}')
+            if stream.expected_size:
+                stats.inc_value('discovery_stream/bytes_skipped', max(0, stream.expected_size - stream.size))
+            logger.debug('Stopped the download of %s after %d bytes (%s)', request.url, stream.size, reason)
+            raise StopDownload(fail=False)
@@ -0,0 +1,347 @@
+import logging
+from typing import Iterable, List, Optional
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from w3lib.html import strip_html5_whitespace
+
+logger = logging.getLogger(__name__)
+
+# schema.org types -> AutoExtract page types
+ITEM_TYPES = {
+    'Product': 'product',
+    'ProductModel': 'product',
+    'IndividualProduct': 'product',
+    'Article': 'article',
+    'NewsArticle': 'article',
+    'ReportageNewsArticle': 'article',
+    'AnalysisNewsArticle': 'article',
+    'OpinionNewsArticle': 'article',
+    'BlogPosting': 'article',
+    'TechArticle': 'article',
+    'ScholarlyArticle': 'article',
+    'JobPosting': 'jobPosting',
+}
+
+# schema.org types of pages that are never items
+LISTING_TYPES = {
+    'ItemList', 'CollectionPage', 'SearchResultsPage', 'OfferCatalog',
+    'ContactPage', 'AboutPage', 'CheckoutPage', 'FAQPage', 'ProfilePage',
+}
+
+
+class StructuredData:
+    """
+    The schema.org objects found in the JSON-LD and the microdata of one page.
+    """
+
+    def __init__(self, objects: List[dict]):
+        self.objects = objects
+        self.types = set()
+        for obj in objects:
+            self.types.update(_types(obj))
+
+    @classmethod
+    def from_response(cls, response) -> 'StructuredData':
+        objects = []
+        for text in response.xpath('//script[@type="application/ld+json"]/text()').getall():
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            objects.extend(_flatten_json_ld(data))
+        for node in response.xpath('//*[@itemscope][@itemtype][not(ancestor::*[@itemscope])]'):
+            objects.append(_parse_microdata(node))
+        return cls(objects)
+
+    @property
+    def page_types(self) -> set:
+        """
+        The AutoExtract page types described by the markup.
+        """
+        return {ITEM_TYPES[t] for t in self.types if t in ITEM_TYPES}
+
+    def is_listing(self) -> bool:
+        """
+        True if the page is confidently not an item: it has listing markup and no item markup.
+        """
+        return bool(self.types & LISTING_TYPES) and not self.page_types
+
+    def get_item(self, page_type: str) -> Optional[dict]:
+        """
+        Convert the markup to an item in the AutoExtract schema,
+        if it has all the required fields of the page type.
+        """
+        for obj in self.objects:
+            if not any(ITEM_TYPES.get(t) == page_type for t in _types(obj)):
+                continue
+            item = CONVERTERS[page_type](obj)
+            if all(item.get(f) for f in REQUIRED_FIELDS[page_type]):
+                return item
+        return None
+
+
+def _types(obj: dict) -> List[str]:
+    types = obj.get('@type') or []
+    if isinstance(types, str):
+        types = [types]
+    # Microdata types are URLs, eg: http://schema.org/Product
+    return [t.rsplit('/', 1)[-1] for t in types if isinstance(t, str)]
+
+
+def _flatten_json_ld(data) -> Iterable[dict]:
+    if isinstance(data, list):
+        for obj in data:
+            yield from _flatten_json_ld(obj)
+    elif isinstance(data, dict):
+        if '@graph' in data:
+            yield from _flatten_json_ld(data['@graph'])
+        else:
+            yield data
+
+
+def _parse_microdata(node) -> dict:
+    obj = {'@type': node.attrib.get('itemtype', '').split()}
+    # Only the properties of this item, not the properties of the nested items
+    props = node.xpath('.//*[@itemprop][count(ancestor::*[@itemscope]) = $depth]',
+                       depth=len(node.xpath('ancestor-or-self::*[@itemscope]')))
+    for prop in props:
+        value = _parse_microdata(prop) if 'itemscope' in prop.attrib else _microdata_value(prop)
+        for name in prop.attrib['itemprop'].split():
+            obj.setdefault(name, value)
+    return obj
+
+
+def _microdata_value(node) -> str:
+    attrib = node.attrib
+    tag = node.root.tag
+    if 'content' in attrib:
+        return attrib['content']
+    if tag in ('a', 'link', 'area'):
+        return strip_html5_whitespace(attrib.get('href', ''))
+    if tag in ('img', 'audio', 'video', 'source', 'embed', 'iframe'):
+        return strip_html5_whitespace(attrib.get('src', ''))
+    if tag in ('time', 'data', 'meter') and ('datetime' in attrib or 'value' in attrib):
+        return attrib.get('datetime') or attrib.get('value')
+    return ' '.join(' '.join(node.xpath('.//text()').getall()).split())
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _text(value) -> Optional[str]:
+    """
+    The text of a value that might be a list, or an object with a name.
+    """
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@value')
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _url(value) -> Optional[str]:
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('url') or value.get('contentUrl') or value.get('@id')
+    return value if isinstance(value, str) and value else None
+
+
+def _urls(value) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    return [u for u in (_url(v) for v in values) if u]
+
+
+def _names(value) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    return [n for n in (_text(v) for v in values) if n]
+
+
+def _product_item(obj: dict) -> dict:
+    offers = []
+    offers_data = obj.get('offers') or []
+    for offer in (offers_data if isinstance(offers_data, list) else [offers_data]):
+        if not isinstance(offer, dict):
+            continue
+        price = _text(offer.get('price') or offer.get('lowPrice'))
+        if not price:
+            continue
+        availability = _text(offer.get('availability'))
+        offers.append({
+            'price': price,
+            'currency': _text(offer.get('priceCurrency')),
+            'availability': availability.rsplit('/', 1)[-1] if availability else None,
+        })
+    rating = _first(obj.get('aggregateRating'))
+    images = _urls(obj.get('image'))
+    item = {
+        'name': _text(obj.get('name')),
+        'offers': [{k: v for k, v in offer.items() if v} for offer in offers],
+        'sku': _text(obj.get('sku')),
+        'mpn': _text(obj.get('mpn')),
+        'gtin': [{'type': key, 'value': _text(obj[key])}
+                 for key in ('gtin8', 'gtin12', 'gtin13', 'gtin14') if _text(obj.get(key))],
+        'brand': _text(obj.get('brand')),
+        'mainImage': images[0] if images else None,
+        'images': images,
+        'description': _text(obj.get('description')),
+        'url': _url(obj.get('url')),
+    }
+    if isinstance(rating, dict):
+        item['aggregateRating'] = {k: v for k, v in {
+            'ratingValue': _number(rating.get('ratingValue')),
+            'bestRating': _number(rating.get('bestRating')),
+            'reviewCount': _number(rating.get('reviewCount') or rating.get('ratingCount')),
+        }.items() if v is not None}
+    return item
+
+
+def _article_item(obj: dict) -> dict:
+    images = _urls(obj.get('image'))
+    authors = _names(obj.get('author'))
+    date_published = _text(obj.get('datePublished'))
+    return {
+        'headline': _text(obj.get('headline')),
+        'datePublished': date_published,
+        'datePublishedRaw': date_published,
+        'dateModified': _text(obj.get('dateModified')),
+        'author': authors[0] if authors else None,
+        'authorsList': authors,
+        'inLanguage': _text(obj.get('inLanguage')),
+        'mainImage': images[0] if images else None,
+        'images': images,
+        'description': _text(obj.get('description')),
+        'articleBody': _text(obj.get('articleBody')),
+        'url': _url(obj.get('url') or obj.get('mainEntityOfPage')),
+    }
+
+
+def _job_posting_item(obj: dict) -> dict:
+    location = _first(obj.get('jobLocation'))
+    if isinstance(location, dict):
+        address = location.get('address')
+        if isinstance(address, dict):
+            location = ', '.join(_text(address.get(k)) for k in
+                                 ('streetAddress', 'addressLocality', 'addressRegion', 'addressCountry')
+                                 if _text(address.get(k)))
+        else:
+            location = _text(address) or _text(location)
+    salary = _first(obj.get('baseSalary'))
+    if isinstance(salary, dict):
+        value = salary.get('value')
+        if isinstance(value, dict):
+            value = value.get('value') or value.get('minValue')
+        salary = {k: v for k, v in {
+            'raw': _text(value),
+            'currency': _text(salary.get('currency')),
+        }.items() if v}
+    employment_type = _first(obj.get('employmentType'))
+    return {
+        'title': _text(obj.get('title')),
+        'datePosted': _text(obj.get('datePosted')),
+        'validThrough': _text(obj.get('validThrough')),
+        'hiringOrganization': {'name': _text(obj.get('hiringOrganization'))},
+        'jobLocation': {'raw': location} if isinstance(location, str) and location else None,
+        'baseSalary': salary or None,
+        'employmentType': _text(employment_type),
+        'description': _text(obj.get('description')),
+        'url': _url(obj.get('url')),
+    }
+
+
+def _number(value):
+    value = _text(value)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+CONVERTERS = {
+    'product': _product_item,
+    'article': _article_item,
+    'jobPosting': _job_posting_item,
+}
+
+# The fields required for the markup to be good enough to replace AutoExtract
+REQUIRED_FIELDS = {
+    'product': ('name', 'offers'),
+    'article': ('headline', 'articleBody'),
+    'jobPosting': ('title', 'description'),
+}
+
+
+class StructuredDataSniffer:
+    """
+    Classify the discovered pages from their schema.org markup (JSON-LD, or microdata),
+    before spending an AutoExtract call on them.
+
+    When enabled, the discovered links are first downloaded as normal pages, then:
+    * the pages with complete item markup are emitted directly, without AutoExtract,
+        if STRUCTURED_DATA_ITEMS is enabled (hybrid mode)
+    * the pages with listing markup (and no item markup) are never sent to AutoExtract
+    * the pages with only the item markup of other page types (eg: a NewsArticle in a product crawl)
+        are never sent to AutoExtract either
+    * all the other pages are sent to AutoExtract, as usual
+
+    Settings:
+    * STRUCTURED_DATA_ENABLED: download the links and check the markup first; default: False
+    * STRUCTURED_DATA_ITEMS: emit the items from the markup; default: False
+    """
+
+    # Results of sniff()
+    ITEM = 'item'
+    LISTING = 'listing'
+    OTHER_ITEM = 'other_item'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.enabled = crawler.settings.getbool('STRUCTURED_DATA_ENABLED', False)
+        self.emit_items = crawler.settings.getbool('STRUCTURED_DATA_ITEMS', False)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def sniff(self, response, page_types: Iterable[str]):
+        """
+        Returns the page class, the page type found in the markup (one of the page types)
+        and the item, if the markup is good enough to skip AutoExtract.
+        """
+        stats = self.crawler.stats
+        stats.inc_value('structured_data/pages')
+        try:
+            data = StructuredData.from_response(response)
+        except Exception as err:
+            logger.debug('Cannot parse the structured data of %s: %s', response.url, err)
+            data = StructuredData([])
+        if data.objects:
+            stats.inc_value('structured_data/with_markup')
+
+        result, page_type, item = self.UNKNOWN, None, None
+        if data.is_listing():
+            result = self.LISTING
+        else:
+            page_type = next((t for t in page_types if t in data.page_types), None)
+            if page_type:
+                result = self.ITEM
+                if self.emit_items:
+                    item = data.get_item(page_type)
+            elif data.page_types:
+                # An item, but not one of the crawled page types
+                result = self.OTHER_ITEM
+        stats.inc_value(f'structured_data/{result}')
+        if item:
+            stats.inc_value('structured_data/local_items')
+        # Pages served without AutoExtract: the listings, the other items and the local items
+        local = sum(stats.get_value(f'structured_data/{name}', 0)
+                    for name in (self.LISTING, self.OTHER_ITEM, 'local_items'))
+        stats.set_value('structured_data/local_share', round(local / stats.get_value('structured_data/pages'), 4))
+        return result, page_type, item
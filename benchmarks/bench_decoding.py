@@ -0,0 +1,103 @@
+"""
+Measure the CPU time and the memory of each AutoExtract article response, from the API response to the item:
+- standard: the scrapy-autoextract middleware, then the spider copy of the item
+- lean: AUTOEXTRACT_LEAN_DECODING, all the fields
+- lean + fields: AUTOEXTRACT_LEAN_DECODING, with the AUTOEXTRACT_FIELDS of a typical article feed
+
+The memory is the peak while decoding a response, and the memory kept for each item.
+
+> python benchmarks/bench_decoding.py [number of responses]
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AutoExtractMiddleware
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.decoding import LeanAutoExtractMiddleware  # noqa: E402
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+FIELDS = {'article': ['headline', 'datePublished', 'author', 'articleBody', 'mainImage', 'inLanguage']}
+PARAGRAPH = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. '
+
+
+def make_body(n):
+    paragraphs = [PARAGRAPH * 4 + str(n)] * 12
+    article = {
+        'url': f'https://blog.example.com/post-{n}', 'probability': 0.97, 'headline': f'Post {n}',
+        'datePublished': '2020-05-01T10:00:00', 'datePublishedRaw': 'May 1, 2020', 'dateModified': '',
+        'author': 'John Doe', 'authorsList': ['John Doe'], 'inLanguage': 'en', 'breadcrumbs': [
+            {'name': 'Home', 'link': 'https://blog.example.com/'}, {'name': 'News', 'link': None}],
+        'mainImage': f'https://blog.example.com/img/{n}.jpg',
+        'images': [f'https://blog.example.com/img/{n}-{i}.jpg' for i in range(10)],
+        'description': PARAGRAPH, 'articleBody': '\n'.join(paragraphs),
+        'articleBodyRaw': ''.join(f'<p class="body">{p}</p>' for p in paragraphs),
+        'articleBodyHtml': '<article>' + ''.join(f'<p>{p}</p>' for p in paragraphs) + '</article>',
+        'videoUrls': [], 'audioUrls': [], 'canonicalUrl': f'https://blog.example.com/post-{n}',
+    }
+    return json.dumps([{'query': {'id': str(n), 'domain': 'blog.example.com',
+                                  'userQuery': {'url': article['url'], 'pageType': 'article'}},
+                        'article': article, 'webPage': {'inLanguages': [{'code': 'en'}]}}]).encode()
+
+
+def setup(middleware_cls, count, **settings):
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=dict(
+        {'AUTOEXTRACT_USER': 'user', 'AUTOEXTRACT_SLOT_POLICY': 'scrapy_default'}, **settings))
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler)
+    middleware = middleware_cls.from_crawler(crawler)
+    calls = []
+    for n in range(count):
+        request = spider.make_extract_request(f'https://blog.example.com/post-{n}', check_page_type=False)
+        api_request = middleware.process_request(request, spider)
+        calls.append(TextResponse(api_request.url, body=make_body(n), request=api_request))
+    return middleware, spider, calls
+
+
+def run(middleware, spider, calls):
+    items = []
+    while calls:
+        # The downloaded response is released after the middleware, as in a crawl
+        response = calls.pop()
+        response = middleware.process_response(response.request, response, spider)
+        items.extend(spider.parse_item(response))
+    return items
+
+
+def measure(name, middleware_cls, count, **settings):
+    middleware, spider, calls = setup(middleware_cls, count, **settings)
+    start = time.process_time()
+    run(middleware, spider, calls)
+    cpu = (time.process_time() - start) / count
+
+    middleware, spider, calls = setup(middleware_cls, 100, **settings)
+    tracemalloc.start()
+    run(middleware, spider, [calls.pop()])
+    before = tracemalloc.get_traced_memory()[0]
+    items, peak = [], 0
+    while calls:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        items.extend(run(middleware, spider, [calls.pop()]))
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{name:<16} {cpu * 1e6:>8.0f} us/item  {(after - before) / len(items):>8.0f} bytes/item kept  '
+          f'{peak:>8.0f} bytes peak/response')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f'Response body: {len(make_body(0))} bytes')
+    measure('standard', AutoExtractMiddleware, count)
+    measure('lean', LeanAutoExtractMiddleware, count, AUTOEXTRACT_LEAN_DECODING=True)
+    measure('lean + fields', LeanAutoExtractMiddleware, count, AUTOEXTRACT_LEAN_DECODING=True,
+            AUTOEXTRACT_FIELDS=FIELDS)
+
+
+if __name__ == '__main__':
+    main()
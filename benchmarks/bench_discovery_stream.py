@@ -0,0 +1,98 @@
+"""
+Download and parse a big discovery page (a few MB of inline scripts, with links all over the page)
+from a local HTTP server:
+- full: the full page is downloaded and parsed
+- max bytes: the page is cut after DISCOVERY_MAX_BYTES
+- head only: the article source page is cut after the head, that has the feed links
+
+Reports the downloaded bytes, the download time, and the time and peak memory of parsing
+the feed links and the links to follow.
+
+> python benchmarks/bench_discovery_stream.py [page size in MB]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from twisted.internet import defer, reactor
+from twisted.web import resource, server
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.http import Request
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+
+def make_page(size):
+    head = (b'<html><head><title>Blog</title>'
+            b'<link rel="alternate" type="application/rss+xml" href="/feed.xml">'
+            b'<script>window.__STATE__ = {"posts": []};</script></head><body>')
+    script = b'<script>var chunk = "' + b'x' * 50000 + b'";</script>'
+    links = b''.join(b'<a href="/post-%d">Post %d</a>' % (n, n) for n in range(50))
+    body = []
+    while len(head) + sum(map(len, body)) < size:
+        body.extend([links, script])
+    return head + b''.join(body) + b'</body></html>'
+
+
+class PageResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, page):
+        super().__init__()
+        self.page = page
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/html; charset=utf-8')
+        return self.page
+
+
+@defer.inlineCallbacks
+def measure(name, url, settings):
+    settings = dict(settings, DISCOVERY_STREAMING_ENABLED=True)
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=settings)
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler)
+    handler = HTTP11DownloadHandler.from_crawler(crawler)
+
+    request = Request(url, callback=spider.parse_source, meta={'source_url': url})
+    start = time.perf_counter()
+    response = yield handler.download_request(request, spider)
+    download_time = time.perf_counter() - start
+    response = response.replace(request=request)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    feeds = spider.get_feed_urls(response)
+    links = spider.rules[0].link_extractor.extract_links(response)
+    parse_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f'{name:<12} {len(response.body) / 1024:>8.0f} KB {1000 * download_time:>8.1f} ms download '
+          f'{1000 * parse_time:>8.1f} ms parse {peak / 1024 / 1024:>8.1f} MB peak '
+          f'{len(feeds):>3} feeds {len(links):>5} links')
+    yield handler.close()
+
+
+@defer.inlineCallbacks
+def run(url):
+    yield measure('full', url, {'DISCOVERY_MAX_BYTES': 0})
+    yield measure('max bytes', url, {'DISCOVERY_MAX_BYTES': 1024 * 1024})
+    yield measure('head only', url, {'DISCOVERY_MAX_BYTES': 1024 * 1024, 'DISCOVERY_HEAD_ONLY': True})
+    reactor.stop()
+
+
+def main():
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    page = make_page(int(size * 1024 * 1024))
+    port = reactor.listenTCP(0, server.Site(PageResource(page)), interface='127.0.0.1')
+    print(f'Page of {len(page) / 1024:.0f} KB')
+    reactor.callWhenRunning(run, f'http://127.0.0.1:{port.getHost().port}/')
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
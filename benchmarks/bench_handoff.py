@@ -0,0 +1,47 @@
+"""
+Measure the throughput of the handoff queue between the discovery and the extraction jobs,
+for several batch sizes: how many candidates per second are added by a discovery job,
+and claimed and finished by an extraction job; and the size of the queue on disk.
+
+> python benchmarks/bench_handoff.py [number of candidates]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.handoff import HandoffQueue  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f'{"batch":>6}   {"discovery":>14}   {"extraction":>14}   {"disk":>12}')
+    for batch_size in [1, 10, 100, 1000, 10000]:
+        # Only a sample with tiny batches, too slow otherwise
+        total = count if batch_size >= 100 else count // 100
+        with tempfile.TemporaryDirectory() as path:
+            crawler = get_crawler(settings_dict={'HANDOFF_DIR': path, 'HANDOFF_BATCH_SIZE': batch_size})
+            queue = HandoffQueue(crawler, 'discovery')
+            start = time.perf_counter()
+            for n in range(total):
+                meta = {'source_url': f'https://site{n % 1000}.com/', 'link_text': f'Article {n}', 'depth': n % 3}
+                queue.put(f'https://site{n % 1000}.com/news/article-{n}', 'article', meta)
+            queue.spider_closed(None)
+            put_rate = total / (time.perf_counter() - start)
+
+            queue = HandoffQueue(crawler, 'extraction')
+            start = time.perf_counter()
+            for candidate in queue.consume():
+                queue.done({'handoff_id': candidate['id']})
+            queue.spider_closed(None)
+            consume_rate = total / (time.perf_counter() - start)
+            assert crawler.stats.get_value('handoff/queue/done') == total
+            size = os.path.getsize(os.path.join(path, 'candidates.db'))
+        print(f'{batch_size:>6}   {put_rate:>10,.0f} /s   {consume_rate:>10,.0f} /s   {size / total:>6.0f} B/URL')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure the memory and the time of the per host page counters of a broad crawl,
+as the number of hosts grows (long tail of hosts, a few very active ones):
+- exact: a dict of host -> count, like scrapy_count_filter
+- approximate: HostCounter, with exact counts for the top hosts and a count-min sketch for the others;
+  also the largest over-estimate and the number of hosts that would reach a limit of 1000 pages too early
+
+> python benchmarks/bench_host_counters.py [number of pages]
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.counters import HostCounter  # noqa: E402
+
+PAGE_LIMIT = 1000
+
+
+def make_hosts(pages, hosts):
+    """
+    Half of the pages from a few very active hosts, the other half from a long tail of hosts.
+    """
+    rnd = random.Random(pages)
+    return [f'www.site{min(int(rnd.paretovariate(1.0)), 1000)}-example.com' if rnd.random() < 0.5
+            else f'www.tail{rnd.randrange(hosts)}-example.com' for _ in range(pages)]
+
+
+def measure(make_counter, pages):
+    tracemalloc.start()
+    counter = make_counter()
+    for host in pages:
+        # A new string for each page, like urlparse_cached(request).netloc.lower()
+        counter[host.lower()] += 1
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    counter = make_counter()
+    start = time.perf_counter()
+    for host in pages:
+        host = host.lower()
+        counter[host] += 1
+        counter[host]
+    elapsed = time.perf_counter() - start
+    return counter, 1e6 * elapsed / len(pages), memory
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f'{"tail":>8} {"hosts":>8}   {"exact":>22}   {"approximate (top 10k, error 1e-5)":>52}')
+    for hosts in [10000, 100000, 1000000, 10000000]:
+        pages = make_hosts(count, hosts)
+        exact, exact_time, exact_memory = measure(lambda: defaultdict(int), pages)
+        approx, approx_time, approx_memory = measure(lambda: HostCounter(10000, error=0.00001), pages)
+        errors = [approx[host] - n for host, n in exact.items()]
+        dropped = sum(1 for host, n in exact.items() if n <= PAGE_LIMIT < approx[host])
+        print(f'{hosts:>8} {len(exact):>8}   {exact_memory / 2 ** 20:>6.1f} MB {exact_time:>5.2f} us/page   '
+              f'{approx_memory / 2 ** 20:>6.1f} MB {approx_time:>5.2f} us/page   '
+              f'max error {max(errors):>3}, dropped early {dropped}')
+
+
+if __name__ == '__main__':
+    main()
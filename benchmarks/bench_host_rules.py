@@ -0,0 +1,71 @@
+"""
+Measure the cost of filtering the links of a page with the per host extract rules,
+as the number of hosts and the number of patterns of each host grow:
+- link extractor: a LinkExtractor for each host, with one regex for each pattern
+- host rules: the compiled HostExtractRules (combined regexes, looked up by host)
+
+> python benchmarks/bench_host_rules.py [number of links]
+"""
+import os
+import sys
+import time
+import random
+
+from scrapy.linkextractors import LinkExtractor
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.link_rules import HostExtractRules  # noqa: E402
+
+
+def make_rules(hosts, patterns):
+    rnd = random.Random(hosts * patterns)
+    words = ['news', 'blog', 'shop', 'products', 'category', 'p', 'item', 'tag', 'author', 'page']
+    rules = {}
+    for h in range(hosts):
+        allow = [f'/{rnd.choice(words)}/{rnd.choice(words)}-{n}/' for n in range(patterns)]
+        # A few real regexes
+        allow.append(r'/[0-9]{4}/[0-9]{2}/')
+        rules[f'site{h}.com'] = {'allow': allow, 'deny': [r'\?replytocom=', '/tag/', '/author/']}
+    return rules
+
+
+def make_links(hosts, patterns, count):
+    rnd = random.Random(count)
+    links = []
+    for n in range(count):
+        host = f'www.site{rnd.randrange(hosts)}.com'
+        path = rnd.choice([f'/news/blog-{rnd.randrange(patterns)}/article-{n}', f'/2021/05/story-{n}',
+                           f'/tag/x{n}', f'/shop/item-{n}.html'])
+        links.append((host, f'https://{host}{path}'))
+    return links
+
+
+def measure(name, check, links):
+    start = time.perf_counter()
+    allowed = sum(1 for host, url in links if check(host, url))
+    elapsed = time.perf_counter() - start
+    return f'{name} {1e6 * elapsed / len(links):>7.2f} us/link ({allowed} allowed)'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"hosts":>6} {"patterns":>8}')
+    for hosts, patterns in [(10, 10), (100, 10), (1000, 10), (10000, 10), (10, 100), (10, 1000), (10, 5000)]:
+        rules = make_rules(hosts, patterns)
+        links = make_links(hosts, patterns, count)
+
+        # The rules of each host are compiled when they're first used
+        start = time.perf_counter()
+        host_rules = HostExtractRules(rules)
+        for host in rules:
+            host_rules.get(host)
+        compile_time = time.perf_counter() - start
+        result = [measure('host rules', lambda host, url: host_rules.get(host).matches(url, host), links)]
+        if hosts * patterns <= 10000:
+            extractors = {f'www.{host}': LinkExtractor(**r) for host, r in rules.items()}
+            result.append(measure('link extractor', lambda host, url: extractors[host].matches(url), links))
+        print(f'{hosts:>6} {patterns:>8}   compile {1000 * compile_time:>7.1f} ms   ' + '   '.join(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Compare the AutoExtract requests sent over HTTP/1.1 (one connection for each concurrent request)
+and over the multiplexed HTTP/2 connections, against a local TLS mock of the AutoExtract API
+that supports both protocols (ALPN "h2" and "http/1.1") and answers after a small delay.
+
+Reports the latency of the first requests, opening the connections ("cold"), the latency of
+the next requests (average and p95) and the client CPU time per request.
+
+> python benchmarks/bench_http2.py [number of requests] [concurrency] [server delay in ms]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import resource
+import subprocess
+import datetime
+
+from twisted.internet import defer, reactor, ssl
+from twisted.internet.task import deferLater
+from twisted.protocols.tls import TLSMemoryBIOFactory
+from twisted.web import resource as web_resource, server
+
+from scrapy import Request, Spider
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.h2pool import MultiplexedH2DownloadHandler  # noqa: E402
+
+PORT = 8443
+RESULT = [{'query': {'userQuery': {'url': 'https://example.com/product', 'pageType': 'product'}},
+           'product': {'name': 'Product', 'offers': [{'price': '10.00', 'currency': 'USD'}],
+                       'probability': 0.98, 'description': 'A product. ' * 50}}]
+
+
+class ExtractResource(web_resource.Resource):
+    isLeaf = True
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def render_POST(self, request):
+        def finish():
+            request.setHeader(b'Content-Type', b'application/json')
+            request.write(json.dumps(RESULT).encode())
+            request.finish()
+        deferLater(reactor, self.delay, finish)
+        return server.NOT_DONE_YET
+
+
+class NoDelayTLSFactory(TLSMemoryBIOFactory):
+    """
+    The HTTP/2 frames are written separately, without TCP_NODELAY each response waits for a delayed ACK.
+    """
+
+    def buildProtocol(self, addr):
+        protocol = super().buildProtocol(addr)
+        make_connection = protocol.makeConnection
+
+        def make_no_delay_connection(transport):
+            transport.setTcpNoDelay(True)
+            make_connection(transport)
+        protocol.makeConnection = make_no_delay_connection
+        return protocol
+
+
+def make_certificate(directory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.utcnow()
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    path = os.path.join(directory, 'server.pem')
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return path
+
+
+def run_server(pem_path, delay):
+    with open(pem_path) as f:
+        certificate = ssl.PrivateCertificate.loadPEM(f.read())
+    options = ssl.CertificateOptions(privateKey=certificate.privateKey.original,
+                                     certificate=certificate.original,
+                                     acceptableProtocols=[b'h2', b'http/1.1'])
+    site = server.Site(ExtractResource(delay))
+    reactor.listenTCP(PORT, NoDelayTLSFactory(options, False, site), interface='127.0.0.1')
+    reactor.run()
+
+
+@defer.inlineCallbacks
+def measure(name, handler, count, concurrency):
+    spider = Spider('bench')
+    url = f'https://localhost:{PORT}/v1/extract'
+    latencies = []
+
+    @defer.inlineCallbacks
+    def worker(numbers):
+        for n in numbers:
+            request = Request(url, method='POST', body=json.dumps([{'url': f'https://example.com/{n}'}]),
+                              meta={AUTOEXTRACT_META_KEY: {'original_url': f'https://example.com/{n}'}})
+            start = time.perf_counter()
+            response = yield handler.download_request(request, spider)
+            assert response.status == 200, response.status
+            latencies.append(time.perf_counter() - start)
+
+    # The first requests open the connections (TCP and TLS handshakes)
+    yield defer.DeferredList([worker([n]) for n in range(concurrency)])
+    cold = max(latencies)
+    latencies.clear()
+
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    yield defer.DeferredList([worker(range(n, count, concurrency)) for n in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+
+    latencies.sort()
+    print(f'{name:<28} {1000 * cold:>8.1f} ms cold {1000 * sum(latencies) / len(latencies):>8.1f} ms avg '
+          f'{1000 * latencies[int(len(latencies) * 0.95)]:>8.1f} ms p95 '
+          f'{1e6 * cpu / count:>8.0f} us CPU/request {count / elapsed:>8.0f} requests/s')
+    yield handler.close()
+
+
+@defer.inlineCallbacks
+def run_client(count, concurrency):
+    settings = {'AUTOEXTRACT_URL': f'https://localhost:{PORT}/v1/extract',
+                'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency}
+    crawler = get_crawler(Spider, settings_dict=settings)
+    yield measure('HTTP/1.1', HTTP11DownloadHandler.from_crawler(crawler), count, concurrency)
+    for max_connections in (1, 2):
+        # The streams are spread over all the connections
+        crawler = get_crawler(Spider, settings_dict=dict(
+            settings, AUTOEXTRACT_HTTP2_MAX_CONNECTIONS=max_connections,
+            AUTOEXTRACT_HTTP2_MAX_STREAMS=-(-concurrency // max_connections)))
+        yield measure(f'HTTP/2, {max_connections} connection(s)', MultiplexedH2DownloadHandler.from_crawler(crawler),
+                      count, concurrency)
+    reactor.stop()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--server':
+        run_server(sys.argv[2], float(sys.argv[3]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    delay = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        pem_path = make_certificate(directory)
+        mock = subprocess.Popen([sys.executable, __file__, '--server', pem_path, str(delay)])
+        try:
+            time.sleep(1)
+            print(f'{count} requests, concurrency {concurrency}, server delay {1000 * delay:.0f} ms')
+            reactor.callWhenRunning(run_client, count, concurrency)
+            reactor.run()
+        finally:
+            mock.terminate()
+            mock.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure the cost of the same-origin filter, as the number of seeds grows:
+- list + regex: the seed hosts in the "allowed_domains" list, scanned for each link,
+  and the Scrapy OffsiteMiddleware regex, built from the same list and searched for each request
+- allowed hosts: the hashed sets of AllowedHosts
+
+> python benchmarks/bench_offsite.py [number of links]
+"""
+import os
+import sys
+import time
+import random
+from urllib.parse import urlsplit
+
+from scrapy.spidermiddlewares.offsite import OffsiteMiddleware
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.offsite import AllowedHosts  # noqa: E402
+
+
+class Spider:
+    name = 'bench'
+
+    def __init__(self, allowed_domains):
+        self.allowed_domains = allowed_domains
+
+
+def make_links(seeds, count):
+    rnd = random.Random(count)
+    links = []
+    for n in range(count):
+        if rnd.random() < 0.5:
+            host = f'www.site{rnd.randrange(seeds)}.com'
+        else:
+            host = rnd.choice(['facebook.com', 'twitter.com', 'cdn.example.net', f'ads{n % 100}.com'])
+        links.append(f'https://{host}/page-{n}')
+    return links
+
+
+def measure(check, links):
+    start = time.perf_counter()
+    allowed = sum(1 for url in links if check(url))
+    return 1e6 * (time.perf_counter() - start) / len(links), allowed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f'{"seeds":>7}   {"list + regex":>44}   {"allowed hosts":>44}')
+    middleware = OffsiteMiddleware(get_crawler().stats)
+    for seeds in [10, 1000, 10000, 100000]:
+        seed_urls = [f'https://www.site{n}.com/' for n in range(seeds)]
+        links = make_links(seeds, count)
+
+        start = time.perf_counter()
+        allowed_domains = ['autoextract.scrapinghub.com']
+        allowed_domains.extend(urlsplit(u).netloc.lower() for u in seed_urls)
+        host_regex = middleware.get_host_regex(Spider(allowed_domains))
+        build = time.perf_counter() - start
+        # Only a few links with many seeds, the list scan is too slow
+        sample = links[:max(100, count * 100 // seeds)]
+        list_time, _ = measure(lambda url: urlsplit(url).netloc.lower() in allowed_domains, sample)
+        regex_time, allowed = measure(lambda url: bool(host_regex.search(urlsplit(url).hostname)), sample)
+        old = f'build {1000 * build:>7.1f} ms  {list_time:>8.2f} + {regex_time:>8.2f} us/link ({allowed})'
+
+        start = time.perf_counter()
+        allowed_hosts = AllowedHosts(['autoextract.scrapinghub.com'])
+        allowed_hosts.add(seed_urls)
+        build = time.perf_counter() - start
+        list_time, _ = measure(lambda url: urlsplit(url).netloc in allowed_hosts, sample)
+        regex_time, allowed = measure(lambda url: allowed_hosts.allows(urlsplit(url).hostname), sample)
+        new = f'build {1000 * build:>7.1f} ms  {list_time:>8.2f} + {regex_time:>8.2f} us/link ({allowed})'
+        print(f'{seeds:>7}   {old}   {new}')
+
+
+if __name__ == '__main__':
+    main()
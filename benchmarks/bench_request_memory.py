@@ -0,0 +1,60 @@
+"""
+Measure the memory used by each queued AutoExtract request:
+- previous behaviour: Request objects, with new AutoExtract meta dicts for every request
+- shared meta: Request objects, with the shared read-only AutoExtract meta
+- compact queue: the same requests, kept in the memory queue as compact records
+
+> python benchmarks/bench_request_memory.py [number of requests]
+"""
+import os
+import sys
+import tracemalloc
+
+from scrapy.squeues import FifoMemoryQueue
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.autoextract_spider import USER_AGENT  # noqa: E402
+from autoextract_spiders.squeues import CompactFifoMemoryQueue  # noqa: E402
+
+
+def make_request(spider, n, fresh_meta):
+    # The source URLs are parsed from responses, so they are new strings every time
+    source_url = ''.join(['https://shop', str(n % 50), '.example.com/'])
+    request = spider.make_extract_request(f'{source_url}products/item-{n}.html',
+                                          meta={'source_url': source_url,
+                                                'link_text': f'Product {n}',
+                                                'depth': 2},
+                                          check_page_type=False)
+    if fresh_meta:
+        request.meta['source_url'] = source_url
+        request.meta['autoextract'] = {'enabled': True,
+                                       'headers': {'User-Agent': USER_AGENT},
+                                       'pageType': spider.page_type}
+    return request
+
+
+def measure(name, queue, spider, count, fresh_meta=False):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for n in range(count):
+        queue.push(make_request(spider, n, fresh_meta))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{name:<20} {(after - before) / count:>8.0f} bytes/request')
+    while queue.pop():
+        pass
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    crawler = get_crawler(ProductAutoExtract)
+    crawler.spider = spider = ProductAutoExtract.from_crawler(crawler)
+    measure('previous behaviour', FifoMemoryQueue(), spider, count, fresh_meta=True)
+    measure('shared meta', FifoMemoryQueue(), spider, count)
+    measure('compact queue', CompactFifoMemoryQueue.from_crawler(crawler), spider, count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare the compact disk queue with the Scrapy pickle disk queue:
+enqueue and dequeue rate, and the size on disk.
+
+> python benchmarks/bench_squeues.py [number of requests]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from scrapy.http import Request
+from scrapy.squeues import PickleFifoDiskQueue
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.squeues import CompactFifoDiskQueue  # noqa: E402
+
+
+def make_requests(spider, count):
+    requests = []
+    for n in range(count):
+        source_url = f'https://shop{n % 50}.example.com/'
+        if n % 2:
+            requests.append(spider.make_extract_request(
+                f'{source_url}products/item-{n}.html',
+                meta={'source_url': source_url, 'link_text': f'Product {n}', 'depth': 2},
+                check_page_type=False))
+        else:
+            requests.append(Request(f'{source_url}category/{n}?page=2',
+                                    meta={'source_url': source_url, 'depth': 1, 'fingerprint_prefix': 's'},
+                                    callback=spider.parse_page,
+                                    errback=spider.errback_page))
+    return requests
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def bench(name, queue_cls, crawler, requests):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'queue')
+    try:
+        q = queue_cls.from_crawler(crawler, path)
+        start = time.perf_counter()
+        for request in requests:
+            q.push(request)
+        push_time = time.perf_counter() - start
+        q.close()
+        size = dir_size(path)
+
+        q = queue_cls.from_crawler(crawler, path)
+        start = time.perf_counter()
+        while q.pop():
+            pass
+        pop_time = time.perf_counter() - start
+        q.close()
+    finally:
+        shutil.rmtree(tmp)
+
+    count = len(requests)
+    print(f'{name:<24} enqueue {count / push_time:>10,.0f} req/s   dequeue {count / pop_time:>10,.0f} req/s   '
+          f'disk {size / count:>7.1f} bytes/req')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, queue_cls, settings in (
+            ('pickle', PickleFifoDiskQueue, {}),
+            ('compact', CompactFifoDiskQueue, {}),
+            ('compact + compression', CompactFifoDiskQueue, {'COMPACT_QUEUE_COMPRESSION': True})):
+        crawler = get_crawler(ProductAutoExtract, settings_dict=settings)
+        crawler.spider = ProductAutoExtract.from_crawler(crawler)
+        bench(name, queue_cls, crawler, make_requests(crawler.spider, count))
+
+
+if __name__ == '__main__':
+    main()
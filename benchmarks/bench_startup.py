@@ -0,0 +1,88 @@
+"""
+Measure the startup of a short job: the time from launching "scrapy crawl" until the first request
+reaches a local HTTP server (time to first request), the import of the spiders, alone,
+in a fresh interpreter, and the parsing of the spider arguments (from_crawler and open_spider).
+
+> python benchmarks/bench_startup.py [number of runs]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+
+ARGS = {
+    'count-limits': '{page_count: 1000, item_count: 100}',
+    'extract-rules': '{allow: [/products/, /shop/], deny: [/tag/, /author/]}',
+    'allow-links': '[/products/, /category/]',
+    'ignore-links': '[/cart, /login]',
+    'page-types': '[product, article]',
+    'same-domain': 'true',
+    'max-items': '50',
+    'max-pages': '500',
+}
+
+
+class FirstRequest(BaseHTTPRequestHandler):
+    arrived = None
+
+    def do_GET(self):
+        if FirstRequest.arrived is None:
+            FirstRequest.arrived = time.perf_counter()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(b'<html><body>seed</body></html>')
+
+    def log_message(self, *args):
+        pass
+
+
+def time_to_first_request(port: int) -> float:
+    FirstRequest.arrived = None
+    command = [sys.executable, '-m', 'scrapy', 'crawl', 'products', '-a', f'seeds=http://127.0.0.1:{port}/',
+               '-s', 'FRONTERA_DISABLED=True', '-s', 'CLOSESPIDER_PAGECOUNT=1', '-s', 'LOG_ENABLED=False',
+               '-s', 'TELNETCONSOLE_ENABLED=False', '-s', 'AUTOEXTRACT_USER=bench']
+    for name, value in ARGS.items():
+        command += ['-a', f'{name}={value}']
+    start = time.perf_counter()
+    subprocess.run(command, check=True)
+    assert FirstRequest.arrived, 'The seed was not requested'
+    return FirstRequest.arrived - start
+
+
+def import_time() -> float:
+    code = 'import time; t = time.perf_counter(); import autoextract_spiders.spiders; print(time.perf_counter() - t)'
+    return float(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def args_time(runs: int = 200) -> float:
+    crawlers = [get_crawler(ProductAutoExtract) for _ in range(runs)]
+    start = time.perf_counter()
+    for crawler in crawlers:
+        spider = ProductAutoExtract.from_crawler(crawler, seeds='[https://shop.com/, https://blog.com/]', **ARGS)
+        spider.open_spider()
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FirstRequest)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    first = [time_to_first_request(server.server_port) for _ in range(runs)]
+    server.shutdown()
+    imports = [import_time() for _ in range(runs)]
+    print(f'time to first request: {1000 * statistics.median(first):6.0f} ms (median of {runs})')
+    print(f'import of the spiders: {1000 * statistics.median(imports):6.0f} ms')
+    print(f'spider arguments:      {1000 * args_time():6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
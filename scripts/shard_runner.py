@@ -0,0 +1,4 @@
+from autoextract_spiders.runner import main
+
+if __name__ == '__main__':
+    main()
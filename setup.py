@@ -18,6 +18,6 @@ setup(
     author='Scrapinghub Inc',
     description='Scrapinghub AutoExtract spiders',
     packages=find_packages(exclude=['tests']),
-    scripts=['scripts/hcfpal.py', 'scripts/manager.py'],
+    scripts=['scripts/hcfpal.py', 'scripts/manager.py', 'scripts/shard_runner.py'],
     entry_points={'scrapy': ['settings = autoextract_spiders.settings']},
 )
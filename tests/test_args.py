@@ -0,0 +1,53 @@
+import os
+import sys
+import pytest
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.args import SpiderArgs, load_yaml  # noqa: E402
+
+
+def test_load_yaml():
+    assert load_yaml('{"page_count": 10}') == {'page_count': 10}
+    assert load_yaml('{page_count: 10}') == {'page_count': 10}
+    assert load_yaml('[/products/, /shop/]') == ['/products/', '/shop/']
+    assert load_yaml('true') is True
+    assert load_yaml('no') is False
+    assert load_yaml('50') == 50
+    assert load_yaml('https://shop.com/') == 'https://shop.com/'
+    assert load_yaml({'allow': '/a/'}) == {'allow': '/a/'}
+    # Only the safe YAML
+    with pytest.raises(Exception):
+        load_yaml('!!python/object/apply:os.getcwd []')
+
+
+def test_spider_args_parsed_once():
+    args = SpiderArgs({'count-limits': '{page_count: 10}', 'max_items': '5', 'page-types': 'product, article',
+                       'seeds': '[https://a.com/, https://b.com/]', 'extract-rules': '{allow: [/a/'})
+    assert args.get('count_limits') == args.get('count-limits') == '{page_count: 10}'
+    assert args.count_limits is args.count_limits
+    assert args.max_items == 5
+    assert args.max_pages is None
+    assert args.page_types == ['product', 'article']
+    assert args.seeds == ['https://a.com/', 'https://b.com/']
+    # The seeds string is not kept
+    assert args.get('seeds') is None
+    assert args.discovery_only is None
+    with pytest.raises(ValueError):
+        args.extract_rules
+
+
+def test_spider_typed_args():
+    crawler = get_crawler(ProductAutoExtract)
+    spider = ProductAutoExtract.from_crawler(crawler, seeds='https://shop.com/', **{
+        'discovery-only': 'true', 'same-domain': 'false', 'allow-links': '[/products/]',
+        'count-limits': '{page_count: 20}'})
+    spider.open_spider()
+    assert spider.seed_urls == ['https://shop.com/']
+    assert not hasattr(spider, 'seeds')
+    assert spider.only_discovery is True
+    assert spider.same_origin is False
+    assert spider.extract_rules == {'allow': ['/products/']}
+    assert spider.count_limits == {'page_count': 20}
+    assert spider.get_arg('allow-links') == spider.get_arg('allow_links') == '[/products/]'
@@ -0,0 +1,207 @@
+import os
+import sys
+import pytest
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from scrapy.http import Request, Response, TextResponse
+from scrapy.spiders import Spider
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TCPTimedOutError
+from twisted.internet.task import Clock
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.breaker import AUTOEXTRACT_META_KEY, CircuitBreakerMiddleware  # noqa: E402
+from autoextract_spiders.feeder import SeedFeeder  # noqa: E402
+
+API_URL = 'https://autoextract.scrapinghub.com/v1/extract'
+
+
+class Engine:
+    def __init__(self, spider):
+        self.spider = spider
+        self.crawled = []
+
+    def crawl(self, request, spider):
+        self.crawled.append(request)
+
+
+def _make_middleware(**settings):
+    settings = dict({'HOST_BREAKER_ENABLED': True, 'HOST_BREAKER_WINDOW': 4, 'HOST_BREAKER_MIN_REQUESTS': 4,
+                     'HOST_BREAKER_OPEN_TIME': 60, 'RETRY_DELAY': 5}, **settings)
+    crawler = get_crawler(Spider, settings_dict=settings)
+    spider = Spider.from_crawler(crawler, name='test')
+    crawler.engine = Engine(spider)
+    clock = Clock()
+    return CircuitBreakerMiddleware(crawler, clock), crawler, clock, spider
+
+
+def _api_request(url):
+    return Request(API_URL, method='POST', meta={AUTOEXTRACT_META_KEY: {'original_url': url}})
+
+
+def _fail(mw, spider, url, status=503):
+    request = Request(url)
+    with pytest.raises(IgnoreRequest):
+        mw.process_response(request, Response(url, status=status), spider)
+
+
+def test_site_errors_open_the_breaker():
+    mw, crawler, clock, spider = _make_middleware()
+    stats = crawler.stats
+    ok = 'https://good.com/page'
+    assert mw.process_response(Request(ok), Response(ok), spider).status == 200
+    for n in range(4):
+        _fail(mw, spider, f'https://bad.com/page{n}')
+    assert stats.get_value('breaker/opened') == 1
+    # The retries wait in the delay queue, they're not sent right away
+    assert stats.get_value('retry/delayed') == 4
+    assert len(mw.delayed) == 4
+    assert crawler.engine.crawled == []
+    with pytest.raises(DontCloseSpider):
+        mw.spider_idle(spider)
+
+    # The requests of the paused host are put aside, the other hosts continue
+    with pytest.raises(IgnoreRequest):
+        mw.process_request(Request('https://bad.com/other'), spider)
+    assert mw.process_request(Request(ok), spider) is None
+    assert stats.get_value('breaker/paused_requests') == 1
+
+    clock.advance(7)
+    assert len(crawler.engine.crawled) == 4
+    assert all(r.meta['retry_times'] == 1 and r.dont_filter for r in crawler.engine.crawled)
+
+    # One probe after the pause; the others wait for its result
+    clock.advance(60)
+    probe = Request('https://bad.com/probe')
+    assert mw.process_request(probe, spider) is None
+    with pytest.raises(IgnoreRequest):
+        mw.process_request(Request('https://bad.com/waiting'), spider)
+    assert stats.get_value('breaker/probes') == 1
+    # The probe failed: a longer pause
+    _fail(mw, spider, probe.url)
+    assert stats.get_value('breaker/reopened') == 1
+    clock.advance(100)
+    with pytest.raises(IgnoreRequest):
+        mw.process_request(Request('https://bad.com/later'), spider)
+    clock.advance(30)
+    assert mw.process_request(probe, spider) is None
+    mw.process_response(probe, Response(probe.url), spider)
+    assert stats.get_value('breaker/closed') == 1
+    assert stats.get_value('breaker/open_hosts') == 0
+    assert mw.process_request(Request('https://bad.com/again'), spider) is None
+
+    mw.spider_closed(spider)
+    assert len(mw.delayed) == 0
+
+
+def test_paused_requests_leave_the_feeder_count():
+    mw, crawler, clock, spider = _make_middleware(SEED_FEEDER_MAX_QUEUED=0)
+    spider.count_limits = {}
+    feeder = SeedFeeder.from_crawler(crawler, spider, Request)
+    feeder.add(['https://bad.com/'])
+    assert feeder.feed() == 1
+    for n in range(4):
+        _fail(mw, spider, f'https://bad.com/page{n}')
+    seed = crawler.engine.crawled[-1]
+    # Paused and scheduled again after the pause, as many times as needed
+    for _ in range(3):
+        feeder.request_scheduled(seed, spider)
+        assert feeder.active == {'bad.com': 1}
+        with pytest.raises(IgnoreRequest):
+            mw.process_request(seed, spider)
+        assert feeder.active == {'bad.com': 0}
+    # The paused host doesn't keep its place among the active hosts
+    feeder.feed()
+    assert feeder.active == {}
+    assert crawler.stats.get_value('seeds/finished_hosts') == 1
+
+
+def test_api_errors_dont_count_for_the_site():
+    mw, crawler, clock, spider = _make_middleware(AUTOEXTRACT_RETRY_DELAY=10)
+    stats = crawler.stats
+    url = 'https://shop.com/product'
+    for _ in range(6):
+        request = _api_request(url)
+        with pytest.raises(IgnoreRequest):
+            mw.process_response(request, Response(API_URL, status=429), spider)
+        with pytest.raises(IgnoreRequest):
+            mw.process_exception(request, TCPTimedOutError(), spider)
+    assert not stats.get_value('breaker/opened')
+    assert stats.get_value('retry/autoextract/429') == 6
+    assert stats.get_value('retry/autoextract/count') == 12
+    assert mw.process_request(_api_request(url), spider) is None
+    # The API retries are delayed longer
+    clock.advance(7)
+    assert crawler.engine.crawled == []
+    clock.advance(6)
+    assert len(crawler.engine.crawled) == 12
+
+    # The site couldn't be downloaded by AutoExtract
+    body = b'[{"query": {}, "error": "Downloader error: http404"}]'
+    for _ in range(4):
+        response = TextResponse(API_URL, body=body)
+        assert mw.process_response(_api_request(url), response, spider) is response
+    assert stats.get_value('breaker/opened') == 1
+
+
+def test_probes_without_outcome():
+    mw, crawler, clock, spider = _make_middleware(HOST_BREAKER_PROBE_TIMEOUT=300)
+    stats = crawler.stats
+    url = 'https://shop.com/product'
+    body = b'[{"query": {}, "error": "Downloader error: http404"}]'
+    for _ in range(4):
+        mw.process_response(_api_request(url), TextResponse(API_URL, body=body), spider)
+    assert stats.get_value('breaker/opened') == 1
+    clock.advance(61)
+
+    # The API failed, the probe didn't check the site
+    probe = _api_request(url)
+    assert mw.process_request(probe, spider) is None
+    with pytest.raises(IgnoreRequest):
+        mw.process_response(probe, Response(API_URL, status=429), spider)
+    # Dropped by the next middlewares
+    probe = _api_request(url)
+    assert mw.process_request(probe, spider) is None
+    assert mw.process_exception(probe, IgnoreRequest(), spider) is None
+    # Another API error
+    probe = _api_request(url)
+    assert mw.process_request(probe, spider) is None
+    assert mw.process_response(probe, Response(API_URL, status=401), spider).status == 401
+    assert stats.get_value('breaker/probes_released') == 3
+
+    # The retry of a released probe is not the probe anymore
+    probe = _api_request(url)
+    assert mw.process_request(probe, spider) is None
+    clock.advance(20)
+    retry = crawler.engine.crawled[0]
+    assert 'breaker_probe' not in retry.meta
+    with pytest.raises(IgnoreRequest):
+        mw.process_request(retry, spider)
+    assert mw.hosts['shop.com'].probing
+    # A probe without any result is replaced
+    clock.advance(300)
+    assert mw.process_request(_api_request(url), spider) is None
+    assert stats.get_value('breaker/probes_timed_out') == 1
+    assert stats.get_value('breaker/probes') == 5
+    # The late result of the old probe doesn't release the new one
+    mw.process_exception(probe, IgnoreRequest(), spider)
+    assert mw.hosts['shop.com'].probing
+    assert stats.get_value('breaker/probes_released') == 3
+
+
+def test_slow_responses():
+    mw, crawler, _, spider = _make_middleware(HOST_BREAKER_SLOW=10)
+    for n in range(4):
+        request = Request(f'https://slow.com/{n}', meta={'download_latency': 20.0})
+        mw.process_response(request, Response(request.url), spider)
+    assert crawler.stats.get_value('breaker/slow_responses') == 4
+    assert crawler.stats.get_value('breaker/opened') == 1
+    assert mw.hosts['slow.com'].latency == 20.0
+
+
+def test_disabled():
+    mw, crawler, _, spider = _make_middleware(HOST_BREAKER_ENABLED=False)
+    request = Request('https://bad.com/')
+    # The usual immediate retries
+    retry = mw.process_response(request, Response(request.url, status=429), spider)
+    assert isinstance(retry, Request) and retry.meta['retry_times'] == 1
+    assert len(mw.delayed) == 0
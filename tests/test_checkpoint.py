@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+from types import SimpleNamespace
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from scrapy_count_filter.middleware import GlobalCountFilterMiddleware
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.checkpoint import Checkpoint  # noqa: E402
+from autoextract_spiders.dupe_filter import DupeFilter  # noqa: E402
+from autoextract_spiders.counters import HostsCountFilterMiddleware  # noqa: E402
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+
+def _make_crawler(path, **settings):
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=dict({'CHECKPOINT_DIR': path}, **settings))
+    crawler.spider = ArticleAutoExtract.from_crawler(crawler)
+    middlewares = [GlobalCountFilterMiddleware(crawler), HostsCountFilterMiddleware(crawler)]
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(middleware=SimpleNamespace(middlewares=middlewares)))
+    return crawler, middlewares
+
+
+def _journal(path):
+    with open(os.path.join(path, 'journal.jl')) as fd:
+        return [json.loads(line) for line in fd]
+
+
+def test_checkpoint_save_restore(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    crawler, (global_mw, hosts_mw) = _make_crawler(path)
+    spider = crawler.spider
+    ext = Checkpoint.from_crawler(crawler)
+    ext.restore(spider)
+    assert sorted(os.listdir(path)) == ['journal.jl', 'state.json']
+
+    global_mw.counter['page_count'] = 10
+    hosts_mw.page_host_counter['example.com'] = 7
+    hosts_mw.item_host_counter['example.com'] = 3
+    spider.seed_feeder.add(['https://example.com/', 'https://other.com/', 'https://done.com/'], source='seeds')
+    spider.feed_urls['https://example.com/'] = ['https://example.com/rss.xml']
+    ext.save(spider)
+    # Nothing changed, nothing written
+    ext.save(spider)
+    hosts_mw.page_host_counter['other.com'] += 1
+    spider.seed_feeder.active_seeds['done.com'] = ['https://done.com/']
+    spider.seed_feeder.active['done.com'] = 0
+    spider.seed_feeder._release_hosts(['done.com'])
+    ext.save(spider)
+    first, second = _journal(path)
+    assert first['counters'] == {'global': {'page_count': 10}, 'page_host': {'example.com': 7},
+                                 'item_host': {'example.com': 3}}
+    assert first['spider']['feeds'] == {'https://example.com/': ['https://example.com/rss.xml']}
+    # Only the changes since the previous checkpoint
+    assert second['counters'] == {'page_host': {'other.com': 1}}
+    assert second['spider'] == {'seeds': {'pending': {'https://done.com/': None}}}
+
+    crawler, (global_mw, hosts_mw) = _make_crawler(path)
+    spider = crawler.spider
+    Checkpoint.from_crawler(crawler).restore(spider)
+    assert global_mw.counter['page_count'] == 10
+    assert hosts_mw.page_host_counter == {'example.com': 7, 'other.com': 1}
+    assert hosts_mw.item_host_counter['example.com'] == 3
+    assert list(spider.seed_feeder.pending) == ['https://example.com/', 'https://other.com/']
+    assert spider.feed_urls == {'https://example.com/': ['https://example.com/rss.xml']}
+    # The seeds from the spider arguments were already added
+    spider.seed_feeder.add(['https://example.com/'], source='seeds')
+    assert len(spider.seed_feeder.pending) == 2
+    assert crawler.stats.get_value('checkpoint/restored') == 1
+    # The journal was compacted into the state
+    assert _journal(path) == []
+
+
+def test_checkpoint_compaction(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    crawler, (_, hosts_mw) = _make_crawler(path, CHECKPOINT_COMPACT_SIZE=100)
+    spider = crawler.spider
+    ext = Checkpoint.from_crawler(crawler)
+    ext.restore(spider)
+    for n in range(10):
+        hosts_mw.page_host_counter[f'host{n}.com'] = n
+    ext.save(spider)
+    # The journal got larger than the state
+    assert _journal(path) == []
+    assert crawler.stats.get_value('checkpoint/compacted') == 2
+    hosts_mw.page_host_counter['host1.com'] = 5
+    ext.save(spider)
+    # A journal left by an older generation is ignored
+    with open(os.path.join(path, 'journal.jl'), 'a') as fd:
+        fd.write(json.dumps({'generation': 1, 'counters': {'page_host': {'host2.com': 0}}}) + '\n')
+        # Killed while writing
+        fd.write('{"generation": 2, "counters": {"page_')
+
+    crawler, (_, hosts_mw) = _make_crawler(path)
+    Checkpoint.from_crawler(crawler).restore(crawler.spider)
+    assert hosts_mw.page_host_counter['host1.com'] == 5
+    assert hosts_mw.page_host_counter['host2.com'] == 2
+
+
+def test_fingerprints_only_with_the_queue(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    # The queued requests are not saved, their fingerprints must not be either
+    assert DupeFilter.from_settings(Settings({'CHECKPOINT_DIR': path})).file is None
+    dupefilter = DupeFilter.from_settings(Settings({'CHECKPOINT_DIR': path, 'JOBDIR': str(tmpdir.join('job'))}))
+    assert dupefilter.file is not None
+    dupefilter.close('finished')
+
+
+def test_checkpoint_approximate_counters(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    settings = {'COUNT_FILTER_MAX_HOSTS': 1, 'COUNT_FILTER_ERROR': 0.001}
+    crawler, (_, hosts_mw) = _make_crawler(path, **settings)
+    ext = Checkpoint.from_crawler(crawler)
+    ext.restore(crawler.spider)
+    counter = hosts_mw.page_host_counter
+    for host, count in (('big.com', 5), ('tail.com', 3)):
+        for _ in range(count):
+            counter[host] += 1
+    assert list(counter) == ['big.com']
+    ext.compact(crawler.spider)
+    counter['other.com'] += 2
+    ext.save(crawler.spider)
+    assert _journal(path)[0]['counters'] == {'page_host_sketch': {'changed': {'other.com': 2}}}
+
+    crawler, (_, hosts_mw) = _make_crawler(path, **settings)
+    Checkpoint.from_crawler(crawler).restore(crawler.spider)
+    counter = hosts_mw.page_host_counter
+    # The hosts outside the top keep their counts, from the sketch
+    assert list(counter) == ['big.com']
+    assert counter['big.com'] == 5
+    assert counter['tail.com'] >= 3
+    assert counter['other.com'] >= 2
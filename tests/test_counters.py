@@ -0,0 +1,76 @@
+import os
+import sys
+import random
+from collections import Counter
+import pytest
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.checkpoint import TrackedCounter  # noqa: E402
+from autoextract_spiders.counters import CountMinSketch, HostCounter, HostsCountFilterMiddleware  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+
+
+def _zipf_hosts(count, hosts=20000, seed=1):
+    rnd = random.Random(seed)
+    return [f'site{int(rnd.paretovariate(0.8)) % hosts}.com' for _ in range(count)]
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(error=0.001, confidence=0.99)
+    assert (sketch.width, sketch.depth) == (2719, 5)
+    hosts = _zipf_hosts(100000)
+    for host in hosts:
+        sketch.add(host)
+    exact = Counter(hosts)
+    max_error = sketch.error * sketch.total
+    errors = [sketch.estimate(host) - count for host, count in exact.items()]
+    assert min(errors) >= 0
+    assert sum(e > max_error for e in errors) <= 0.01 * len(errors)
+    assert sketch.estimate('unknown.com') <= max_error
+    with pytest.raises(ValueError):
+        CountMinSketch(error=0)
+
+
+def test_host_counter_top_hosts():
+    counter = HostCounter(max_hosts=10, error=0.001)
+    hosts = _zipf_hosts(100000)
+    for host in hosts:
+        counter[host] += 1
+    exact = Counter(hosts)
+    assert len(counter) == 10
+    assert set(counter) == {host for host, _ in exact.most_common(10)}
+    for host in counter:
+        assert exact[host] <= counter[host] <= exact[host] + counter.sketch.error * counter.sketch.total
+    # Like the counter dicts
+    assert set(dict(counter)) == set(counter)
+    counter.update({'new.com': 5})
+    assert counter['new.com'] >= 5
+    # The changes are tracked only for the checkpoints
+    assert counter.changed is None
+    assert counter.changes() == {}
+    counter['new.com'] += 1
+    assert counter.changes() == {'changed': {'new.com': counter['new.com']}}
+
+
+def test_approximate_count_filter():
+    crawler = get_crawler(ProductAutoExtract, settings_dict={'COUNT_FILTER_MAX_HOSTS': 2, 'COUNT_FILTER_ERROR': 0.01})
+    spider = ProductAutoExtract.from_crawler(crawler, seeds='https://shop.com/')
+    spider.count_limits = {'page_host_count': 3}
+    mw = HostsCountFilterMiddleware.from_crawler(crawler)
+    assert isinstance(mw.page_host_counter, HostCounter)
+
+    for n in range(4):
+        for host in ['shop.com', 'blog.com', f'other{n}.com']:
+            request = Request(f'https://{host}/{n}')
+            mw.page_count(Response(request.url, request=request), request, spider)
+    assert mw.process_request(Request('https://other0.com/x'), spider) is None
+    with pytest.raises(IgnoreRequest):
+        mw.process_request(Request('https://shop.com/x'), spider)
+
+    # Exact counts by default
+    crawler = get_crawler(ProductAutoExtract)
+    mw = HostsCountFilterMiddleware.from_crawler(crawler)
+    assert isinstance(mw.page_host_counter, TrackedCounter)
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+
+import pytest
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AutoExtractError, AutoExtractMiddleware
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.decoding import LeanAutoExtractMiddleware  # noqa: E402
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+ARTICLE = {'url': 'https://blog.com/post', 'probability': 0.9, 'headline': 'Title', 'articleBody': 'Text',
+           'articleBodyHtml': '<article>' + 'Text ' * 1000 + '</article>', 'author': '', 'images': []}
+SETTINGS = {'AUTOEXTRACT_USER': 'user', 'AUTOEXTRACT_SLOT_POLICY': 'scrapy_default'}
+
+
+def _setup(middleware_cls, **settings):
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=dict(SETTINGS, **settings))
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler)
+    middleware = middleware_cls.from_crawler(crawler)
+    request = spider.make_extract_request('https://blog.com/post', check_page_type=False)
+    return middleware, middleware.process_request(request, spider), spider, crawler
+
+
+def _response(api_request, result, status=200):
+    body = result if isinstance(result, bytes) else json.dumps(result).encode()
+    return TextResponse(api_request.url, status=status, body=body, request=api_request)
+
+
+def _call(middleware_cls, result, **settings):
+    middleware, api_request, spider, crawler = _setup(middleware_cls, **settings)
+    return middleware.process_response(api_request, _response(api_request, result), spider), spider, crawler
+
+
+def test_same_result_as_the_standard_middleware():
+    result = [{'query': {}, 'article': ARTICLE, 'html': '<html><body>Page</body></html>'}]
+    standard, spider, _ = _call(AutoExtractMiddleware, result)
+    lean, spider, crawler = _call(LeanAutoExtractMiddleware, result, AUTOEXTRACT_LEAN_DECODING=True)
+    assert lean.url == standard.url == 'https://blog.com/post'
+    assert lean.body == standard.body == b'<html><body>Page</body></html>'
+    assert lean.meta['autoextract']['projected'] is True
+    assert lean.meta['autoextract']['article'] == {k: v for k, v in ARTICLE.items() if v}
+    assert crawler.stats.get_value('autoextract/response_count') == 1
+    items = list(spider.parse_item(lean))
+    assert [list(item) for item in items] == [list(item) for item in spider.parse_item(standard)]
+    # The projected item is used without a copy
+    assert items[0] is lean.meta['autoextract']['article']
+
+
+def test_projected_fields():
+    result = [{'query': {}, 'article': ARTICLE}]
+    response, _, _ = _call(LeanAutoExtractMiddleware, result, AUTOEXTRACT_LEAN_DECODING=True,
+                           AUTOEXTRACT_FIELDS={'article': ['headline', 'author'], 'product': ['name']})
+    assert response.meta['autoextract']['article'] == {'url': 'https://blog.com/post', 'probability': 0.9,
+                                                       'headline': 'Title'}
+    assert response.body == b'<body></body>'
+    # Disabled, the standard decoding is used
+    response, _, _ = _call(LeanAutoExtractMiddleware, result, AUTOEXTRACT_FIELDS={'article': ['headline']})
+    assert response.meta['autoextract']['article'] == ARTICLE
+    assert 'projected' not in response.meta['autoextract']
+
+
+@pytest.mark.parametrize('result,status,stat', [
+    (b'{not json', 200, 'autoextract/errors/json_decode'),
+    ([{'error': 'Rate limited'}], 429, 'autoextract/errors/response_error/429'),
+    ({'article': ARTICLE}, 200, 'autoextract/errors/type_error'),
+    ([{'query': {}, 'error': 'Downloader error: http404'}], 200, 'autoextract/errors/result_error'),
+])
+def test_errors(result, status, stat):
+    middleware, api_request, spider, crawler = _setup(LeanAutoExtractMiddleware, AUTOEXTRACT_LEAN_DECODING=True)
+    with pytest.raises(AutoExtractError):
+        middleware.process_response(api_request, _response(api_request, result, status), spider)
+    assert crawler.stats.get_value(stat) == 1
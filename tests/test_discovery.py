@@ -0,0 +1,50 @@
+import os
+import sys
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+SEED = 'https://blog.com/'
+BODY = b'''<html><body>
+<a href="/news/one">One </a> <a href="/news/two">Two</a> <a href="/privacy-policy">Privacy</a>
+</body></html>'''
+
+
+def _make_spider(**settings):
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=settings)
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler, seeds=SEED, **{'discovery-only': 'true'})
+    return spider, crawler
+
+
+def _parse(spider, url, depth, body=BODY):
+    request = Request(url, meta={'source_url': SEED, 'depth': depth})
+    return list(spider.parse_page(HtmlResponse(url, body=body, request=request)))
+
+
+def test_links_returned_when_found():
+    spider, crawler = _make_spider(DEPTH_LIMIT=2)
+    result = _parse(spider, SEED, 0)
+    items = [r for r in result if isinstance(r, dict)]
+    requests = [r for r in result if isinstance(r, Request)]
+    assert [i['url'] for i in items] == [SEED, 'https://blog.com/news/one', 'https://blog.com/news/two']
+    assert items[1]['link_text'] == 'One'
+    assert items[1]['source_url'] == SEED
+    # The links of the depth 1 pages are still followed, without AutoExtract
+    assert [r.url for r in requests] == ['https://blog.com/news/one', 'https://blog.com/news/two']
+    assert all(r.callback == spider.parse_page for r in requests)
+    assert not any(r.meta.get('autoextract') for r in requests)
+
+    # The links of the pages at the last depth are returned, but not downloaded
+    body = b'<html><a href="/news/two">Two</a> <a href="/news/three">Three</a></html>'
+    result = _parse(spider, 'https://blog.com/news/one', 1, body)
+    assert [r['url'] for r in result] == ['https://blog.com/news/three']
+    assert crawler.stats.get_value('discovery/not_fetched') == 1
+    assert crawler.stats.get_value('discovery/links') == 4
+
+
+def test_links_without_depth_limit():
+    spider, _ = _make_spider(DEPTH_LIMIT=0)
+    result = _parse(spider, 'https://blog.com/news/', 5)
+    assert len([r for r in result if isinstance(r, Request)]) == 2
@@ -0,0 +1,100 @@
+import os
+import sys
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+SEED = 'https://blog.com/'
+PAGE = b'''<html><head><link rel="alternate" type="application/rss+xml" href="/feed.xml"></head>
+<body><a href="/post">Post</a></body></html>'''
+
+
+def _make_spider(path, **settings):
+    settings = dict(settings, FEED_CACHE_DIR=path)
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=settings)
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler, seeds=SEED)
+    return spider, crawler
+
+
+def _discover(spider):
+    request = spider._make_seed_request(SEED)
+    assert request.callback == spider.parse_source
+    response = HtmlResponse(SEED, body=PAGE, request=request)
+    return list(spider.parse_source(response))
+
+
+def test_known_feeds_skip_the_seed_page(tmpdir):
+    path = str(tmpdir)
+    spider, crawler = _make_spider(path)
+    requests = _discover(spider)
+    assert 'https://blog.com/feed.xml' in [r.url for r in requests]
+    assert crawler.stats.get_value('feed_cache/misses') == 1
+    assert crawler.stats.get_value('feed_cache/stored') == 1
+    spider.feed_cache.spider_closed(spider)
+
+    # Next run
+    spider, crawler = _make_spider(path)
+    requests = spider._make_seed_request(SEED)
+    assert [r.url for r in requests] == ['https://blog.com/feed.xml']
+    assert requests[0].callback == spider.parse_feed
+    assert requests[0].meta['feed_cache_hit']
+    assert requests[0].meta['source_url'] == SEED
+    assert crawler.stats.get_value('feed_cache/hits') == 1
+
+
+def test_expired_feeds(tmpdir):
+    path = str(tmpdir)
+    spider, _ = _make_spider(path)
+    _discover(spider)
+    spider.feed_cache.spider_closed(spider)
+
+    spider, crawler = _make_spider(path, FEED_CACHE_TTL=0)
+    assert spider._make_seed_request(SEED).callback == spider.parse_source
+    assert crawler.stats.get_value('feed_cache/expired') == 1
+
+
+def test_failed_feeds_are_discovered_again(tmpdir):
+    spider, crawler = _make_spider(str(tmpdir))
+    _discover(spider)
+    feed_request = spider._make_seed_request(SEED)[0]
+
+    response = TextResponse(feed_request.url, status=404, request=feed_request)
+    failure = Failure(HttpError(response))
+    failure.request = feed_request
+    requests = list(spider.errback_feed(failure))
+    assert len(requests) == 1
+    assert requests[0].url == SEED
+    assert requests[0].callback == spider.parse_source
+    assert crawler.stats.get_value('feed_cache/invalidated') == 1
+    # Only once for each seed
+    assert not list(spider.errback_feed(failure))
+    assert spider.feed_cache.get(SEED) is None
+
+    # An empty feed is also discovered again
+    spider.rediscovered_seeds.clear()
+    _discover(spider)
+    feed_request = spider._make_seed_request(SEED)[0]
+    response = TextResponse(feed_request.url, body=b'<rss><channel></channel></rss>', request=feed_request)
+    requests = list(spider.parse_feed(response))
+    assert [r.url for r in requests] == [SEED]
+
+    # A dropped feed request didn't fail
+    spider.rediscovered_seeds.clear()
+    _discover(spider)
+    feed_request = spider._make_seed_request(SEED)[0]
+    failure = Failure(IgnoreRequest())
+    failure.request = feed_request
+    assert not list(spider.errback_feed(failure))
+    assert spider.feed_cache.get(SEED) == ['https://blog.com/feed.xml']
+
+
+def test_feed_cache_disabled():
+    crawler = get_crawler(ArticleAutoExtract)
+    spider = ArticleAutoExtract.from_crawler(crawler, seeds=SEED)
+    assert isinstance(spider._make_seed_request(SEED), Request)
+    assert not crawler.stats.get_value('feed_cache/misses')
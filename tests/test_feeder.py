@@ -0,0 +1,143 @@
+import os
+import sys
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.feeder import SeedFeeder  # noqa: E402
+
+
+class FakeEngine:
+
+    def __init__(self):
+        self.crawled = []
+
+    def crawl(self, request, spider):
+        self.crawled.append(request)
+
+
+def _make_feeder(**settings):
+    crawler = get_crawler(Spider, settings_dict=settings)
+    crawler.engine = FakeEngine()
+    spider = Spider('test')
+    spider.count_limits = {'page_host_count': 2}
+    return SeedFeeder(crawler, spider, Request), crawler
+
+
+def test_feeder_limits_active_hosts():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_ACTIVE_HOSTS=2, SEED_FEEDER_MAX_QUEUED=0)
+    feeder.add(['https://a.com/', 'https://b.com/', 'https://c.com/'])
+    assert feeder.feed() == 2
+    assert [r.url for r in crawler.engine.crawled] == ['https://a.com/', 'https://b.com/']
+    for request in crawler.engine.crawled:
+        feeder.request_scheduled(request, None)
+    assert feeder.feed() == 0
+    assert len(feeder.pending) == 1
+
+
+def test_feeder_releases_finished_hosts():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_ACTIVE_HOSTS=1, SEED_FEEDER_MAX_QUEUED=0)
+    feeder.add(['https://a.com/', 'https://b.com/', 'https://c.com/'])
+    feeder.feed()
+    seed = crawler.engine.crawled[-1]
+    feeder.request_scheduled(seed, None)
+    feeder.request_scheduled(Request('https://a.com/page'), None)
+    # AutoExtract requests don't count
+    feeder.request_scheduled(Request('https://a.com/item', meta={'autoextract': {'enabled': True}}), None)
+    assert feeder.active == {'a.com': 2}
+
+    # a.com ran out of links
+    feeder.request_left_downloader(seed, None)
+    feeder.request_dropped(Request('https://a.com/page'), None)
+    assert feeder.feed() == 1
+    assert list(feeder.active) == ['b.com']
+
+    # b.com reached the page limit
+    for n in range(3):
+        feeder.request_scheduled(Request(f'https://b.com/{n}'), None)
+    feeder.request_left_downloader(Request('https://b.com/0'), None)
+    feeder.request_left_downloader(Request('https://b.com/1'), None)
+    assert feeder.feed() == 1
+    assert list(feeder.active) == ['c.com']
+    assert crawler.stats.get_value('seeds/admitted') == 3
+    assert crawler.stats.get_value('seeds/finished_hosts') == 2
+
+
+def test_feeder_counts_list_requests_once():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_ACTIVE_HOSTS=1, SEED_FEEDER_MAX_QUEUED=0)
+    feeder.add(['https://a.com/'])
+    feeder.feed()
+    meta = {'autoextract': {'enabled': True, 'pageType': 'productList'}, 'list_page': True}
+    request = Request('https://a.com/list', meta=meta)
+    feeder.request_scheduled(request, None)
+    assert feeder.active == {'a.com': 1}
+    # The AutoExtract middleware sends a new request to the API
+    api_meta = dict(meta, _autoextract_processed={'original_url': 'https://a.com/list'})
+    api_request = request.replace(url='https://autoextract.scrapinghub.com/v1/extract', meta=api_meta)
+    feeder.request_scheduled(api_request, None)
+    assert feeder.active == {'a.com': 1}
+    feeder.request_left_downloader(api_request, None)
+    assert feeder.active == {'a.com': 0}
+
+
+def test_feeder_several_requests_per_seed():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_QUEUED=0)
+    feeder.request_factory = lambda url: [Request(url + 'rss.xml'), Request(url + 'atom.xml')]
+    feeder.add(['https://a.com/'])
+    assert feeder.feed() == 1
+    assert [r.url for r in crawler.engine.crawled] == ['https://a.com/rss.xml', 'https://a.com/atom.xml']
+
+
+def test_feeder_waits_for_the_spider_output():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_ACTIVE_HOSTS=1, SEED_FEEDER_MAX_QUEUED=0)
+    feeder.spider.count_limits = {}
+    feeder.add(['https://a.com/', 'https://b.com/'])
+    feeder.feed()
+    seed = crawler.engine.crawled[-1]
+    feeder.request_scheduled(seed, None)
+    # Redirected to the www host
+    redirected = seed.replace(url='https://www.a.com/', meta={'redirect_urls': ['https://a.com/']})
+    feeder.request_scheduled(redirected, None)
+    feeder.request_left_downloader(seed, None)
+    feeder.request_left_downloader(redirected, None)
+    response = HtmlResponse('https://www.a.com/', body=b'', request=redirected)
+    feeder.response_received(response, redirected, None)
+    # The response is still processed by the spider
+    assert feeder.feed() == 0
+    assert feeder.active == {'a.com': 1}
+
+    def output():
+        yield Request('https://www.a.com/page')
+        # The new requests are scheduled before the response is finished
+        assert feeder.feed() == 0
+        yield Request('https://a.com/other')
+
+    requests = list(feeder.process_spider_output(response, output()))
+    assert [r.meta.get('seed_host') for r in requests] == ['a.com', None]
+    for request in requests:
+        feeder.request_scheduled(request, None)
+    assert feeder.active == {'a.com': 2}
+    for request in requests:
+        feeder.request_left_downloader(request, None)
+    assert feeder.feed() == 1
+    assert list(feeder.active) == ['b.com']
+
+
+def test_feeder_counts_the_requests_of_the_seed_on_other_hosts():
+    feeder, crawler = _make_feeder(SEED_FEEDER_MAX_ACTIVE_HOSTS=1, SEED_FEEDER_MAX_QUEUED=0)
+    feeder.spider.count_limits = {}
+    # The known feeds of the seed are on a feeds host
+    feeder.request_factory = lambda url: [Request('https://feeds.feedburner.com/a', meta={'source_url': url})]
+    feeder.add(['https://a.com/', 'https://b.com/'])
+    feeder.feed()
+    feed = crawler.engine.crawled[-1]
+    feeder.request_scheduled(feed, None)
+    assert feeder.active == {'a.com': 1}
+    feeder.request_left_downloader(feed, None)
+    feeder.response_received(HtmlResponse(feed.url, body=b'', request=feed), feed, None)
+    # The feed is still processed by the spider
+    assert feeder.feed() == 0
+    feeder.response_finished(HtmlResponse(feed.url, body=b'', request=feed))
+    assert feeder.feed() == 1
+    assert list(feeder.active) == ['b.com']
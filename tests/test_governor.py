@@ -0,0 +1,81 @@
+import os
+import sys
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request
+from scrapy.link import Link
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY, AutoExtractError
+from twisted.python.failure import Failure
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.governor import SpendGovernor  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.util import FingerprintPrefix  # noqa: E402
+
+
+def _make_governor(**settings):
+    settings.setdefault('SPEND_GOVERNOR_ENABLED', True)
+    settings.setdefault('SPEND_GOVERNOR_MIN_CALLS', 10)
+    crawler = get_crawler(Spider, settings_dict=settings)
+    return SpendGovernor.from_crawler(crawler), crawler
+
+
+def test_governor_disabled():
+    governor, _ = _make_governor(SPEND_GOVERNOR_ENABLED=False)
+    for _ in range(20):
+        governor.record('https://example.com/item', False)
+    assert governor.allow('https://example.com/item')
+    assert not governor.hosts
+
+
+def test_governor_stops_unproductive_host():
+    governor, crawler = _make_governor()
+    for n in range(10):
+        governor.record(f'https://bad.com/{n}', False)
+        governor.record(f'https://good.com/{n}', True)
+    assert not governor.allow('https://bad.com/next')
+    assert not governor.allow('https://bad.com/other')
+    assert governor.allow('https://good.com/next')
+    assert crawler.stats.get_value('governor/stopped_hosts') == 1
+    assert crawler.stats.get_value('governor/skipped/stopped') == 2
+
+
+def test_governor_throttles_low_yield_host():
+    governor, crawler = _make_governor(SPEND_GOVERNOR_MIN_YIELD=0.01, SPEND_GOVERNOR_THROTTLE_YIELD=0.4)
+    for n in range(10):
+        governor.record(f'https://example.com/{n}', n % 5 == 0)
+    # yield 0.2 is half of the throttle yield, so half of the URLs are allowed
+    allowed = [governor.allow(f'https://example.com/new/{n}') for n in range(10)]
+    assert allowed.count(True) == 5
+    assert crawler.stats.get_value('governor/skipped/throttled') == 5
+
+
+def test_failed_calls_are_recorded():
+    crawler = get_crawler(ProductAutoExtract, settings_dict={'SPEND_GOVERNOR_ENABLED': True})
+    spider = ProductAutoExtract.from_crawler(crawler)
+    request = Request('https://autoextract.scrapinghub.com/v1/extract',
+                      meta={AUTOEXTRACT_META_KEY: {'original_url': 'https://shop.com/item'}})
+    failure = Failure(AutoExtractError('Downloader error: http404'))
+    failure.request = request
+    spider.errback_item(failure)
+    assert spider.governor.hosts['shop.com'].calls == 1
+    assert spider.governor.hosts['shop.com'].accepted == 0
+    # The pages downloaded before AutoExtract are not AutoExtract calls
+    failure = Failure(ValueError())
+    failure.request = Request('https://blog.com/post')
+    spider.errback_item(failure)
+    assert 'blog.com' not in spider.governor.hosts
+
+
+def test_throttled_links_are_fetched_as_pages():
+    crawler = get_crawler(ProductAutoExtract, settings_dict={
+        'SPEND_GOVERNOR_ENABLED': True, 'SPEND_GOVERNOR_MIN_CALLS': 1, 'SPEND_GOVERNOR_STOP_DISCOVERY': False})
+    spider = ProductAutoExtract.from_crawler(crawler, seeds='https://shop.com/')
+    spider.governor.record('https://shop.com/item', False)
+    response = HtmlResponse('https://shop.com/', body=b'', request=Request('https://shop.com/'))
+    request = spider._make_link_request(Link('https://shop.com/products/item-2'), 0, response)
+    assert type(request) is Request
+    assert request.meta['fingerprint_prefix'] == FingerprintPrefix.SCRAPY.value
+    # Downloaded through Crawlera, like the other pages
+    for key in ('dont_proxy', 'no_crawlera_session', 'cf_store', 'autoextract'):
+        assert key not in request.meta
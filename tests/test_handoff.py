@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import pytest
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AutoExtractMiddleware
+from twisted.python.failure import Failure
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+SEED = 'https://blog.com/'
+BODY = b'''<html><body>
+<a href="/news/one">One</a> <a href="/news/two">Two</a> <a href="/news/three">Three</a>
+</body></html>'''
+
+
+def _make_spider(path, mode, **kwargs):
+    crawler = get_crawler(ArticleAutoExtract, settings_dict={'HANDOFF_DIR': path, 'HANDOFF_BATCH_SIZE': 2,
+                                                             'HANDOFF_MAX_ATTEMPTS': 2,
+                                                             'AUTOEXTRACT_USER': 'user',
+                                                             'AUTOEXTRACT_SLOT_POLICY': 'scrapy_default'})
+    crawler.spider = spider = ArticleAutoExtract.from_crawler(crawler, handoff=mode, **kwargs)
+    return spider, crawler
+
+
+def _close(spider):
+    spider.handoff.spider_closed(spider)
+
+
+def test_discovery_and_extraction_jobs(tmpdir):
+    path = str(tmpdir)
+    spider, crawler = _make_spider(path, 'discovery', seeds=SEED)
+    request = Request(SEED, meta={'source_url': SEED, 'depth': 0})
+    result = list(spider.parse_page(HtmlResponse(SEED, body=BODY, request=request)))
+    # The pages are downloaded for discovering links, not sent to AutoExtract
+    assert [r.url for r in result] == ['https://blog.com/news/one', 'https://blog.com/news/two',
+                                       'https://blog.com/news/three']
+    assert not any(r.meta.get('autoextract') for r in result)
+    # Another job found the same links
+    spider.handoff.put('https://blog.com/news/one', 'article', {'depth': 1})
+    _close(spider)
+    assert crawler.stats.get_value('handoff/queued') == 3
+    assert crawler.stats.get_value('handoff/duplicates') == 1
+    assert crawler.stats.get_value('handoff/queue/pending') == 3
+
+    spider, crawler = _make_spider(path, 'extraction')
+    requests = list(spider.start_requests())
+    assert [r.url for r in requests] == ['https://blog.com/news/one', 'https://blog.com/news/two',
+                                         'https://blog.com/news/three']
+    assert all(r.meta['autoextract'] and r.meta['handoff_id'] for r in requests)
+    assert requests[0].meta['source_url'] == SEED
+    assert requests[0].meta['link_text'] == 'One'
+
+    one, two, _ = requests
+    item = {'url': one.url, 'headline': 'One', 'probability': 0.9}
+    middleware = AutoExtractMiddleware.from_crawler(crawler)
+    api_request = middleware.process_request(one, spider)
+    body = json.dumps([{'query': {}, 'article': item}]).encode()
+    response = middleware.process_response(api_request, TextResponse(api_request.url, body=body,
+                                                                     request=api_request), spider)
+    assert len(list(spider.parse_item(response))) == 1
+    failure = Failure(ValueError('AutoExtract error'))
+    failure.request = two
+    spider.errback_item(failure)
+    _close(spider)
+    assert crawler.stats.get_value('handoff/extracted') == 1
+    assert crawler.stats.get_value('handoff/failed') == 1
+    # The third one wasn't finished
+    assert crawler.stats.get_value('handoff/released') == 1
+    assert crawler.stats.get_value('handoff/queue/done') == 1
+    assert crawler.stats.get_value('handoff/queue/pending') == 2
+
+    # The next job takes the rest
+    spider, crawler = _make_spider(path, 'extraction')
+    requests = list(spider.start_requests())
+    assert [r.url for r in requests] == ['https://blog.com/news/two', 'https://blog.com/news/three']
+    failure.request = requests[0]
+    spider.errback_item(failure)
+    # An empty AutoExtract result is tried again later too
+    three = requests[1]
+    empty = Request(three.url, meta={'handoff_id': three.meta['handoff_id']})
+    assert list(spider.parse_item(TextResponse(three.url, body=b'', request=empty))) == []
+    _close(spider)
+    assert crawler.stats.get_value('error/empty') == 1
+    assert crawler.stats.get_value('handoff/failed') == 2
+    assert crawler.stats.get_value('handoff/queue/failed') == 1
+    assert crawler.stats.get_value('handoff/queue/pending') == 1
+
+
+def test_invalid_handoff(tmpdir):
+    with pytest.raises(ValueError):
+        _make_spider(str(tmpdir), 'both')
+    crawler = get_crawler(ArticleAutoExtract)
+    with pytest.raises(ValueError):
+        ArticleAutoExtract.from_crawler(crawler, handoff='discovery')
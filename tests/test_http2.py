@@ -0,0 +1,102 @@
+import os
+import sys
+import subprocess
+from collections import deque
+
+from scrapy import Request, Spider
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.http2 import AutoExtractDownloadHandler, update_download_handlers  # noqa: E402
+from autoextract_spiders.h2pool import MultiplexedH2ConnectionPool  # noqa: E402
+
+
+class _FakeHandler:
+
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def download_request(self, request, spider):
+        return self.name
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeConnection:
+
+    def __init__(self, load):
+        self.load = load
+
+
+def _make_pool(max_connections=2, max_streams=3):
+    from twisted.internet import reactor
+    return MultiplexedH2ConnectionPool(reactor, Settings(), max_connections, max_streams)
+
+
+def test_update_download_handlers():
+    settings = Settings()
+    update_download_handlers(settings)
+    assert 'https' not in settings.getdict('DOWNLOAD_HANDLERS')
+    settings = Settings({'AUTOEXTRACT_HTTP2_ENABLED': True})
+    update_download_handlers(settings)
+    assert settings.getdict('DOWNLOAD_HANDLERS')['https'] == 'autoextract_spiders.http2.AutoExtractDownloadHandler'
+
+
+def test_spiders_import_without_http2():
+    # Twisted imports "h2" by itself, when it's installed
+    code = ('import sys; import autoextract_spiders.spiders, autoextract_spiders.http2; '
+            'assert not [m for m in sys.modules if m.startswith(("scrapy.core.http2", '
+            '"scrapy.core.downloader.handlers.http2", "autoextract_spiders.h2pool"))]')
+    subprocess.run([sys.executable, '-c', code], cwd=os.getcwd(), check=True)
+
+
+def test_handler_routes_autoextract_requests():
+    crawler = get_crawler(Spider, settings_dict={'AUTOEXTRACT_URL': 'https://api.example.com/v1/extract'})
+    handler = AutoExtractDownloadHandler.from_crawler(crawler)
+    handler._default, handler._h2 = _FakeHandler('http11'), _FakeHandler('h2')
+
+    api_request = Request('https://api.example.com/v1/extract', method='POST',
+                          meta={AUTOEXTRACT_META_KEY: {'original_url': 'https://example.com/'}})
+    assert handler.download_request(api_request, None) == 'h2'
+    # Not rewritten by the AutoExtract middleware
+    assert handler.download_request(Request('https://api.example.com/v1/extract'), None) == 'http11'
+    assert handler.download_request(Request('https://example.com/'), None) == 'http11'
+    assert crawler.stats.get_value('autoextract/http2/requests') == 1
+
+    handler.close()
+    assert handler._default.closed and handler._h2.closed
+
+
+def test_pool_makes_first_connection():
+    pool = _make_pool()
+    assert pool._choose_key(('https', 'api', 443)) == ('https', 'api', 443, 0)
+
+
+def test_pool_multiplexes_until_max_streams():
+    pool = _make_pool()
+    key = ('https', 'api', 443)
+    pool._connections[key + (0,)] = _FakeConnection(2)
+    assert pool._choose_key(key) == key + (0,)
+    # The first connection is full, open a second one
+    pool._connections[key + (0,)].load = 3
+    assert pool._choose_key(key) == key + (1,)
+    # Still connecting: the requests wait for the connection
+    pool._pending_requests[key + (1,)] = deque([None])
+    assert pool._choose_key(key) == key + (1,)
+
+
+def test_pool_uses_least_loaded_connection():
+    pool = _make_pool()
+    key = ('https', 'api', 443)
+    pool._connections[key + (0,)] = _FakeConnection(3)
+    pool._connections[key + (1,)] = _FakeConnection(5)
+    # All the connections are full, the streams are queued on the least loaded one
+    assert pool._choose_key(key) == key + (0,)
+    pool._connections[key + (1,)].load = 1
+    assert pool._choose_key(key) == key + (1,)
+    del pool._connections[key + (0,)]
+    assert pool._choose_key(key) == key + (1,)
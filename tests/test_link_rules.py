@@ -0,0 +1,86 @@
+import os
+import sys
+import re
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.linkextractors import LinkExtractor
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.link_rules import HostExtractRules, HostRules, _trie_pattern  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+
+
+def test_trie_pattern():
+    literals = ['/news/world', '/news/sport', '/news', '/blog/', '/b']
+    regex = re.compile(_trie_pattern(literals))
+    for url in ['https://a.com/news/x', 'https://a.com/blog/1', 'https://a.com/b']:
+        assert regex.search(url)
+    assert not regex.search('https://a.com/shop/')
+    assert not regex.search('https://a.com/sport')
+    assert _trie_pattern(['/a.b', '/a(c']) == '/a(?:\\(c|\\.b)'
+
+
+@pytest.mark.parametrize('rules', [
+    {'allow': ['/products/', r'/p/\d+'], 'deny': ['/products/old/', r'\?sort=']},
+    {'allow': '/products/', 'allow_domains': ['shop.com']},
+    {'deny': ['/about', '/contact'], 'deny_domains': 'cdn.shop.com'},
+])
+def test_host_rules_like_link_extractor(rules):
+    extractor = LinkExtractor(**rules)
+    host_rules = HostRules(**rules)
+    for url in ['https://shop.com/products/1', 'https://shop.com/products/old/1', 'https://shop.com/p/12',
+                'https://shop.com/products/?sort=price', 'https://www.shop.com/products/2',
+                'https://cdn.shop.com/products/3', 'https://other.com/products/4', 'https://shop.com/about',
+                'https://shop.com/contact-us']:
+        assert host_rules.matches(url) == extractor.matches(url), url
+
+
+def test_host_lookup():
+    rules = HostExtractRules({
+        'shop.com': {'allow': '/products/'},
+        'blog.shop.com': {'deny': '/tag/'},
+        'Other.com': {},
+    })
+    assert len(rules) == 3
+    assert rules.get('shop.com') is rules.get('www.shop.com') is rules.rules_for_url('https://www.shop.com:8080/')
+    assert rules.get('blog.shop.com') is rules.get('www.blog.shop.com')
+    assert rules.get('other.com')
+    assert rules.get('unknown.com') is None
+    assert rules.get('') is None
+    with pytest.raises(ValueError):
+        HostExtractRules({'shop.com': {'allow': '/x', 'follow': True}})
+    # Compiled when used
+    rules = HostExtractRules({'shop.com': {'allow': '/products/'}, 'bad.com': {'allow': '/(x'}})
+    assert isinstance(rules.rules['shop.com'], dict)
+    assert rules.get('shop.com').matches('https://shop.com/products/1')
+    assert isinstance(rules.rules['shop.com'], HostRules)
+    assert rules.get('bad.com').matches('https://bad.com/y')
+
+
+def test_spider_host_rules(tmpdir):
+    path = tmpdir.join('rules.yml')
+    path.write('shop.com: {allow: /products/}\nblog.com: {deny: /tag/}\n')
+    crawler = get_crawler(ProductAutoExtract)
+    crawler.spider = spider = ProductAutoExtract.from_crawler(
+        crawler, seeds='[https://shop.com/, https://blog.com/]',
+        **{'host-extract-rules': str(path), 'same-domain': 'false'})
+    spider.open_spider()
+    assert len(spider.host_rules) == 2
+
+    body = b'<html><a href="/products/1">1</a> <a href="/shoes">Shoes</a> <a href="/tag/x">Tag</a></html>'
+    for url, expected in [('https://www.shop.com/', ['https://www.shop.com/products/1']),
+                          ('https://blog.com/', ['https://blog.com/products/1', 'https://blog.com/shoes']),
+                          ('https://new.com/', ['https://new.com/products/1', 'https://new.com/shoes',
+                                                'https://new.com/tag/x'])]:
+        response = HtmlResponse(url, body=body, request=Request(url, meta={'source_url': url}))
+        assert [r.url for r in spider._requests_to_follow(response)] == expected
+    assert crawler.stats.get_value('link_filtering/host_rules/dropped_requests') == 3
+
+
+def test_spider_invalid_host_rules():
+    crawler = get_crawler(ProductAutoExtract)
+    spider = ProductAutoExtract.from_crawler(crawler, seeds='https://shop.com/',
+                                             **{'host-extract-rules': '{shop.com: {allowed: /products/}}'})
+    with pytest.raises(ValueError):
+        spider.open_spider()
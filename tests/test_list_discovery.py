@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AutoExtractMiddleware
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract, ProductAutoExtract  # noqa: E402
+from autoextract_spiders.squeues import encode_request, decode_request  # noqa: E402
+
+SETTINGS = {'AUTOEXTRACT_USER': 'user', 'AUTOEXTRACT_SLOT_POLICY': 'scrapy_default'}
+
+
+def _make_spider(spider_cls=ProductAutoExtract, **kwargs):
+    crawler = get_crawler(spider_cls, settings_dict=SETTINGS)
+    crawler.spider = spider = spider_cls.from_crawler(crawler, list_discovery='true', **kwargs)
+    spider.open_spider()
+    return spider
+
+
+def _list_response(spider, url, data):
+    """
+    The response of the AutoExtract middleware to a list request.
+    """
+    middleware = AutoExtractMiddleware.from_crawler(spider.crawler)
+    request = spider.make_list_request(url, meta={'source_url': 'https://shop.com/'})
+    api_request = middleware.process_request(request, spider)
+    list_type = request.meta['autoextract']['pageType']
+    body = json.dumps([{'query': {}, list_type: data}]).encode()
+    response = TextResponse(api_request.url, body=body, request=api_request)
+    return middleware.process_response(api_request, response, spider)
+
+
+def test_list_seed_request():
+    spider = _make_spider()
+    request = spider._make_seed_request('https://shop.com/')
+    assert request.meta['autoextract']['pageType'] == 'productList'
+    assert request.callback == spider.parse_list
+    assert request.dont_filter
+    # The list requests are kept compact in the queues
+    restored = decode_request(encode_request(request, spider), spider)
+    assert restored.meta == request.meta
+
+
+def test_parse_list():
+    spider = _make_spider()
+    data = {'products': [{'url': 'https://shop.com/chair', 'name': 'Chair'}, {'name': 'No URL'}],
+            'paginationNext': {'url': 'https://shop.com/?page=2'}}
+    response = _list_response(spider, 'https://shop.com/', data)
+    # The middleware only keeps the result of the requested page type
+    assert 'pageType' not in response.meta['autoextract']
+    requests = list(spider.parse_list(response))
+    assert [r.url for r in requests] == ['https://shop.com/chair', 'https://shop.com/?page=2']
+    item_request, next_request = requests
+    assert item_request.meta['autoextract']['pageType'] == 'product'
+    assert item_request.meta['link_text'] == 'Chair'
+    assert item_request.meta['source_url'] == 'https://shop.com/'
+    assert next_request.meta['autoextract']['pageType'] == 'productList'
+    assert spider.crawler.stats.get_value('list_discovery/links') == 1
+
+
+def test_parse_list_fallback_to_html():
+    spider = _make_spider(ArticleAutoExtract)
+    requests = list(spider.parse_list(_list_response(spider, 'https://news.com/', {})))
+    assert len(requests) == 1
+    assert not requests[0].meta.get('autoextract')
+    assert requests[0].callback == spider.parse_source
+
+
+def test_list_discovery_index_links():
+    spider = _make_spider()
+    body = b'<html><a href="https://shop.com/index.html">Home</a> <a href="/chair">Chair</a></html>'
+    response = HtmlResponse('https://shop.com/about', body=body, request=Request('https://shop.com/about'))
+    requests = {r.url: r for r in spider._requests_to_follow(response)}
+    assert requests['https://shop.com/index.html'].meta['autoextract']['pageType'] == 'productList'
+    assert requests['https://shop.com/chair'].meta['autoextract']['pageType'] == 'product'
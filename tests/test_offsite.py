@@ -0,0 +1,72 @@
+import os
+import sys
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.offsite import AllowedHosts, OffsiteMiddleware  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+
+
+def test_allowed_hosts():
+    hosts = AllowedHosts(['autoextract.scrapinghub.com'])
+    # No seeds yet
+    assert 'other.com' in hosts
+    assert hosts.allows('other.com')
+
+    hosts.add(['https://www.Shop.com/', 'http://localhost:8080/x', 'not a url'])
+    assert len(hosts) == 2
+    assert 'www.shop.com' in hosts
+    assert 'WWW.SHOP.COM' in hosts
+    assert 'localhost:8080' in hosts
+    assert 'localhost' not in hosts
+    assert 'shop.com' not in hosts
+    assert 'blog.www.shop.com' not in hosts
+
+    assert hosts.allows('www.shop.com')
+    assert hosts.allows('cdn.www.shop.com')
+    assert hosts.allows('localhost')
+    assert hosts.allows('autoextract.scrapinghub.com')
+    assert not hosts.allows('shop.com')
+    assert not hosts.allows('www.shop.com.evil.com')
+    assert not hosts.allows('')
+
+
+def _make_spider(**kwargs):
+    crawler = get_crawler(ProductAutoExtract)
+    crawler.spider = spider = ProductAutoExtract.from_crawler(crawler, **kwargs)
+    middleware = OffsiteMiddleware.from_crawler(crawler)
+    middleware.spider_opened(spider)
+    return spider, crawler, middleware
+
+
+def _filter(middleware, spider, urls):
+    requests = [Request(url) for url in urls]
+    return [r.url for r in middleware.process_spider_output(None, requests, spider)]
+
+
+def test_offsite_seeds_file():
+    spider, crawler, middleware = _make_spider(seeds='https://shop.com/', **{'seeds-file-url': 'https://s3.com/seeds'})
+    assert spider.allowed_hosts is not None
+    assert not hasattr(spider, 'allowed_domains')
+    urls = ['https://shop.com/1', 'https://www.shop.com/2', 'https://blog.com/3', 'https://facebook.com/4']
+
+    # The seeds are allowed when they're scheduled
+    list(spider._process_seeds())
+    assert _filter(middleware, spider, urls) == urls[:2]
+    request = Request('https://s3.com/seeds', meta={'source_url': 'https://s3.com/seeds'})
+    spider.parse_seeds_file(TextResponse(request.url, body=b'https://blog.com/\ninvalid\n', request=request))
+    assert _filter(middleware, spider, urls) == urls[:3]
+    assert crawler.stats.get_value('offsite/filtered') == 3
+
+    body = b'<html><a href="/a">A</a> <a href="https://www.blog.com/b">B</a> <a href="https://x.com/c">C</a></html>'
+    response = HtmlResponse('https://blog.com/', body=body, request=Request('https://blog.com/'))
+    assert [r.url for r in spider._requests_to_follow(response)] == ['https://blog.com/a']
+
+
+def test_offsite_disabled():
+    spider, _, middleware = _make_spider(seeds='https://shop.com/', **{'same-domain': 'false'})
+    assert spider.allowed_hosts is None
+    list(spider._process_seeds())
+    urls = ['https://shop.com/1', 'https://facebook.com/2']
+    assert _filter(middleware, spider, urls) == urls
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.pipelines import PageTypeFeedsPipeline  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.util import guess_page_type, hinted_page_type  # noqa: E402
+
+PAGE_TYPES = ['product', 'article', 'jobPosting']
+
+
+def test_guess_page_type():
+    assert guess_page_type('https://shop.com/blog/new-chairs', PAGE_TYPES) == 'article'
+    assert guess_page_type('https://shop.com/2020/05/new-chairs', PAGE_TYPES) == 'article'
+    assert guess_page_type('https://shop.com/careers/developer', PAGE_TYPES) == 'jobPosting'
+    assert guess_page_type('https://shop.com/products/blue-chair', PAGE_TYPES) == 'product'
+    # The first page type is the default
+    assert guess_page_type('https://shop.com/blue-chair', PAGE_TYPES) == 'product'
+    assert guess_page_type('https://shop.com/blue-chair', ['article', 'product']) == 'article'
+    assert guess_page_type('https://shop.com/login', PAGE_TYPES) is None
+    assert hinted_page_type('https://shop.com/blog/new-chairs', PAGE_TYPES) == 'article'
+    assert hinted_page_type('https://shop.com/blue-chair', PAGE_TYPES) is None
+
+
+def _make_spider(**kwargs):
+    crawler = get_crawler(ProductAutoExtract)
+    crawler.spider = spider = ProductAutoExtract.from_crawler(crawler, **kwargs)
+    spider.open_spider()
+    return spider
+
+
+def test_multi_page_type_requests():
+    spider = _make_spider(page_types='[product, article]',
+                          count_limits='{article_item_count: 1}')
+    assert spider.page_types == ['product', 'article']
+    body = b'<html><a href="/blog/news">News</a> <a href="/chair">Chair</a></html>'
+    response = HtmlResponse('https://shop.com/', body=body, request=Request('https://shop.com/'))
+    requests = {r.url: r for r in spider._requests_to_follow(response)}
+    assert requests['https://shop.com/blog/news'].meta['autoextract']['pageType'] == 'article'
+    assert requests['https://shop.com/chair'].meta['autoextract']['pageType'] == 'product'
+
+    item = spider._finish_item({'headline': 'News'}, response, 'article')
+    assert item['page_type'] == 'article'
+    assert spider.crawler.stats.get_value('items/article') == 1
+    # The article limit is reached, the article links are dropped
+    requests = {r.url: r for r in spider._requests_to_follow(response)}
+    assert 'https://shop.com/blog/news' not in requests
+    assert requests['https://shop.com/chair'].meta['autoextract']['pageType'] == 'product'
+    assert spider.crawler.stats.get_value('page_types/dropped/article') == 1
+    assert spider.get_checkpoint_state()['items'] == {'product': 0, 'article': 1}
+
+
+def test_page_type_feeds(tmpdir):
+    spider = _make_spider(page_types='product,article')
+    pipeline = PageTypeFeedsPipeline(str(tmpdir.join('%(name)s-%(page_type)s.jl')))
+    pipeline.process_item({'name': 'Chair', 'page_type': 'product'}, spider)
+    pipeline.process_item({'headline': 'News', 'page_type': 'article'}, spider)
+    pipeline.process_item({'url': 'https://shop.com/'}, spider)
+    pipeline.close_spider(spider)
+    assert sorted(os.listdir(tmpdir)) == ['products-article.jl', 'products-product.jl']
+    with open(tmpdir.join('products-product.jl')) as fd:
+        assert [json.loads(line) for line in fd] == [{'name': 'Chair', 'page_type': 'product'}]
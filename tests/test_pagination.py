@@ -0,0 +1,83 @@
+import os
+import sys
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.middlewares import DepthMiddleware  # noqa: E402
+from autoextract_spiders.pagination import PaginationDetector  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+
+
+def _response(url, body, meta=None):
+    return HtmlResponse(url, body=body, request=Request(url, meta=meta or {}))
+
+
+def _make_detector(**settings):
+    settings.setdefault('PAGINATION_ENABLED', True)
+    crawler = get_crawler(Spider, settings_dict=settings)
+    return PaginationDetector.from_crawler(crawler), crawler
+
+
+def test_rel_next_learns_pattern():
+    detector, crawler = _make_detector()
+    body = b'<html><head><link rel="next" href="/chairs?sort=new&pg=2"></head></html>'
+    response = _response('https://shop.com/chairs?sort=new', body)
+    assert detector.find_next_pages(response) == ['https://shop.com/chairs?sort=new&pg=2']
+    assert detector.patterns['shop.com'] == {('query', 'pg')}
+    # The learned pattern finds the numbered links of the other listings
+    body = b'''<html><a href="/tables?pg=2">2</a> <a href="/tables?pg=4">3</a> <a href="/tables?pg=3">3</a>
+    <a href="/chairs?pg=3">3</a></html>'''
+    response = _response('https://shop.com/tables?pg=2', body)
+    assert detector.find_next_pages(response) == ['https://shop.com/tables?pg=3']
+
+
+def test_next_text_and_path_pages():
+    detector, _ = _make_detector()
+    body = b'<html><a href="/blog/page/3/" aria-label="Next page">&raquo;</a></html>'
+    response = _response('https://news.com/blog/page/2/', body)
+    assert detector.find_next_pages(response) == ['https://news.com/blog/page/3/']
+    assert detector.patterns['news.com'] == {('path', 'page')}
+    # Common patterns, without learning
+    body = b'<html><a href="/list?page=2">2</a> <a href="https://other.com/list?page=2">2</a></html>'
+    assert detector.find_next_pages(_response('https://blog.com/list', body)) == ['https://blog.com/list?page=2']
+
+
+def test_pagination_budget():
+    detector, crawler = _make_detector(PAGINATION_MAX_PAGES=3, PAGINATION_HOST_BUDGET=2)
+    assert not detector.allow('https://shop.com/?page=5', _response('https://shop.com/?page=4', b'',
+                                                                    meta={'pagination_page': 3}))
+    response = _response('https://shop.com/', b'')
+    assert detector.allow('https://shop.com/?page=2', response)
+    assert detector.allow('https://shop.com/?page=2', response)
+    assert not detector.allow('https://shop.com/?page=2', response)
+    assert crawler.stats.get_value('pagination/pages') == 2
+    assert detector.request_meta(response) == {'pagination': True, 'pagination_page': 1}
+
+
+def test_pagination_depth():
+    crawler = get_crawler(Spider, settings_dict={'DEPTH_LIMIT': 2, 'DEPTH_PRIORITY': 1})
+    mw = DepthMiddleware.from_crawler(crawler)
+    response = _response('https://shop.com/?page=2', b'', meta={'depth': 1})
+    result = [Request('https://shop.com/?page=3', meta={'pagination': True}, priority=100),
+              Request('https://shop.com/chair')]
+    pagination, link = mw.process_spider_output(response, result, None)
+    assert pagination.meta['depth'] == 1
+    assert pagination.priority == 99
+    assert link.meta['depth'] == 2
+    assert link.priority == -2
+
+
+def test_spider_pagination_requests():
+    crawler = get_crawler(ProductAutoExtract, settings_dict={'PAGINATION_ENABLED': True})
+    crawler.spider = spider = ProductAutoExtract.from_crawler(crawler)
+    body = b'<html><a href="/chairs?page=2">2</a> <a href="/chair">Chair</a></html>'
+    response = _response('https://shop.com/chairs', body, meta={'source_url': 'https://shop.com/'})
+    requests = {r.url: r for r in spider._requests_to_follow(response)}
+    pagination = requests['https://shop.com/chairs?page=2']
+    assert not pagination.meta.get('autoextract')
+    assert pagination.meta['pagination']
+    assert pagination.priority == 100
+    assert pagination.callback == spider.parse_page
+    assert requests['https://shop.com/chair'].meta['autoextract']['pageType'] == 'product'
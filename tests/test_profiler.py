@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import tracemalloc
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.profiler import Profiler  # noqa: E402
+from autoextract_spiders.spiders import ArticleAutoExtract  # noqa: E402
+
+
+class _Middleware:
+
+    def process_request(self, request, spider):
+        return None
+
+
+class _Callbacks:
+
+    def parse_page(self, profiler):
+        self.data = [bytearray(1000) for _ in range(100)]
+        return self._helper(profiler)
+
+    def _helper(self, profiler):
+        profiler.sample(sys._getframe())
+
+
+def _make_profiler(path, **settings):
+    settings = dict(settings, PROFILER_DIR=path)
+    crawler = get_crawler(ArticleAutoExtract, settings_dict=settings)
+    crawler.spider = ArticleAutoExtract.from_crawler(crawler)
+    return Profiler.from_crawler(crawler), crawler
+
+
+def test_profiler_disabled():
+    with pytest.raises(NotConfigured):
+        Profiler.from_crawler(get_crawler(ArticleAutoExtract))
+
+
+def test_tracks_decorated_callbacks(tmpdir):
+    profiler, crawler = _make_profiler(str(tmpdir))
+    profiler.track(crawler.spider, ['parse_page', 'parse_feed', 'missing'])
+    profiler.track(_Middleware(), ['process_request', 'process_response'])
+    # parse_feed is wrapped by the Crawlera session decorator
+    assert sorted(profiler.tracked.values()) == [
+        'ArticleAutoExtract.parse_feed', 'CrawlerSpider.parse_page', '_Middleware.process_request']
+
+
+def test_samples_and_reports(tmpdir):
+    path = str(tmpdir)
+    profiler, crawler = _make_profiler(path, PROFILER_TRACEMALLOC=False)
+    callbacks = _Callbacks()
+    profiler.track(callbacks, ['parse_page'])
+    callbacks.parse_page(profiler)
+    callbacks.parse_page(profiler)
+    profiler.sample(sys._getframe())
+    assert profiler.components == {'_Callbacks.parse_page': 2, 'other': 1}
+
+    profiler.report()
+    with open(os.path.join(path, 'stacks.folded')) as f:
+        lines = f.read().splitlines()
+    assert lines[0].endswith(f'{__name__}:test_samples_and_reports;{__name__}:_Callbacks.parse_page;'
+                             f'{__name__}:_Callbacks._helper 2')
+    assert lines[1].endswith(f'{__name__}:test_samples_and_reports 1')
+    with open(os.path.join(path, 'profile.json')) as f:
+        profile = json.load(f)
+    assert profile['samples'] == 3
+    assert profile['components']['_Callbacks.parse_page'] == {'samples': 2, 'seconds': 0.01, 'share': 0.6667}
+    assert not os.path.exists(os.path.join(path, 'allocations.txt'))
+    assert crawler.stats.get_value('profiler/samples') == 3
+
+
+def test_allocations(tmpdir):
+    path = str(tmpdir)
+    profiler, _ = _make_profiler(path)
+    callbacks = _Callbacks()
+    profiler.track(callbacks, ['parse_page'])
+    tracemalloc.start(10)
+    try:
+        callbacks.parse_page(profiler)
+        snapshot = tracemalloc.take_snapshot()
+        assert profiler.attribute_allocations(snapshot)['_Callbacks.parse_page'] >= 100 * 1000
+        profiler.report()
+        callbacks.more = [bytearray(1000) for _ in range(100)]
+        profiler.report()
+    finally:
+        tracemalloc.stop()
+    with open(os.path.join(path, 'allocations.txt')) as f:
+        report = f.read()
+    assert 'Top 25 allocation lines' in report
+    assert 'Top 25 growth since the previous report' in report
+    with open(os.path.join(path, 'profile.json')) as f:
+        assert json.load(f)['allocations']['_Callbacks.parse_page'] >= 100 * 1000
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+from scrapy.http import HtmlResponse, Request, Response, TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AutoExtractMiddleware
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.autoextract_spider import AutoExtractRequest  # noqa: E402
+
+URL = 'https://shop.com/chair'
+PAGE = b'<html><body><script>var now = 1;</script><h1>Chair</h1> <p>19.99</p></body></html>'
+
+
+def _make_spider(path, **settings):
+    settings.update({'RECRAWL_DIR': path, 'AUTOEXTRACT_USER': 'user', 'AUTOEXTRACT_SLOT_POLICY': 'scrapy_default'})
+    crawler = get_crawler(ProductAutoExtract, settings_dict=settings)
+    crawler.spider = ProductAutoExtract.from_crawler(crawler)
+    return crawler.spider
+
+
+def _response(request, body=PAGE, status=200, headers=None):
+    cls = HtmlResponse if body else Response
+    return cls(request.url, body=body, status=status, headers=headers, request=request)
+
+
+def _first_crawl(path):
+    spider = _make_spider(path)
+    request = spider.make_extract_request(URL)
+    assert isinstance(request, AutoExtractRequest)
+    middleware = AutoExtractMiddleware.from_crawler(spider.crawler)
+    api_request = middleware.process_request(request, spider)
+    body = json.dumps([{'query': {}, 'product': {'url': URL, 'name': 'Chair', 'probability': 0.9}}]).encode()
+    response = middleware.process_response(api_request, TextResponse(api_request.url, body=body,
+                                                                     request=api_request), spider)
+    assert len(list(spider.parse_item(response))) == 1
+    assert spider.recrawl.store.get(URL)['page_type'] == 'product'
+    # The page is downloaded after the extraction, for discovering links
+    spider.recrawl.record_page(_response(Request(URL), headers={'ETag': '"v1"'}))
+    spider.recrawl.spider_closed(spider)
+
+
+def test_recrawl_unchanged(tmpdir):
+    path = str(tmpdir)
+    _first_crawl(path)
+    spider = _make_spider(path)
+    request = spider.make_extract_request(URL, meta={'source_url': 'https://shop.com/'})
+    assert not isinstance(request, AutoExtractRequest)
+    assert request.headers['If-None-Match'] == b'"v1"'
+    assert 'dont_proxy' not in request.meta
+    # Only the script changed
+    body = PAGE.replace(b'now = 1', b'now = 2')
+    assert not list(spider.parse_recrawl(_response(request, body=body)))
+    assert not list(spider.parse_recrawl(_response(request, body=b'', status=304)))
+    spider.recrawl.spider_closed(spider)
+    assert spider.crawler.stats.get_value('recrawl/unchanged') == 2
+    with open(os.path.join(path, 'unchanged.jl')) as fd:
+        assert [json.loads(line)['url'] for line in fd] == [URL, URL]
+
+
+def test_recrawl_changed(tmpdir):
+    path = str(tmpdir)
+    _first_crawl(path)
+    spider = _make_spider(path)
+    request = spider.make_extract_request(URL, meta={'source_url': 'https://shop.com/'})
+    body = PAGE.replace(b'19.99', b'17.99')
+    requests = list(spider.parse_recrawl(_response(request, body=body)))
+    assert len(requests) == 1
+    assert isinstance(requests[0], AutoExtractRequest)
+    assert requests[0].meta['source_url'] == 'https://shop.com/'
+    assert spider.crawler.stats.get_value('recrawl/changed') == 1
+
+
+def test_recrawl_ttl(tmpdir):
+    path = str(tmpdir)
+    _first_crawl(path)
+    spider = _make_spider(path, RECRAWL_TTL={'product': 0})
+    assert isinstance(spider.make_extract_request(URL), AutoExtractRequest)
+    assert spider.crawler.stats.get_value('recrawl/expired') == 1
+
+
+def test_recrawl_ttl_from_command_line(tmpdir):
+    path = str(tmpdir)
+    spider = _make_spider(path, RECRAWL_TTL='{"product": 60}')
+    assert spider.recrawl.ttl['product'] == 60
+    assert spider.recrawl.ttl['article'] == 30 * 24 * 3600
+    spider = _make_spider(path, RECRAWL_TTL='3600')
+    assert set(spider.recrawl.ttl.values()) == {3600}
@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+import socket
+import threading
+from collections import Counter
+
+import pytest
+from scrapy import Spider
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from twisted.internet import reactor
+from twisted.internet.error import DNSLookupError
+from twisted.names import dns
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.feeder import SeedFeeder  # noqa: E402
+from autoextract_spiders.resolver import AsyncCachingResolver  # noqa: E402
+
+ZONE = {'shop.com': ('10.0.0.1', 300), 'blog.com': ('10.0.0.2', 1), 'slow.com': ('10.0.0.3', 300)}
+# The hosts that exist, without an IPv4 address
+ZONE6 = {'v6.com': ('2001:db8::1', 300), 'empty.com': None}
+CNAMES = {'www.shop.com': 'shop.com', 'www.v6.com': 'v6.com'}
+
+
+class StubDNSServer:
+    """
+    A local DNS server answering the A queries of the ZONE, the AAAA queries of ZONE6,
+    with only the CNAME record of the CNAMES, and NXDOMAIN for the other names.
+    """
+
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.settimeout(0.1)
+        self.port = self.socket.getsockname()[1]
+        self.queries = Counter()
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(512)
+            except socket.timeout:
+                continue
+            query = dns.Message()
+            query.fromStr(data)
+            name = query.queries[0].name.name.decode()
+            self.queries[name] += 1
+            if name == 'slow.com':
+                time.sleep(0.2)
+            exists = name in ZONE or name in ZONE6 or name in CNAMES
+            answer = dns.Message(id=query.id, answer=1, rCode=dns.OK if exists else dns.ENAME)
+            answer.queries = query.queries
+            if name in CNAMES:
+                answer.answers = [dns.RRHeader(name, dns.CNAME, ttl=300, payload=dns.Record_CNAME(CNAMES[name]))]
+            elif query.queries[0].type == dns.A and name in ZONE:
+                ip, ttl = ZONE[name]
+                answer.answers = [dns.RRHeader(name, dns.A, ttl=ttl, payload=dns.Record_A(ip, ttl))]
+            elif query.queries[0].type == dns.AAAA and ZONE6.get(name):
+                ip, ttl = ZONE6[name]
+                answer.answers = [dns.RRHeader(name, dns.AAAA, ttl=ttl, payload=dns.Record_AAAA(ip, ttl))]
+            self.socket.sendto(answer.toStr(), address)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.socket.close()
+
+
+@pytest.fixture
+def server():
+    server = StubDNSServer()
+    yield server
+    server.close()
+
+
+def _make_resolver(server, **settings):
+    settings = Settings(dict({'DNS_SERVERS': [f'127.0.0.1:{server.port}'], 'DNS_TIMEOUT': 2,
+                              'DNS_MIN_TTL': 0, 'DNS_HOSTS_FILE': os.devnull}, **settings))
+    return AsyncCachingResolver(reactor, settings)
+
+
+def _wait(d, timeout=5):
+    """
+    Run the reactor until the deferred fires.
+    """
+    result = []
+    d.addBoth(result.append)
+    end = time.time() + timeout
+    while not result and time.time() < end:
+        reactor.iterate(0.01)
+    assert result, 'Timeout'
+    return result[0]
+
+
+def _wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        reactor.iterate(0.01)
+    assert condition()
+
+
+def test_resolve_and_cache(server):
+    resolver = _make_resolver(server)
+    assert _wait(resolver.getHostByName('shop.com')) == '10.0.0.1'
+    assert _wait(resolver.getHostByName('Shop.com')) == '10.0.0.1'
+    assert server.queries['shop.com'] == 1
+    assert resolver.counts['hits'] == 1
+    # The missing hosts are cached too
+    failure = _wait(resolver.getHostByName('dead.com'))
+    assert failure.check(DNSLookupError)
+    assert _wait(resolver.getHostByName('dead.com')).check(DNSLookupError)
+    assert server.queries['dead.com'] == 1
+    assert resolver.counts['negative_hits'] == 1
+    assert resolver.status('dead.com') is False
+    # The IP addresses are not resolved
+    assert _wait(resolver.getHostByName('127.0.0.1')) == '127.0.0.1'
+
+
+def test_hosts_without_ipv4_address(server):
+    resolver = _make_resolver(server)
+    assert _wait(resolver.getHostByName('www.shop.com')) == '10.0.0.1'
+    assert _wait(resolver.getHostByName('v6.com')) == '2001:db8::1'
+    assert _wait(resolver.getHostByName('www.v6.com')) == '2001:db8::1'
+    assert resolver.counts['ipv6'] == 2
+    # Existing hosts without any address are not dead, they're looked up again
+    assert _wait(resolver.getHostByName('empty.com')).check(DNSLookupError)
+    assert resolver.status('empty.com') is None
+    assert _wait(resolver.getHostByName('empty.com')).check(DNSLookupError)
+    assert server.queries['empty.com'] == 4
+    assert resolver.counts['no_address'] == 2
+    assert resolver.counts['not_found'] == 0
+
+
+def test_ttl_and_cache_size(server):
+    resolver = _make_resolver(server, DNSCACHE_SIZE=2)
+    _wait(resolver.getHostByName('blog.com'))
+    assert resolver.status('blog.com') is True
+    time.sleep(1.1)
+    # Expired after its TTL
+    assert resolver.status('blog.com') is None
+    _wait(resolver.getHostByName('blog.com'))
+    assert server.queries['blog.com'] == 2
+    _wait(resolver.getHostByName('shop.com'))
+    _wait(resolver.getHostByName('slow.com'))
+    assert list(resolver.cache) == ['shop.com', 'slow.com']
+
+
+def test_concurrent_requests_share_a_lookup(server):
+    resolver = _make_resolver(server)
+    results = [resolver.getHostByName('slow.com') for _ in range(5)]
+    assert [_wait(d) for d in results] == ['10.0.0.3'] * 5
+    assert server.queries['slow.com'] == 1
+
+
+def test_prewarm_and_drop_dead_seeds(server):
+    resolver = _make_resolver(server, DNS_PREWARM_CONCURRENCY=2)
+    crawler = get_crawler(Spider, settings_dict={'SEED_FEEDER_MAX_QUEUED': 0})
+    crawled = []
+    crawler.engine = type('Engine', (), {'crawl': lambda self, request, spider: crawled.append(request.url)})()
+    spider = Spider('test')
+    feeder = SeedFeeder(crawler, spider, Request, resolver)
+    feeder.running = True
+    seeds = ['https://slow.com/', 'https://dead.com/', 'https://shop.com/a', 'https://gone.com/', 'https://blog.com/']
+    feeder.add(seeds)
+    # Nothing is crawled before its host is resolved
+    assert crawled == []
+    _wait_for(lambda: len(crawled) == 3)
+    assert crawled == ['https://slow.com/', 'https://shop.com/a', 'https://blog.com/']
+    assert crawler.stats.get_value('seeds/dead_hosts') == 2
+    assert sum(server.queries.values()) == 5
+    # The requests of the seeds don't query the DNS again
+    assert _wait(resolver.getHostByName('shop.com')) == '10.0.0.1'
+    assert sum(server.queries.values()) == 5
+    feeder.spider_closed(spider)
+    assert crawler.stats.get_value('dns/prewarmed') == 5
+    assert crawler.stats.get_value('dns/not_found') == 2
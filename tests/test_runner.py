@@ -0,0 +1,93 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.runner import host_shard, partition_urls, merge_stats, merge_outputs, \
+    shard_settings, global_count_limits, shard_args  # noqa: E402
+
+
+def test_host_shard_is_stable():
+    assert host_shard('https://example.com/a', 8) == host_shard('https://EXAMPLE.com/b?c=d', 8)
+    assert 0 <= host_shard('https://example.com/', 3) < 3
+
+
+def test_partition_urls():
+    urls = [
+        'https://a.example.com/1',
+        'https://b.example.com/1',
+        'https://a.example.com/2',
+        'invalid',
+        'https://c.example.com/',
+    ]
+    parts = partition_urls(urls, 4)
+    assert len(parts) == 4
+    assert sum(len(p) for p in parts) == 4
+    shards_per_host = {}
+    for n, part in enumerate(parts):
+        for url in part:
+            shards_per_host.setdefault(url.split('/')[2], set()).add(n)
+    # every host lives in exactly one shard
+    assert all(len(shards) == 1 for shards in shards_per_host.values())
+
+
+def test_shard_settings():
+    settings = {'JOBDIR': 'job', 'CHECKPOINT_DIR': 'state', 'CONCURRENT_REQUESTS': 8}
+    assert shard_settings(settings, 1) == {
+        'JOBDIR': os.path.join('job', 'shard-1'),
+        'CHECKPOINT_DIR': os.path.join('state', 'shard-1'),
+        'CONCURRENT_REQUESTS': 8,
+    }
+    assert shard_settings({'CONCURRENT_REQUESTS': 8}, 0) == {'CONCURRENT_REQUESTS': 8}
+    # the shared settings are not changed
+    assert settings['JOBDIR'] == 'job'
+
+
+def test_global_count_limits():
+    assert global_count_limits({}, 10) == {'page_count': 1000, 'item_count': 100}
+    assert global_count_limits({'max-pages': '5', 'max_items': '2'}, 10) == {
+        'page_count': 100, 'page_host_count': 5, 'item_count': 40, 'item_host_count': 2}
+    # without seeds, as the spider derives them for the items
+    assert global_count_limits({'max-items': '3'}, 0) == {
+        'page_count': 1000, 'item_count': 6, 'item_host_count': 3}
+    limits = global_count_limits({'count-limits': '{page_count: 30, article_item_count: 9}'}, 10)
+    assert limits == {'page_count': 30, 'article_item_count': 9}
+
+
+def test_shard_args():
+    limits = {'page_count': 100, 'page_host_count': 5, 'article_item_count': 9, 'item_count': 0}
+    args = shard_args({'max-pages': '5', 'count_limits': '{}', 'discovery-only': 'true'}, limits, 0.25)
+    assert args == {
+        'discovery-only': 'true',
+        # the global limits are split, the per-host limits and the disabled limits are kept
+        'count-limits': {'page_count': 25, 'page_host_count': 5, 'article_item_count': 3, 'item_count': 0},
+    }
+
+
+def test_merge_stats():
+    t1 = datetime(2020, 1, 1, 10)
+    t2 = datetime(2020, 1, 1, 11)
+    stats = merge_stats([
+        {'start_time': t2, 'finish_time': t2, 'item_scraped_count': 3, 'finish_reason': 'finished'},
+        {'start_time': t1, 'finish_time': t1, 'item_scraped_count': 4, 'finish_reason': 'finished',
+         'error/failed_page': 1},
+    ])
+    assert stats['start_time'] == t1
+    assert stats['finish_time'] == t2
+    assert stats['item_scraped_count'] == 7
+    assert stats['error/failed_page'] == 1
+    assert stats['finish_reason'] == 'finished'
+    assert stats['shards/count'] == 2
+
+
+def test_merge_outputs(tmpdir):
+    paths = []
+    for n in range(2):
+        path = str(tmpdir.join(f'output-{n}.jl'))
+        with open(path, 'w') as fd:
+            fd.write(f'{{"n": {n}}}\n')
+        paths.append(path)
+    output = str(tmpdir.join('output.jl'))
+    merge_outputs(paths + [str(tmpdir.join('missing.jl'))], output)
+    with open(output) as fd:
+        assert fd.read() == '{"n": 0}\n{"n": 1}\n'
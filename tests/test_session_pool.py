@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.sessions import CrawleraSessionPool, crawlera_session  # noqa: E402
+
+
+class CrawleraStandIn(BaseHTTPRequestHandler):
+    """
+    A local proxy answering like Crawlera: it creates the sessions and bans some of them.
+    """
+    lock = threading.Lock()
+    sessions = {}
+    active = Counter()
+    max_active = Counter()
+    banned = set()
+    ban_on_request = {}
+
+    def do_GET(self):
+        session = self.headers.get('X-Crawlera-Session')
+        with self.lock:
+            if session == 'create':
+                session = f'S{len(self.sessions) + 1}'
+                self.sessions[session] = 0
+            if session not in self.sessions or session in self.banned:
+                return self._reply(400, session, 'bad_session_id')
+            self.sessions[session] += 1
+            if self.ban_on_request.get(session) == self.sessions[session]:
+                self.banned.add(session)
+                return self._reply(503, session, 'banned')
+            self.active[session] += 1
+            self.max_active[session] = max(self.max_active[session], self.active[session])
+        time.sleep(0.05)
+        with self.lock:
+            self.active[session] -= 1
+        self._reply(200, session)
+
+    def _reply(self, status, session, error=None):
+        self.send_response(status)
+        self.send_header('X-Crawlera-Version', '1.0')
+        self.send_header('X-Crawlera-Session', session)
+        if error:
+            self.send_header('X-Crawlera-Error', error)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def proxy():
+    CrawleraStandIn.sessions = {}
+    CrawleraStandIn.active = Counter()
+    CrawleraStandIn.max_active = Counter()
+    CrawleraStandIn.banned = set()
+    CrawleraStandIn.ban_on_request = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CrawleraStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def _make_pool(size):
+    crawler = get_crawler(Spider, settings_dict={'CRAWLERA_ENABLED': True, 'CRAWLERA_SESSION_POOL_SIZE': size})
+    spider = Spider.from_crawler(crawler, name='test')
+    return CrawleraSessionPool(crawler), crawler, spider
+
+
+def _fetch(proxy, request):
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({'http': proxy}))
+    headers = {k.decode(): v[0].decode() for k, v in request.headers.items()}
+    start = time.time()
+    try:
+        with opener.open(urllib.request.Request(request.url, headers=headers)) as r:
+            status, response_headers = r.status, dict(r.headers)
+    except urllib.error.HTTPError as e:
+        status, response_headers = e.code, dict(e.headers)
+    request.meta['download_latency'] = time.time() - start
+    return Response(request.url, status=status, headers=response_headers, request=request)
+
+
+def _crawl(proxy, pool, spider, requests):
+    """
+    Download the requests concurrently, with the middleware calls in one thread, like Scrapy.
+    The requests waiting for a session are downloaded when it's ready.
+    """
+    pending = [(request, pool.process_request(request, spider)) for request in requests]
+    results = []
+    while pending:
+        ready = [r for r, d in pending if not isinstance(d, Deferred) or d.called and not d.paused]
+        pending = [(r, d) for r, d in pending if r not in ready]
+        assert ready
+        with ThreadPoolExecutor(len(ready)) as executor:
+            responses = list(executor.map(lambda r: _fetch(proxy, r), ready))
+        results.extend(pool.process_response(r.request, r, spider) for r in responses)
+    return results
+
+
+def _session_requests(n, session='create'):
+    return [Request(f'http://shop.example/p{i}', headers={'X-Crawlera-Session': session}) for i in range(n)]
+
+
+def test_pool_spreads_the_requests(proxy):
+    pool, crawler, spider = _make_pool(4)
+    # The first requests create the sessions
+    results = _crawl(proxy, pool, spider, _session_requests(4))
+    assert all(r.status == 200 for r in results)
+    assert len(pool.hosts['shop.example'].sessions) == 4
+    # The next ones, chained on one session by follow_session, use the 4 warm sessions in parallel
+    _crawl(proxy, pool, spider, _session_requests(4, 'S1'))
+    _crawl(proxy, pool, spider, _session_requests(8, 'S1'))
+    assert len(CrawleraStandIn.sessions) == 4
+    assert sorted(CrawleraStandIn.sessions.values()) == [4, 4, 4, 4]
+    # Not more than 2 concurrent requests on a session, with 8 concurrent requests
+    assert max(CrawleraStandIn.max_active.values()) == 2
+    sessions = pool.hosts['shop.example'].sessions.values()
+    assert all(s.requests == 4 and s.failures == 0 and s.inflight == 0 and s.latency > 0 for s in sessions)
+    assert crawler.stats.get_value('crawlera_pool/sessions/created') == 4
+    assert crawler.stats.get_value('crawlera_pool/requests') == 16
+
+
+def test_banned_sessions_are_retired(proxy):
+    pool, crawler, spider = _make_pool(2)
+    _crawl(proxy, pool, spider, _session_requests(2))
+    CrawleraStandIn.ban_on_request['S2'] = 2
+    results = _crawl(proxy, pool, spider, _session_requests(2, 'S1'))
+    retries = [r for r in results if isinstance(r, Request)]
+    assert len(retries) == 1
+    assert crawler.stats.get_value('crawlera_pool/sessions/retired') == 1
+    assert list(pool.hosts['shop.example'].sessions) == ['S1']
+    # Retried with a working session, the retired one is never used again
+    results = _crawl(proxy, pool, spider, retries + _session_requests(1, 'S2'))
+    assert [r.status for r in results] == [200, 200]
+    assert crawler.stats.get_value('crawlera_pool/retry/count') == 1
+    assert len(pool.hosts['shop.example'].sessions) == 2
+
+
+def test_first_requests_wait_for_the_sessions(proxy):
+    pool, crawler, spider = _make_pool(2)
+    results = _crawl(proxy, pool, spider, _session_requests(8))
+    assert [r.status for r in results] == [200] * 8
+    # Not a session for each of the first requests
+    assert len(CrawleraStandIn.sessions) == 2
+    assert sum(CrawleraStandIn.sessions.values()) == 8
+    assert crawler.stats.get_value('crawlera_pool/waiting') == 6
+    assert not pool.hosts['shop.example'].waiting
+
+
+def test_retired_session_is_not_added_again(proxy):
+    pool, crawler, spider = _make_pool(2)
+    _crawl(proxy, pool, spider, _session_requests(2))
+    # Both requests in flight on S2 fail
+    CrawleraStandIn.ban_on_request['S2'] = 2
+    results = _crawl(proxy, pool, spider, _session_requests(4, 'S1'))
+    assert len([r for r in results if isinstance(r, Request)]) == 2
+    assert list(pool.hosts['shop.example'].sessions) == ['S1']
+    assert crawler.stats.get_value('crawlera_pool/sessions/retired') == 1
+
+
+def test_pool_disabled(proxy):
+    pool, _, spider = _make_pool(0)
+    requests = [crawlera_session.init_request(Request('http://shop.example/'))]
+    _crawl(proxy, pool, spider, requests)
+    # One session for each seed, as before
+    _crawl(proxy, pool, spider, _session_requests(4, 'S1'))
+    assert CrawleraStandIn.sessions == {'S1': 5}
+    assert not pool.hosts
@@ -0,0 +1,118 @@
+import os
+import sys
+import pytest
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.autoextract_spider import AutoExtractRequest  # noqa: E402
+from autoextract_spiders.squeues import CompactFifoDiskQueue, CompactFifoMemoryQueue, \
+    encode_request, decode_request  # noqa: E402
+from autoextract_spiders.middlewares import use_compact_memory_queue  # noqa: E402
+
+
+def _make_crawler(**settings):
+    crawler = get_crawler(ProductAutoExtract, settings_dict=settings)
+    crawler.spider = ProductAutoExtract.from_crawler(crawler)
+    return crawler
+
+
+def _make_requests(spider):
+    ae_req = spider.make_extract_request('https://example.com/item/1', meta={'source_url': 'https://example.com/'})
+    page_req = Request('https://example.com/page', meta={'depth': 1}, callback=spider.parse_page,
+                       errback=spider.errback_page, priority=-1)
+    return [ae_req, page_req]
+
+
+def _assert_same(request, expected):
+    assert type(request) is type(expected)
+    assert request.url == expected.url
+    assert request.meta == expected.meta
+    assert request.callback == expected.callback
+    assert request.errback == expected.errback
+    assert request.priority == expected.priority
+    assert request.dont_filter == expected.dont_filter
+
+
+def test_encode_decode_request():
+    spider = _make_crawler().spider
+    for expected in _make_requests(spider):
+        data = encode_request(expected, spider)
+        request = decode_request(data, spider)
+        _assert_same(request, expected)
+    # The constant AutoExtract meta is not stored
+    ae_req = _make_requests(spider)[0]
+    assert b'autoextract-spiders' not in encode_request(ae_req, spider)
+    assert isinstance(ae_req, AutoExtractRequest)
+
+
+def test_decoded_meta_is_shared_and_read_only():
+    spider = _make_crawler().spider
+    data = encode_request(_make_requests(spider)[0], spider)
+    req1 = decode_request(data, spider)
+    req2 = decode_request(data, spider)
+    assert req1.meta['autoextract'] is req2.meta['autoextract']
+    with pytest.raises(TypeError):
+        req1.meta['autoextract']['original_url'] = 'x'
+
+
+def test_memory_queue():
+    crawler = _make_crawler()
+    q = CompactFifoMemoryQueue.from_crawler(crawler, '')
+    requests = _make_requests(crawler.spider)
+    # Requests with callbacks that are not spider methods are kept as they are
+    requests.append(Request('https://example.com/other', callback=lambda r: None))
+    for request in requests:
+        q.push(request)
+    assert len(q) == 3
+    for expected in requests[:2]:
+        _assert_same(q.pop(), expected)
+    assert q.pop() is requests[2]
+    assert q.pop() is None
+
+
+def test_use_compact_memory_queue():
+    settings = Settings({'SCHEDULER_MEMORY_QUEUE': 'scrapy.squeues.FifoMemoryQueue'})
+    use_compact_memory_queue(settings)
+    assert settings['SCHEDULER_MEMORY_QUEUE'] == 'scrapy.squeues.FifoMemoryQueue'
+    settings.set('COMPACT_MEMORY_QUEUE', True, priority='cmdline')
+    use_compact_memory_queue(settings)
+    assert settings['SCHEDULER_MEMORY_QUEUE'] == 'autoextract_spiders.squeues.CompactFifoMemoryQueue'
+
+
+def test_queue_fifo(tmpdir):
+    crawler = _make_crawler()
+    path = str(tmpdir.join('queue'))
+    q = CompactFifoDiskQueue.from_crawler(crawler, path)
+    requests = _make_requests(crawler.spider) * 3
+    for request in requests:
+        q.push(request)
+    assert len(q) == 6
+    for expected in requests:
+        _assert_same(q.pop(), expected)
+    assert q.pop() is None
+    assert len(q) == 0
+    q.close()
+
+
+def test_queue_compression_persists(tmpdir):
+    crawler = _make_crawler(COMPACT_QUEUE_COMPRESSION=True, COMPACT_QUEUE_BLOCK_SIZE=4)
+    path = str(tmpdir.join('queue'))
+    q = CompactFifoDiskQueue.from_crawler(crawler, path)
+    requests = _make_requests(crawler.spider) * 5
+    for request in requests:
+        q.push(request)
+    assert len(q) == 10
+    _assert_same(q.pop(), requests[0])
+    q.close()
+
+    q = CompactFifoDiskQueue.from_crawler(crawler, path)
+    assert len(q) == 9
+    urls = []
+    while len(q):
+        urls.append(q.pop().url)
+    assert sorted(urls) == sorted(r.url for r in requests[1:])
+    q.close()
+    assert not os.path.exists(path)
@@ -0,0 +1,89 @@
+import os
+import sys
+import pytest
+from scrapy.exceptions import StopDownload
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from scrapy_autoextract.middlewares import AUTOEXTRACT_META_KEY
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.spiders import ArticleAutoExtract, ProductAutoExtract  # noqa: E402
+
+HEAD = (b'<html><head><title>Blog</title>'
+        b'<link rel="alternate" type="application/rss+xml" href="/feed.xml">'
+        b'<script>var data = "</head>";</script></head>')
+BODY = b'<body>' + b'<a href="/post">Post</a>' * 100 + b'</body></html>'
+
+
+def _make_spider(spider_cls=ProductAutoExtract, **settings):
+    settings.setdefault('DISCOVERY_STREAMING_ENABLED', True)
+    crawler = get_crawler(spider_cls, settings_dict=settings)
+    crawler.spider = spider = spider_cls.from_crawler(crawler)
+    return spider, crawler
+
+
+def _download(stream, request, chunks, body_length=None):
+    """
+    Send the chunks like the download handler; returns the bytes received before the stop.
+    """
+    stream.headers_received({}, body_length, request, None)
+    received = b''
+    for chunk in chunks:
+        received += chunk
+        try:
+            stream.bytes_received(chunk, request, None)
+        except StopDownload as stop:
+            assert not stop.fail
+            break
+    return received
+
+
+def test_max_bytes():
+    spider, crawler = _make_spider(DISCOVERY_MAX_BYTES=1000)
+    request = Request('https://shop.com/', callback=spider.parse_page)
+    received = _download(spider.discovery_stream, request, [BODY[i:i + 300] for i in range(0, len(BODY), 300)],
+                         body_length=len(BODY))
+    assert len(received) == 1200
+    assert crawler.stats.get_value('discovery_stream/truncated/max_bytes') == 1
+    assert crawler.stats.get_value('discovery_stream/bytes_skipped') == len(BODY) - 1200
+
+
+def test_full_downloads():
+    spider, crawler = _make_spider(DISCOVERY_MAX_BYTES=100)
+    chunks = [BODY[:500], BODY[500:]]
+    for request in [Request('https://shop.com/', meta={AUTOEXTRACT_META_KEY: {}}, callback=spider.parse_page),
+                    Request('https://shop.com/', meta={'check_structured_data': True}, callback=spider.parse_page),
+                    Request('https://shop.com/', meta={'recrawl_check': True}, callback=spider.parse_page),
+                    Request('https://shop.com/feed', callback=spider.parse_item)]:
+        assert _download(spider.discovery_stream, request, chunks) == BODY
+    assert not crawler.stats.get_value('discovery_stream/truncated')
+
+
+def test_head_only():
+    spider, crawler = _make_spider(ArticleAutoExtract, DISCOVERY_HEAD_ONLY=True)
+    page = HEAD + BODY
+    request = Request('https://blog.com/', callback=spider.parse_source)
+    received = _download(spider.discovery_stream, request, [page[i:i + 50] for i in range(0, len(page), 50)])
+    assert HEAD in received
+    assert len(received) < len(HEAD) + 50
+    assert crawler.stats.get_value('discovery_stream/truncated/head_only') == 1
+    # The head has no links to follow, only the feeds
+    request.meta['source_url'] = 'https://blog.com/'
+    response = HtmlResponse(request.url, body=received, request=request, flags=['download_stopped'])
+    assert [r.url for r in spider.parse_source(response)] == ['https://blog.com/feed.xml']
+    assert crawler.stats.get_value('discovery_stream/links_skipped') == 1
+
+    # Without feeds in the head, the page is needed for the feed links in the body
+    page = b'<html><head><title>Blog</title></head>' + BODY
+    request = Request('https://blog.com/', callback=spider.parse_source)
+    assert _download(spider.discovery_stream, request, [page[:40], page[40:]]) == page
+    # Only the source pages are cut after the head
+    request = Request('https://blog.com/page', callback=spider.parse_page)
+    assert _download(spider.discovery_stream, request, [HEAD, BODY]) == HEAD + BODY
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_watched_callbacks(enabled):
+    spider, crawler = _make_spider(ArticleAutoExtract, DISCOVERY_STREAMING_ENABLED=enabled, DISCOVERY_MAX_BYTES=10)
+    assert spider.discovery_stream.enabled == enabled
+    assert spider.discovery_stream.callbacks == {'parse_page': False, 'parse_source': False}
@@ -0,0 +1,117 @@
+import os
+import sys
+from scrapy.http import HtmlResponse, Request
+from scrapy.link import Link
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(1, os.getcwd())
+from autoextract_spiders.structured_data import StructuredData  # noqa: E402
+from autoextract_spiders.spiders import ProductAutoExtract  # noqa: E402
+from autoextract_spiders.spiders.util import FingerprintPrefix  # noqa: E402
+
+PRODUCT_JSON_LD = b'''<html><head>
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@graph": [
+  {"@type": "WebSite", "name": "Shop"},
+  {"@type": "Product", "name": "Blue chair", "sku": "C-1", "brand": {"@type": "Brand", "name": "Chairs"},
+   "image": ["https://shop.com/chair.jpg"],
+   "offers": {"@type": "Offer", "price": "19.99", "priceCurrency": "EUR",
+              "availability": "https://schema.org/InStock"},
+   "aggregateRating": {"ratingValue": "4.5", "reviewCount": 10}}
+]}
+</script></head><body></body></html>'''
+
+ARTICLE_MICRODATA = b'''<html><body>
+<article itemscope itemtype="http://schema.org/NewsArticle">
+  <h1 itemprop="headline">Big news</h1>
+  <span itemprop="author" itemscope itemtype="http://schema.org/Person"><span itemprop="name">Jane</span></span>
+  <time itemprop="datePublished" datetime="2020-01-02">2 Jan</time>
+  <div itemprop="articleBody"><p>First.</p> <p>Second.</p></div>
+</article></body></html>'''
+
+LISTING_JSON_LD = b'''<html><head>
+<script type="application/ld+json">{"@type": "ItemList", "itemListElement": []}</script>
+<script type="application/ld+json">{invalid</script>
+</head></html>'''
+
+
+def _response(body, url='https://shop.com/item', meta=None):
+    return HtmlResponse(url, body=body, request=Request(url, meta=meta or {}))
+
+
+def test_json_ld_product():
+    data = StructuredData.from_response(_response(PRODUCT_JSON_LD))
+    assert data.page_types == {'product'}
+    assert not data.is_listing()
+    item = data.get_item('product')
+    assert item['name'] == 'Blue chair'
+    assert item['brand'] == 'Chairs'
+    assert item['offers'] == [{'price': '19.99', 'currency': 'EUR', 'availability': 'InStock'}]
+    assert item['aggregateRating'] == {'ratingValue': 4.5, 'reviewCount': 10.0}
+    assert data.get_item('article') is None
+
+
+def test_microdata_article():
+    data = StructuredData.from_response(_response(ARTICLE_MICRODATA))
+    assert data.page_types == {'article'}
+    item = data.get_item('article')
+    assert item['headline'] == 'Big news'
+    assert item['author'] == 'Jane'
+    assert item['datePublished'] == '2020-01-02'
+    assert item['articleBody'] == 'First. Second.'
+
+
+def test_listing():
+    data = StructuredData.from_response(_response(LISTING_JSON_LD))
+    assert data.is_listing()
+    assert not data.page_types
+
+
+def _make_spider(**settings):
+    settings['STRUCTURED_DATA_ENABLED'] = True
+    crawler = get_crawler(ProductAutoExtract, settings_dict=settings)
+    crawler.spider = ProductAutoExtract.from_crawler(crawler)
+    return crawler.spider
+
+
+def test_spider_structured_data():
+    spider = _make_spider(STRUCTURED_DATA_ITEMS=True)
+    meta = {'source_url': 'https://shop.com/', 'check_structured_data': True}
+    items = list(spider._parse_structured_data(_response(PRODUCT_JSON_LD, meta=meta)))
+    assert len(items) == 1
+    assert items[0]['name'] == 'Blue chair'
+    assert items[0]['url'] == 'https://shop.com/item'
+    assert items[0]['source_url'] == 'https://shop.com/'
+    # Listing pages are not sent to AutoExtract
+    assert not list(spider._parse_structured_data(_response(LISTING_JSON_LD, meta=meta)))
+    # Nor are the articles, in a product crawl
+    assert not list(spider._parse_structured_data(_response(ARTICLE_MICRODATA, meta=meta)))
+    # Pages without markup are sent to AutoExtract
+    requests = list(spider._parse_structured_data(_response(b'<html></html>', meta=meta)))
+    assert len(requests) == 1
+    assert requests[0].meta['html_fetched']
+    assert requests[0].meta['autoextract']['pageType'] == 'product'
+    stats = spider.crawler.stats
+    assert stats.get_value('structured_data/pages') == 4
+    assert stats.get_value('structured_data/other_item') == 1
+    assert stats.get_value('structured_data/local_share') == 0.75
+
+
+def test_spider_structured_data_without_items():
+    spider = _make_spider()
+    meta = {'source_url': 'https://shop.com/', 'check_structured_data': True}
+    requests = list(spider._parse_structured_data(_response(PRODUCT_JSON_LD, meta=meta)))
+    assert len(requests) == 1
+    assert requests[0].meta['autoextract']
+
+
+def test_links_are_fetched_as_pages():
+    spider = _make_spider()
+    response = _response(b'', url='https://shop.com/', meta={'source_url': 'https://shop.com/'})
+    request = spider._make_link_request(Link('https://shop.com/products/item'), 0, response)
+    assert type(request) is Request
+    assert request.meta['check_structured_data']
+    assert request.meta['fingerprint_prefix'] == FingerprintPrefix.SCRAPY.value
+    # Downloaded through Crawlera, like the other pages
+    for key in ('dont_proxy', 'no_crawlera_session', 'cf_store', 'autoextract'):
+        assert key not in request.meta